@@ -0,0 +1,211 @@
+"""On-device benchmarks for the transcription paths
+
+Run with: python -m telly_spelly.benchmark --model tiny [AUDIO_FILE ...]
+     or: python -m telly_spelly.benchmark --models
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_clip(seconds, seed=0):
+    """
+    Generate a speech-like 16 kHz test clip (voiced harmonics with syllable-rate envelope).
+
+    Used when no recorded fixtures are given, so runs are reproducible on any machine.
+    Whisper does not hear speech in it, so it decodes few tokens or hallucinates:
+    timings on real recordings are preferred (see load_clips()).
+    """
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 120 + 30 * np.sin(2 * np.pi * 0.5 * t + rng.rand() * 6)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t + rng.rand() * 6), 0, None)
+    clip = 0.1 * voiced * envelope + 0.005 * rng.randn(len(t))
+    return clip.astype(np.float32)
+
+
+def fit_clip(audio, seconds):
+    """A recording cut, or repeated, to exactly seconds"""
+    return np.resize(np.asarray(audio, dtype=np.float32), int(seconds * SAMPLE_RATE))
+
+
+def load_clips(audio_files=None, count=8, seconds=5.0, recordings=None):
+    """
+    Load fixture clips from files; else take up to count recent recordings (16 kHz
+    waveforms, such as EncoderCache.recordings()) fitted to seconds each; else generate
+    count synthetic clips
+    """
+    if audio_files:
+        import whisper
+        return [whisper.load_audio(path) for path in audio_files]
+    recordings = [audio for audio in recordings or [] if len(audio)]
+    if recordings:
+        return [fit_clip(recordings[index % len(recordings)], seconds)
+                for index in range(count)]
+    logger.warning("No recordings to benchmark on, using synthetic audio: "
+                   "timings differ from speech")
+    return [synthetic_clip(seconds, seed) for seed in range(count)]
+
+
+def benchmark_batch_sizes(model, clips, batch_sizes=(1, 2, 4, 8), max_tokens_per_second=8):
+    """
+    Measure transcription throughput of batched encoding/decoding over batch sizes.
+
+    A sequential baseline (one transcribe() call per clip, as before batching) is
+    measured first. Token output is capped per second of audio so that runs with
+    different batch sizes do comparable decoder work.
+
+    Returns:
+        List of dicts with 'mode', 'batch_size', 'seconds', 'clips_per_second' and
+        'realtime_factor' (processing time / audio time)
+    """
+    from .decoding import transcribe_batch, transcribe_options
+    from .settings import Settings
+
+    audio_seconds = sum(len(clip) for clip in clips) / SAMPLE_RATE
+    results = []
+
+    def record(mode, batch_size, elapsed):
+        results.append({
+            'mode': mode,
+            'batch_size': batch_size,
+            'seconds': elapsed,
+            'clips_per_second': len(clips) / elapsed,
+            'realtime_factor': elapsed / audio_seconds,
+        })
+
+    profile = dict(Settings.DECODING_PROFILES['fast'], max_tokens_per_second=max_tokens_per_second)
+    start = time.perf_counter()
+    for clip in clips:
+        options = transcribe_options(model, profile, len(clip) / SAMPLE_RATE)
+        model.transcribe(clip, fp16=False, language='en', **options)
+    record('sequential', 1, time.perf_counter() - start)
+
+    for batch_size in batch_sizes:
+        # Warm up allocator and kernels for this batch shape
+        transcribe_batch(model, clips[:batch_size], 'en', max_tokens_per_second, batch_size)
+        start = time.perf_counter()
+        transcribe_batch(model, clips, 'en', max_tokens_per_second, batch_size)
+        record('batched', batch_size, time.perf_counter() - start)
+
+    return results
+
+
+def benchmark_model(model_name, device='cpu', backend='torch', clip_seconds=10.0,
+                    options=None, recordings=None, model_manager=None):
+    """
+    Measure real-time factor and peak memory of one model on this machine.
+
+    The model is warmed up on a short clip and then timed transcribing a clip of
+    clip_seconds, made from recordings when given (see load_clips()), with the given
+    transcribe_audio() options. With a model_manager the model is taken from it (loading
+    within its memory budget) and unloaded afterwards unless it was already resident;
+    without one it is loaded fresh and dropped.
+
+    Returns:
+        dict with 'model', 'device', 'backend', 'clip_seconds', 'latency' (seconds),
+        'realtime_factor', 'peak_bytes' (memory added by the model), 'load_seconds'
+        (0 when it was resident) and 'audio' ('recordings' or 'synthetic')
+    """
+    from .model_manager import (PeakMemoryMonitor, free_device_memory, load_model,
+                                model_size_bytes)
+    from .transcriber import transcribe_audio
+
+    options = options or {}
+    warmup, clip = load_clips(count=2, seconds=clip_seconds, recordings=recordings)
+    warmup = warmup[:2 * SAMPLE_RATE]
+    resident = None
+    if model_manager is not None:
+        resident = model_manager.get_resident(model_name, backend, device)
+    with PeakMemoryMonitor(device) as monitor:
+        start = time.perf_counter()
+        if resident is not None:
+            model = resident
+        elif model_manager is not None:
+            model = model_manager.get(model_name, backend, device)
+        else:
+            model = load_model(model_name, backend, device)
+        load_seconds = 0.0 if resident is not None else time.perf_counter() - start
+        transcribe_audio(model, warmup, 'en', **options)
+        start = time.perf_counter()
+        transcribe_audio(model, clip, 'en', **options)
+        latency = time.perf_counter() - start
+    peak_bytes = max(0, monitor.peak - monitor.baseline)
+    if resident is not None:
+        peak_bytes += model_size_bytes(model)
+    if model_manager is not None and resident is None:
+        model_manager.unload(model_name, backend, device, reason="benchmark done")
+    del model, resident
+    free_device_memory()
+
+    return {
+        'model': model_name,
+        'device': device,
+        'backend': backend,
+        'clip_seconds': clip_seconds,
+        'latency': latency,
+        'realtime_factor': latency / clip_seconds,
+        'peak_bytes': peak_bytes,
+        'load_seconds': load_seconds,
+        'audio': 'recordings' if recordings else 'synthetic',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telly Spelly inference benchmarks")
+    parser.add_argument('--model', default='tiny', help="Whisper model name")
+    parser.add_argument('--batch-sizes', default='1,2,4,8',
+                        help="Comma-separated batch sizes to measure")
+    parser.add_argument('--clips', type=int, default=8,
+                        help="Number of synthetic clips when no files are given")
+    parser.add_argument('--seconds', type=float, default=5.0,
+                        help="Length of synthetic clips")
+    parser.add_argument('--models', action='store_true',
+                        help="Benchmark real-time factor and memory of every cached model")
+    parser.add_argument('audio_files', nargs='*',
+                        help="Fixture audio files, preferably speech (also used by --models)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.models:
+        from .gpu import benchmark_cached_models
+        from .model_manager import select_device
+        from .settings import Settings
+
+        settings = Settings()
+        device = select_device(settings.get_force_cpu())
+        import whisper
+        recordings = [whisper.load_audio(path) for path in args.audio_files]
+        results = benchmark_cached_models(device, settings.get_latency_target()[1],
+                                          recordings=recordings)
+        settings.set_model_benchmarks(device, results)
+        print(f"{'model':<10}{'latency':>9}{'RTF':>8}{'memory':>9}")
+        for row in results.values():
+            print(f"{row['model']:<10}{row['latency']:>8.2f}s{row['realtime_factor']:>8.3f}"
+                  f"{row['peak_bytes'] / 1024 ** 3:>8.2f}G")
+        return
+
+    import whisper
+
+    model = whisper.load_model(args.model, device='cpu')
+    clips = load_clips(args.audio_files, args.clips, args.seconds)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+
+    print(f"{args.model} on CPU, {len(clips)} clips")
+    print(f"{'mode':<12}{'batch':>6}{'seconds':>10}{'clips/s':>10}{'RTF':>8}")
+    for row in benchmark_batch_sizes(model, clips, batch_sizes):
+        print(f"{row['mode']:<12}{row['batch_size']:>6}{row['seconds']:>10.2f}"
+              f"{row['clips_per_second']:>10.2f}{row['realtime_factor']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""CPU thread-pool configuration, core affinity and autotuning for inference
+
+Run with: python -m telly_spelly.cpu_tuning --model tiny [AUDIO_FILE ...]
+"""
+
+import argparse
+import glob
+import hashlib
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Intel hybrid CPUs list their performance cores here
+PERFORMANCE_CORES_FILE = "/sys/devices/cpu_core/cpus"
+
+_interop_applied = False
+
+
+def parse_cpu_list(text):
+    """Parse a kernel CPU list such as '0-7,16' into a sorted list of CPU ids"""
+    cpus = set()
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """Format CPU ids as a compact kernel CPU list"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def set_process_affinity(cpus):
+    """
+    Restrict every thread of the process to cpus.
+
+    sched_setaffinity() applies to a single thread, and threads only inherit the affinity
+    of the thread that creates them; torch's intra-op pool is started once, so its
+    threads are set here directly, along with all others.
+    """
+    try:
+        threads = [int(tid) for tid in os.listdir('/proc/self/task')]
+    except OSError:
+        threads = [0]
+    for tid in threads:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except OSError:
+            # The thread ended in the meantime
+            pass
+
+
+def performance_cores():
+    """P-core CPU ids on hybrid CPUs, or None on homogeneous ones"""
+    try:
+        with open(PERFORMANCE_CORES_FILE) as f:
+            return parse_cpu_list(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def physical_core_count(cpus=None):
+    """Number of physical cores among cpus, all CPUs by default (SMT siblings counted once)"""
+    if cpus is None:
+        paths = glob.glob("/sys/devices/system/cpu/cpu[0-9]*/topology/thread_siblings_list")
+    else:
+        paths = [f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list"
+                 for cpu in cpus]
+    siblings = set()
+    for path in paths:
+        try:
+            with open(path) as f:
+                siblings.add(f.read().strip())
+        except OSError:
+            pass
+    return len(siblings) or (len(cpus) if cpus else os.cpu_count()) or 1
+
+
+def hardware_fingerprint():
+    """Short stable id of the CPU model and topology, used to key tuned settings"""
+    model = "unknown"
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    p_cores = performance_cores()
+    description = (f"{model}|{os.cpu_count()}|{physical_core_count()}|"
+                   f"{format_cpu_list(p_cores) if p_cores else ''}")
+    return hashlib.sha1(description.encode()).hexdigest()[:12]
+
+
+def default_config():
+    """
+    Untuned default: one thread per physical (performance) core, leaving one core
+    for the Qt main thread and the audio callback.
+    """
+    p_cores = performance_cores()
+    # P-cores are listed with their SMT siblings, if SMT is enabled
+    cores = physical_core_count(p_cores) if p_cores else physical_core_count()
+    return {
+        'intra_op_threads': max(1, cores - 1),
+        'inter_op_threads': 1,
+        'affinity': format_cpu_list(p_cores) if p_cores else "",
+    }
+
+
+def resolve_thread_config(settings):
+    """
+    Thread configuration to use: manual settings override the tuned setting stored for
+    this hardware, which overrides the default.
+    """
+    config = settings.get_thread_config(hardware_fingerprint()) or default_config()
+    manual = settings.get_manual_thread_config()
+    config.update({key: value for key, value in manual.items() if value})
+    return config
+
+
+def apply_thread_config(config):
+    """
+    Apply a PyTorch thread configuration from the calling (inference) thread.
+
+    The intra-op pool size is process wide. The affinity is applied to every thread of
+    the process, the already running intra-op pool included (see set_process_affinity()).
+    The inter-op pool can only be sized once per process, before it is first used.
+    ONNX Runtime sizes its threads per session when a model is loaded, so none of this
+    applies to ONNX models.
+    """
+    import torch
+
+    global _interop_applied
+
+    intra = config.get('intra_op_threads') or 0
+    if intra and torch.get_num_threads() != intra:
+        torch.set_num_threads(intra)
+
+    inter = config.get('inter_op_threads') or 0
+    if inter and not _interop_applied:
+        try:
+            torch.set_num_interop_threads(inter)
+        except RuntimeError:
+            logger.debug("Inter-op thread pool already started, keeping its size")
+        _interop_applied = True
+
+    affinity = config.get('affinity')
+    if affinity and hasattr(os, 'sched_setaffinity'):
+        cpus = [cpu for cpu in parse_cpu_list(affinity) if cpu in available_cpus()]
+        if cpus:
+            set_process_affinity(cpus)
+
+
+def candidate_configs():
+    """Thread configurations tried by the autotuner"""
+    logical = len(available_cpus())
+    physical = physical_core_count()
+    p_cores = performance_cores()
+
+    counts = {1, 2, 4, max(1, physical - 1), physical, logical}
+    configs = [{'intra_op_threads': n, 'inter_op_threads': 1, 'affinity': ""}
+               for n in sorted(counts) if n <= logical]
+    if p_cores:
+        p_list = format_cpu_list(p_cores)
+        for n in sorted({physical_core_count(p_cores), len(p_cores)}):
+            configs.append({'intra_op_threads': n, 'inter_op_threads': 1, 'affinity': p_list})
+    return configs
+
+
+def autotune(model, clips, configs=None, language='en'):
+    """
+    Benchmark the loaded model under each thread configuration and pick the fastest.
+
+    Each configuration transcribes all clips once (after one untimed warm-up clip)
+    with the fast profile so that decoder work is comparable. Clips should be speech
+    (see benchmark.load_clips()): synthetic audio decodes too few tokens to weigh the
+    decoder. The process's affinity and thread count are restored afterwards.
+
+    Only PyTorch models can be tuned: ONNX Runtime does not use these threads.
+
+    Returns:
+        (best_config, results) where results lists dicts with the config and 'seconds'
+    """
+    import torch
+    import whisper
+    from .transcriber import transcribe_audio
+
+    if not isinstance(model, whisper.model.Whisper):
+        raise ValueError("Thread tuning applies to PyTorch models only")
+
+    configs = configs or candidate_configs()
+    original_threads = torch.get_num_threads()
+    original_affinity = available_cpus()
+    results = []
+    try:
+        for config in configs:
+            if hasattr(os, 'sched_setaffinity'):
+                set_process_affinity(original_affinity)
+            apply_thread_config(config)
+            transcribe_audio(model, clips[0], language, profile='fast')
+            start_time = time.perf_counter()
+            for clip in clips:
+                transcribe_audio(model, clip, language, profile='fast')
+            elapsed = time.perf_counter() - start_time
+            results.append({**config, 'seconds': elapsed})
+            logger.info(f"Thread config {config}: {elapsed:.2f}s")
+    finally:
+        torch.set_num_threads(original_threads)
+        if hasattr(os, 'sched_setaffinity'):
+            set_process_affinity(original_affinity)
+
+    best = min(results, key=lambda row: row['seconds'])
+    best_config = {key: best[key] for key in ('intra_op_threads', 'inter_op_threads', 'affinity')}
+    return best_config, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune inference threads for this CPU")
+    parser.add_argument('--model', default='tiny', help="Whisper model name")
+    parser.add_argument('--save', action='store_true',
+                        help="Store the fastest setting for this hardware in the settings")
+    parser.add_argument('audio_files', nargs='*', help="Fixture audio files")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    import whisper
+    from .benchmark import load_clips
+
+    model = whisper.load_model(args.model, device='cpu')
+    if not args.audio_files:
+        print("No audio files given: tuning on synthetic audio, pass speech recordings "
+              "for representative timings")
+    clips = load_clips(args.audio_files, count=3, seconds=5.0)
+    best, results = autotune(model, clips)
+
+    print(f"Hardware {hardware_fingerprint()}, {args.model} on CPU")
+    print(f"{'threads':>8}{'inter':>7}  {'affinity':<16}{'seconds':>9}")
+    for row in results:
+        print(f"{row['intra_op_threads']:>8}{row['inter_op_threads']:>7}  "
+              f"{row['affinity'] or 'all':<16}{row['seconds']:>9.2f}")
+    print(f"Fastest: {best}")
+
+    if args.save:
+        from .settings import Settings
+        Settings().set_thread_config(hardware_fingerprint(), best)
+
+
+if __name__ == "__main__":
+    main()
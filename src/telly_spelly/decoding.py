@@ -0,0 +1,354 @@
+"""Low-level Whisper encoder/decoder helpers used by the transcription fast paths"""
+
+import logging
+import math
+from dataclasses import replace
+
+import torch
+import torch.nn.functional as F
+from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE, log_mel_spectrogram, pad_or_trim
+from whisper.decoding import DecodingOptions, DecodingTask
+from whisper.tokenizer import get_tokenizer
+
+from .vocabulary import PromptPrefixInference, prompt_tokens
+
+logger = logging.getLogger(__name__)
+
+# Encoder positions per second of audio (conv2 has stride 2 over 10 ms mel frames)
+AUDIO_CTX_PER_SECOND = SAMPLE_RATE // (HOP_LENGTH * 2)
+
+# Same defaults as whisper.transcribe()
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+# Runaway-output guard for the short-utterance path when the profile sets no cap
+SHORT_MAX_TOKENS_PER_SECOND = 15
+
+
+def audio_ctx_for_duration(model, duration, margin_seconds=1.0, multiple=32):
+    """
+    Get the number of encoder positions needed to cover a clip, like whisper.cpp's audio_ctx.
+
+    A small margin of silence is kept after the speech and the result is rounded up so
+    that clips of similar length share the same encoder shape.
+    """
+    n_ctx = math.ceil((duration + margin_seconds) * AUDIO_CTX_PER_SECOND)
+    n_ctx = multiple * math.ceil(n_ctx / multiple)
+    return min(n_ctx, model.dims.n_audio_ctx)
+
+
+def compute_mel(model, audio, n_audio_ctx=None, mel=None):
+    """
+    Compute the (n_mels, frames) log-mel input for the first window of a clip.
+
+    With n_audio_ctx the window is cut to 2 * n_audio_ctx frames instead of the full 30 s.
+    A mel of the whole clip computed beforehand (padding=N_SAMPLES) is cut instead.
+    """
+    if mel is None:
+        mel = log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
+    content_frames = mel.shape[-1] - N_FRAMES
+    mel = pad_or_trim(mel[:, :min(content_frames, N_FRAMES)], N_FRAMES)
+    if n_audio_ctx is not None:
+        mel = mel[:, :2 * n_audio_ctx]
+    return mel
+
+
+@torch.no_grad()
+def encode(model, mel, n_audio_ctx=None):
+    """
+    Run the audio encoder, optionally on a truncated context.
+
+    Whisper's AudioEncoder asserts the full 1500-position shape; here the positional
+    embedding is sliced instead so shorter mel inputs can be encoded.
+
+    Args:
+        model: whisper.model.Whisper instance
+        mel: tensor of shape (n_mels, frames) or (batch, n_mels, frames)
+        n_audio_ctx: number of encoder positions to keep, or None for the full context
+
+    Returns:
+        Audio features of shape (batch, n_ctx, n_audio_state)
+    """
+    encoder = model.encoder
+    if mel.ndim == 2:
+        mel = mel.unsqueeze(0)
+    if n_audio_ctx is not None:
+        mel = mel[..., :2 * n_audio_ctx]
+    mel = mel.to(device=model.device, dtype=encoder.conv1.weight.dtype)
+
+    x = F.gelu(encoder.conv1(mel))
+    x = F.gelu(encoder.conv2(x))
+    x = x.permute(0, 2, 1)
+    x = (x + encoder.positional_embedding[:x.shape[1]]).to(x.dtype)
+    for block in encoder.blocks:
+        x = block(x)
+    return encoder.ln_post(x)
+
+
+@torch.no_grad()
+def detect_language(model, audio_features, tokenizer, candidates=None):
+    """
+    Detect the language from already-encoded features of any context length.
+
+    Args:
+        candidates: optional iterable of language codes to restrict the detection to
+
+    Returns:
+        List of {language code: probability} dicts, one per batch item
+    """
+    n_audio = audio_features.shape[0]
+    x = torch.tensor([[tokenizer.sot]] * n_audio).to(audio_features.device)
+    logits = model.logits(x, audio_features)[:, 0]
+
+    codes = tokenizer.all_language_codes
+    language_tokens = tokenizer.all_language_tokens
+    if candidates is not None:
+        candidates = set(candidates)
+        keep = [i for i, code in enumerate(codes) if code in candidates]
+        codes = [codes[i] for i in keep]
+        language_tokens = [language_tokens[i] for i in keep]
+
+    probs = logits[:, list(language_tokens)].float().softmax(dim=-1).cpu()
+    return [dict(zip(codes, row.tolist())) for row in probs]
+
+
+class FeatureDecodingTask(DecodingTask):
+    """
+    DecodingTask that accepts encoder outputs of any context length.
+
+    With a prompt, the decoder state over it is kept for decoding the same features again
+    (see vocabulary.prefix_state()).
+    """
+
+    def __init__(self, model, options):
+        if isinstance(options.prompt, str):
+            tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                      language=options.language, task=options.task)
+            options = replace(options, prompt=prompt_tokens(tokenizer, options.prompt,
+                                                            model.dims.n_text_ctx))
+        super().__init__(model, options)
+        # <|startofprev|> and the prompt come before <|startoftranscript|>
+        self.prompt_length = 0
+        if options.prompt:
+            self.prompt_length = self.sot_index
+            self.inference = PromptPrefixInference(model, len(self.initial_tokens),
+                                                   self.prompt_length)
+            if hasattr(self.decoder, 'inference'):
+                # Beam search rearranges the inference's kv-cache
+                self.decoder.inference = self.inference
+            # The first logits returned start at <|startoftranscript|>
+            self.sot_index = 0
+
+    def _get_audio_features(self, mel):
+        if self.prompt_length:
+            # Prompt-prefix states are kept per encoder output object
+            self.inference.features = mel
+        if mel.shape[-1] == self.model.dims.n_audio_state:
+            return mel
+        return super()._get_audio_features(mel)
+
+    def _detect_language(self, audio_features, tokens):
+        if self.options.language is not None:
+            return [self.options.language] * audio_features.shape[0], None
+
+        lang_probs = detect_language(self.model, audio_features, self.tokenizer)
+        languages = [max(probs, key=probs.get) for probs in lang_probs]
+        tokens[:, self.prompt_length + self.sot_index + 1] = torch.tensor(
+            [self.tokenizer.to_language_token(language) for language in languages])
+        return languages, lang_probs
+
+
+@torch.no_grad()
+def decode_features(model, audio_features, options):
+    """
+    Decode encoder outputs with whisper's decoding machinery (beam search, logit filters...).
+
+    Args:
+        audio_features: tensor of shape (batch, n_ctx, n_audio_state), any n_ctx
+        options: whisper DecodingOptions
+
+    Returns:
+        List of whisper DecodingResult, one per batch item
+    """
+    if options.fp16 != (audio_features.dtype == torch.float16):
+        options = replace(options, fp16=audio_features.dtype == torch.float16)
+    return FeatureDecodingTask(model, options).run(audio_features)
+
+
+def is_silence(result):
+    """Whisper's no-speech rule: high no-speech probability and low confidence"""
+    return result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def needs_fallback(result, duration=None, max_tokens_per_second=None):
+    """
+    Apply whisper's quality checks to a DecodingResult.
+
+    Returns a short reason string when the result should be re-decoded, or None.
+    """
+    if result.compression_ratio > COMPRESSION_RATIO_THRESHOLD:
+        return "compression ratio"
+    if result.avg_logprob < LOGPROB_THRESHOLD and not is_silence(result):
+        return "low log probability"
+    if max_tokens_per_second and duration:
+        if len(result.tokens) > max_tokens_per_second * max(duration, 1.0):
+            return "too many tokens"
+    return None
+
+
+def sample_len_for_duration(model, duration, max_tokens_per_second):
+    """Cap on sampled tokens per 30-second window, or None to keep whisper's default"""
+    if not max_tokens_per_second:
+        return None
+    window = min(duration, N_SAMPLES / SAMPLE_RATE)
+    return min(model.dims.n_text_ctx // 2, math.ceil(max_tokens_per_second * max(window, 1.0)) + 8)
+
+
+def transcribe_options(model, profile, duration):
+    """
+    Build whisper transcribe() keyword arguments from a decoding profile.
+
+    Args:
+        profile: one of Settings.DECODING_PROFILES
+        duration: clip length in seconds, used for the tokens-per-second cap
+    """
+    temperatures = tuple(profile['temperature'])
+    options = {
+        'temperature': temperatures,
+        'condition_on_previous_text': profile['condition_on_previous_text'],
+    }
+    if profile['beam_size']:
+        options['beam_size'] = profile['beam_size']
+    # best_of only applies to the sampled (t > 0) fallback passes
+    if profile['best_of'] and any(t > 0 for t in temperatures):
+        options['best_of'] = profile['best_of']
+    sample_len = sample_len_for_duration(model, duration, profile['max_tokens_per_second'])
+    if sample_len:
+        options['sample_len'] = sample_len
+    return options
+
+
+def count_fallbacks(result, temperatures):
+    """Count the re-decodes whisper's temperature fallback loop needed over all segments"""
+    temperatures = list(temperatures)
+    fallbacks = 0
+    for segment in result.get("segments", []):
+        temperature = segment.get("temperature", temperatures[0])
+        fallbacks += sum(1 for t in temperatures if t < temperature)
+    return fallbacks
+
+
+def transcribe_short(model, audio, language=None, fp16=False, beam_size=None,
+                     max_tokens_per_second=None, prompt=None, mel=None):
+    """
+    Transcribe a short clip with the encoder run on a truncated audio context.
+
+    Args:
+        model: whisper.model.Whisper instance
+        audio: 16 kHz float32 waveform, at most 30 s long
+        language: language code or None to detect it
+        beam_size: beam size for the single greedy/beam pass, None for greedy
+        max_tokens_per_second: cap on sampled tokens; also used as runaway-output guard
+        prompt: optional initial prompt text (custom vocabulary)
+        mel: log-mel features of the clip computed beforehand, see compute_mel()
+
+    Returns:
+        Result dict like whisper's transcribe(), or None if the quality checks failed
+    """
+    max_tokens_per_second = max_tokens_per_second or SHORT_MAX_TOKENS_PER_SECOND
+    duration = len(audio) / SAMPLE_RATE
+    n_audio_ctx = audio_ctx_for_duration(model, duration)
+    mel = compute_mel(model, audio, n_audio_ctx, mel)
+    audio_features = encode(model, mel)
+    if fp16:
+        audio_features = audio_features.half()
+
+    options = DecodingOptions(language=language, without_timestamps=True, fp16=fp16,
+                              beam_size=beam_size, prompt=prompt,
+                              sample_len=sample_len_for_duration(model, duration,
+                                                                 max_tokens_per_second))
+    result = decode_features(model, audio_features, options)[0]
+
+    reason = needs_fallback(result, duration, max_tokens_per_second)
+    if reason:
+        logger.info(f"Short-utterance path rejected ({reason}), falling back to full context")
+        return None
+
+    logger.info(f"Short-utterance path: {duration:.1f}s clip encoded with audio_ctx={n_audio_ctx}")
+    text = "" if is_silence(result) else result.text
+    return {
+        "text": text,
+        "language": result.language,
+        "segments": [{
+            "start": 0.0,
+            "end": duration,
+            "text": text,
+            "tokens": result.tokens,
+            "temperature": result.temperature,
+            "avg_logprob": result.avg_logprob,
+            "compression_ratio": result.compression_ratio,
+            "no_speech_prob": result.no_speech_prob,
+        }],
+        "audio_ctx": n_audio_ctx,
+        "fallbacks": 0,
+    }
+
+
+def transcribe_batch(model, audios, language=None, max_tokens_per_second=None,
+                     max_batch_size=8, prompt=None):
+    """
+    Transcribe several short clips with batched encoder passes and batched greedy decoding.
+
+    Only clips of at most one 30-second window are accepted: a window is decoded without
+    timestamps, seeking or conditioning on previous text, so longer clips belong to
+    whisper's transcribe(). Clips are sorted by length and stacked into padded batches of
+    up to max_batch_size, so each batch's sample_len follows clips of similar duration.
+
+    Args:
+        model: whisper.model.Whisper instance
+        audios: list of 16 kHz float32 waveforms, each at most N_SAMPLES long
+        language: language code shared by all clips, or None to detect per clip
+
+    Returns:
+        List of result dicts like whisper's transcribe(), one per clip. Clips that fail
+        the quality checks get "needs_fallback" set so the caller can re-transcribe them
+        individually.
+    """
+    if any(len(audio) > N_SAMPLES for audio in audios):
+        raise ValueError("transcribe_batch() only takes clips of at most 30 seconds")
+
+    order = sorted(range(len(audios)), key=lambda index: len(audios[index]))
+    decoded = [None] * len(audios)
+    for batch_start in range(0, len(order), max_batch_size):
+        batch = order[batch_start:batch_start + max_batch_size]
+        mel = torch.stack([compute_mel(model, audios[index]) for index in batch])
+        audio_features = encode(model, mel)
+        longest = max(len(audios[index]) for index in batch) / SAMPLE_RATE
+        options = DecodingOptions(language=language, without_timestamps=True, fp16=False,
+                                  prompt=prompt, sample_len=sample_len_for_duration(model, longest,
+                                                                     max_tokens_per_second))
+        for index, result in zip(batch, decode_features(model, audio_features, options)):
+            decoded[index] = result
+
+    results = []
+    for audio, result in zip(audios, decoded):
+        duration = len(audio) / SAMPLE_RATE
+        text = "" if is_silence(result) else result.text
+        results.append({
+            "text": text,
+            "language": language or result.language,
+            "fallbacks": 0,
+            "needs_fallback": bool(needs_fallback(result, duration, max_tokens_per_second)),
+            "segments": [{
+                "start": 0.0,
+                "end": duration,
+                "text": text,
+                "tokens": result.tokens,
+                "temperature": result.temperature,
+                "avg_logprob": result.avg_logprob,
+                "compression_ratio": result.compression_ratio,
+                "no_speech_prob": result.no_speech_prob,
+            }],
+        })
+    return results
@@ -0,0 +1,266 @@
+"""Recent recordings with their encoder outputs, so a retry only reruns the decoder"""
+
+import hashlib
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE, log_mel_spectrogram, pad_or_trim
+from whisper.decoding import DecodingOptions
+
+logger = logging.getLogger(__name__)
+
+# Largest difference between log-mel inputs taken as the same window
+MEL_TOLERANCE = 2e-3
+
+
+def audio_hash(audio):
+    """Content hash of a 16 kHz waveform"""
+    return hashlib.sha1(audio.tobytes()).hexdigest()
+
+
+def window_mels(model, audio, mel=None):
+    """
+    Log-mel inputs of a recording's consecutive 30-second windows, cut from one
+    spectrogram of the whole clip exactly like whisper's transcribe() cuts its windows.
+
+    mel is that spectrogram if it was computed while recording.
+    """
+    if mel is None or mel.shape[0] != model.dims.n_mels:
+        mel = log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
+    content_frames = mel.shape[-1] - N_FRAMES
+    return [pad_or_trim(mel[:, seek:min(seek + N_FRAMES, content_frames)], N_FRAMES)
+            for seek in range(0, max(content_frames, 1), N_FRAMES)]
+
+
+class EncoderCache:
+    """
+    Bounded LRU of the last recordings, keyed by audio hash.
+
+    Each entry keeps the decoded waveform (so a retry skips ffmpeg) and, per model, the
+    encoder outputs of the recording's consecutive 30-second windows. Outputs are kept on
+    the CPU and tied to the model object, so they are dropped when the model is unloaded.
+    """
+
+    def __init__(self, max_recordings=5, max_bytes=256 * 1024 ** 2):
+        self.max_recordings = max_recordings
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, audio, mel=None):
+        """
+        Remember a recording, with its log-mel features if they were computed while
+        recording; returns its hash (None when the cache is disabled)
+        """
+        if not self.max_recordings:
+            return None
+        key = audio_hash(audio)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = {'audio': audio, 'mel': None, 'features': {},
+                                      'result': None}
+            if mel is not None:
+                self._entries[key]['mel'] = mel
+            self._entries.move_to_end(key)
+            self._evict()
+        return key
+
+    def set_result(self, key, **result):
+        """Record how a recording was last transcribed (language, profile, model, text)"""
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]['result'] = result
+
+    def last(self):
+        """Hash of the most recent recording, or None"""
+        with self._lock:
+            return next(reversed(self._entries), None)
+
+    def recordings(self):
+        """Waveforms of the cached recordings, most recent first"""
+        with self._lock:
+            return [entry['audio'] for entry in reversed(self._entries.values())]
+
+    def get(self, key):
+        """(audio, last result) of a recording, or None if it is no longer cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry['audio'], entry['result']
+
+    def _mel(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry['mel'] if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def nbytes(self):
+        """Bytes held by the cached recordings, features and encoder outputs"""
+        with self._lock:
+            return sum(self._entry_bytes(entry) for entry in self._entries.values())
+
+    def _entry_bytes(self, entry):
+        size = entry['audio'].nbytes
+        if entry['mel'] is not None:
+            size += entry['mel'].numel() * entry['mel'].element_size()
+        for _, windows in entry['features'].values():
+            size += sum(t.numel() * t.element_size() for t in windows.values())
+        return size
+
+    def _evict(self):
+        while len(self._entries) > self.max_recordings:
+            self._entries.popitem(last=False)
+        while (len(self._entries) > 1
+               and sum(self._entry_bytes(e) for e in self._entries.values()) > self.max_bytes):
+            self._entries.popitem(last=False)
+
+    def _windows(self, key, model, model_name):
+        """Cached {window index: features} of a recording for this model"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        cached = entry['features'].get(model_name)
+        if cached is None or cached[0]() is not model:
+            cached = (weakref.ref(model), {})
+            entry['features'][model_name] = cached
+        return cached[1]
+
+    @contextmanager
+    def capture(self, key, model, model_name):
+        """
+        Keep the first window's encoder output while whisper transcribes a recording.
+
+        Whisper's own first window is recognised by its input, so encoder passes on
+        other inputs (such as language detection) are ignored. The reference input is
+        cut from the features computed while recording when there are any; otherwise the
+        spectrogram is only computed once a full 30-second window is encoded. The
+        short-utterance path encodes a truncated window, so nothing is captured (nor
+        computed) for it.
+        """
+        entry = self.get(key) if key is not None else None
+        if entry is None or not isinstance(model, whisper.model.Whisper):
+            yield
+            return
+        audio = entry[0]
+        reference = []
+
+        def hook(module, inputs, output):
+            mel = inputs[0]
+            if mel.shape[0] != 1 or mel.shape[-1] != N_FRAMES:
+                return
+            with self._lock:
+                windows = self._windows(key, model, model_name)
+                if windows is None or 0 in windows:
+                    return
+            if not reference:
+                reference.append(window_mels(model, audio, self._mel(key))[0])
+            # Features made while recording, or a half-precision input, are not bitwise
+            # equal to whisper's own
+            if not torch.allclose(mel[0].float().cpu(), reference[0], atol=MEL_TOLERANCE):
+                return
+            with self._lock:
+                windows = self._windows(key, model, model_name)
+                if windows is not None and 0 not in windows:
+                    windows[0] = output[0].detach().float().cpu()
+                    self._evict()
+
+        handle = model.encoder.register_forward_hook(hook)
+        try:
+            yield
+        finally:
+            handle.remove()
+
+    def features(self, key, model, model_name, audio):
+        """
+        Encoder outputs of all 30-second windows of a recording, encoding missing ones.
+
+        Returns:
+            List of (start sample, window waveform, features of shape (1, n_ctx, n_state))
+        """
+        from .decoding import encode
+
+        with self._lock:
+            windows = self._windows(key, model, model_name)
+            cached = dict(windows) if windows is not None else {}
+
+        mels = None
+        result = []
+        content_frames = len(audio) // HOP_LENGTH
+        for index, seek in enumerate(range(0, max(content_frames, 1), N_FRAMES)):
+            start = seek * HOP_LENGTH
+            features = cached.get(index)
+            if features is None:
+                self.misses += 1
+                if mels is None:
+                    mels = window_mels(model, audio, self._mel(key))
+                features = encode(model, mels[index])[0].float().cpu()
+                with self._lock:
+                    windows = self._windows(key, model, model_name)
+                    if windows is not None:
+                        windows[index] = features
+                        self._evict()
+            else:
+                self.hits += 1
+            result.append((start, audio[start:start + N_SAMPLES], features[None].to(model.device)))
+        return result
+
+
+def redecode(model, windows, language, profile, prompt=None):
+    """
+    Decode already-encoded windows with a decoding profile.
+
+    Each window is decoded on its own (no conditioning on previous text), retrying at the
+    profile's higher temperatures when whisper's quality checks fail.
+
+    Args:
+        windows: output of EncoderCache.features()
+        language: language code, or None to detect it per window
+        profile: one of Settings.DECODING_PROFILES
+        prompt: optional initial prompt text (custom vocabulary)
+
+    Returns:
+        Result dict like whisper's transcribe()
+    """
+    from .decoding import decode_features, is_silence, needs_fallback, sample_len_for_duration
+
+    result = {"text": "", "segments": [], "language": language, "fallbacks": 0}
+    for start, window, features in windows:
+        duration = len(window) / SAMPLE_RATE
+        sample_len = sample_len_for_duration(model, duration, profile['max_tokens_per_second'])
+        for attempt, temperature in enumerate(profile['temperature']):
+            options = DecodingOptions(
+                language=language, without_timestamps=True, fp16=False,
+                temperature=temperature, sample_len=sample_len, prompt=prompt,
+                beam_size=profile['beam_size'] if temperature == 0 else None,
+                best_of=profile['best_of'] if temperature > 0 else None)
+            decoded = decode_features(model, features, options)[0]
+            if not needs_fallback(decoded, duration, profile['max_tokens_per_second']):
+                break
+            if attempt + 1 < len(profile['temperature']):
+                result["fallbacks"] += 1
+        text = "" if is_silence(decoded) else decoded.text
+        result["text"] = (result["text"] + " " + text).strip()
+        result["language"] = result["language"] or decoded.language
+        result["segments"].append({
+            "start": start / SAMPLE_RATE,
+            "end": start / SAMPLE_RATE + duration,
+            "text": text,
+            "tokens": decoded.tokens,
+            "temperature": decoded.temperature,
+            "avg_logprob": decoded.avg_logprob,
+            "compression_ratio": decoded.compression_ratio,
+            "no_speech_prob": decoded.no_speech_prob,
+        })
+    return result
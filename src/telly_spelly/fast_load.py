@@ -0,0 +1,184 @@
+"""Fast model loading from memory-mapped safetensors copies of the whisper checkpoints
+
+Run with: python -m telly_spelly.fast_load [--convert | --prefetch] [MODEL]
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from .settings import MODEL_CACHE_FILES, whisper_cache_dir
+
+logger = logging.getLogger(__name__)
+
+FAST_LOAD_SUFFIX = ".safetensors"
+PREFETCH_CHUNK = 16 * 1024 * 1024
+
+
+def is_available():
+    """Check if the optional safetensors package is installed"""
+    try:
+        import safetensors  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_checkpoint_path(model_name):
+    """Path of the whisper .pt checkpoint for a model"""
+    return os.path.join(whisper_cache_dir(),
+                        MODEL_CACHE_FILES.get(model_name, f"{model_name}.pt"))
+
+
+def get_fast_load_path(model_name):
+    """Path of the converted copy, next to the .pt checkpoint"""
+    return os.path.splitext(get_checkpoint_path(model_name))[0] + FAST_LOAD_SUFFIX
+
+
+def is_converted(model_name):
+    """Check if an up-to-date converted copy exists"""
+    fast_path = get_fast_load_path(model_name)
+    if not os.path.exists(fast_path):
+        return False
+    checkpoint = get_checkpoint_path(model_name)
+    return not os.path.exists(checkpoint) or os.path.getmtime(fast_path) >= os.path.getmtime(checkpoint)
+
+
+def convert(model_name):
+    """
+    Convert a whisper checkpoint once into an mmap-able safetensors file.
+
+    Weights are stored in fp32, the dtype whisper builds its models in, so loading
+    needs no conversion and tensors can stay mapped from the page cache. Model
+    dimensions go into the file metadata.
+
+    Returns:
+        Path of the converted file
+    """
+    import torch
+    import whisper
+    from safetensors.torch import save_file
+
+    if not os.path.exists(get_checkpoint_path(model_name)):
+        # Let whisper download and verify the checkpoint first
+        whisper._download(whisper._MODELS[model_name], whisper_cache_dir(), False)
+
+    start_time = time.monotonic()
+    checkpoint = torch.load(get_checkpoint_path(model_name), map_location='cpu',
+                            mmap=True, weights_only=True)
+    state_dict = {name: tensor.float().contiguous()
+                  for name, tensor in checkpoint['model_state_dict'].items()}
+
+    fast_path = get_fast_load_path(model_name)
+    tmp_path = fast_path + ".tmp"
+    save_file(state_dict, tmp_path, metadata={'dims': json.dumps(checkpoint['dims'])})
+    os.replace(tmp_path, fast_path)
+    logger.info(f"Converted {model_name} for fast loading in "
+                f"{time.monotonic() - start_time:.1f}s: {fast_path}")
+    return fast_path
+
+
+def load_model(model_name, device='cpu'):
+    """
+    Load a whisper model from its converted copy, converting on first use.
+
+    The model skeleton is built without allocating weights and the mapped tensors are
+    assigned directly, so on CPU pages are only read when inference touches them.
+    Falls back to whisper.load_model() without safetensors or for custom checkpoints.
+    """
+    import torch
+    import whisper
+
+    if not is_available() or model_name not in whisper._MODELS:
+        return whisper.load_model(model_name, device=device)
+
+    from safetensors import safe_open
+    from safetensors.torch import load_file
+    from whisper.model import AudioEncoder, ModelDimensions, TextDecoder, Whisper
+
+    if not is_converted(model_name):
+        convert(model_name)
+
+    fast_path = get_fast_load_path(model_name)
+    with safe_open(fast_path, framework='pt') as f:
+        dims = ModelDimensions(**json.loads(f.metadata()['dims']))
+
+    # Build the module tree on the meta device; whisper's own __init__ creates a
+    # sparse buffer that meta tensors do not support
+    model = Whisper.__new__(Whisper)
+    torch.nn.Module.__init__(model)
+    model.dims = dims
+    with torch.device('meta'):
+        model.encoder = AudioEncoder(dims.n_mels, dims.n_audio_ctx, dims.n_audio_state,
+                                     dims.n_audio_head, dims.n_audio_layer)
+        model.decoder = TextDecoder(dims.n_vocab, dims.n_text_ctx, dims.n_text_state,
+                                    dims.n_text_head, dims.n_text_layer)
+
+    state_dict = load_file(fast_path, device=str(device))
+    model.load_state_dict(state_dict, assign=True)
+
+    # Non-persistent buffers are not in the file
+    model.decoder.register_buffer(
+        "mask", torch.empty(dims.n_text_ctx, dims.n_text_ctx, device=device)
+        .fill_(-np.inf).triu_(1), persistent=False)
+    model.set_alignment_heads(whisper._ALIGNMENT_HEADS[model_name])
+    return model.to(device)
+
+
+def prefetch(model_name):
+    """
+    Read a model's weights into the page cache so the next load is served from RAM.
+
+    Returns:
+        Number of bytes read
+    """
+    path = get_fast_load_path(model_name)
+    if not os.path.exists(path):
+        path = get_checkpoint_path(model_name)
+    if not os.path.exists(path):
+        logger.info(f"Nothing to prefetch for {model_name}")
+        return 0
+
+    start_time = time.monotonic()
+    total = 0
+    with open(path, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        while True:
+            chunk = f.read(PREFETCH_CHUNK)
+            if not chunk:
+                break
+            total += len(chunk)
+    logger.info(f"Prefetched {path}: {total / 1024 ** 2:.0f} MB in "
+                f"{time.monotonic() - start_time:.1f}s")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telly Spelly fast model loading")
+    parser.add_argument('--convert', action='store_true',
+                        help="Convert the checkpoint now instead of on first load")
+    parser.add_argument('--prefetch', action='store_true',
+                        help="Read the model files into the page cache (used at login)")
+    parser.add_argument('model', nargs='?', help="Model name (default: configured model)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    model_name = args.model
+    if model_name is None:
+        from .settings import Settings
+        model_name = Settings().get('model', 'turbo')
+
+    if args.convert:
+        convert(model_name)
+    if args.prefetch or not args.convert:
+        prefetch(model_name)
+    return 0
+
+
+if __name__ == "__main__":
+    main()
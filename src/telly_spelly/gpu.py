@@ -82,6 +82,67 @@ def get_available_models(gpu_memory_gb=None):
     return available
 
 
+# Models from least to most accurate, used to pick among benchmarked models
+ACCURACY_ORDER = ['tiny', 'base', 'small', 'medium', 'turbo', 'large']
+
+
+def benchmark_cached_models(device, clip_seconds=10.0, progress=None, recordings=None,
+                            model_manager=None):
+    """
+    Benchmark every downloaded model on this machine.
+
+    Args:
+        device: torch device to benchmark on
+        clip_seconds: length of the timed clip
+        progress: optional callable receiving status messages
+        recordings: recent 16 kHz recordings to time on, instead of synthetic audio
+        model_manager: ModelManager to load through, so its memory budget holds
+
+    Returns:
+        dict mapping model name to its benchmark.benchmark_model() result; models that
+        fail to load or run (e.g. out of memory) are left out
+    """
+    from .benchmark import benchmark_model
+    from .settings import is_model_cached
+
+    results = {}
+    for model_name in ACCURACY_ORDER:
+        if not is_model_cached(model_name):
+            continue
+        if progress:
+            progress(f"Benchmarking {model_name}...")
+        try:
+            results[model_name] = benchmark_model(model_name, device, clip_seconds=clip_seconds,
+                                                  recordings=recordings,
+                                                  model_manager=model_manager)
+            logger.info(f"Benchmark {model_name} on {device}: "
+                        f"{results[model_name]['latency']:.2f}s for {clip_seconds:.0f}s audio")
+        except Exception as e:
+            logger.warning(f"Benchmark of {model_name} on {device} failed: {e}")
+    return results
+
+
+def recommend_model(benchmarks, target_seconds, clip_seconds):
+    """
+    Pick the most accurate benchmarked model that meets a latency target.
+
+    Args:
+        benchmarks: dict of model name to benchmark result (see benchmark_cached_models)
+        target_seconds: allowed transcription time for a clip of clip_seconds
+
+    Returns:
+        Model name, the fastest benchmarked model if none meets the target, or None
+        without benchmarks
+    """
+    if not benchmarks:
+        return None
+    meeting = [name for name in ACCURACY_ORDER if name in benchmarks
+               and benchmarks[name]['realtime_factor'] * clip_seconds <= target_seconds]
+    if meeting:
+        return meeting[-1]
+    return min(benchmarks, key=lambda name: benchmarks[name]['realtime_factor'])
+
+
 def get_default_model(available_models):
     """
     Get the best default model from available models.
@@ -96,18 +157,22 @@ def get_default_model(available_models):
     return 'tiny'
 
 
-def detect_and_configure(force_cpu=False):
+def detect_and_configure(force_cpu=False, benchmarks=None, latency_target=None):
     """
     Detect GPU and return configuration dict.
 
     Args:
         force_cpu: If True, ignore GPU and configure for CPU-only mode
+        benchmarks: measured results per device (see benchmark_cached_models); when
+            present for the detected device they replace the static VRAM table
+        latency_target: (seconds, clip_seconds) the recommended model has to meet
 
     Returns:
         dict with keys:
             - gpu_memory_gb: float or None
             - available_models: list of model names
             - default_model: recommended default model
+            - device: torch device the configuration applies to
     """
     if force_cpu:
         logger.info("Force CPU mode enabled, skipping GPU detection")
@@ -117,8 +182,17 @@ def detect_and_configure(force_cpu=False):
     available = get_available_models(gpu_memory)
     default = get_default_model(available)
 
+    device = 'cpu' if gpu_memory is None else 'cuda'
+    benchmarks = (benchmarks or {}).get(device)
+    if benchmarks:
+        # Models measured to run here are available regardless of the static guess
+        available = [m for m in ALL_MODELS if m in benchmarks or m in available]
+        default = recommend_model(benchmarks, *(latency_target or (1.5, 10.0))) or default
+        logger.info(f"Recommended model from benchmarks: {default}")
+
     return {
         'gpu_memory_gb': gpu_memory,
         'available_models': available,
         'default_model': default,
+        'device': device,
     }
@@ -45,6 +45,16 @@ Exec=dbus-send --session --type=method_call --dest={DBUS_SERVICE} /TellySpelly {
 Icon=media-record
 """
 
+PREFETCH_AUTOSTART_ENTRY = """[Desktop Entry]
+Name=Telly Spelly model prefetch
+Comment=Read the Whisper model into the page cache so Telly Spelly starts faster
+Exec=telly-spelly-prefetch --prefetch
+Terminal=false
+Type=Application
+NoDisplay=true
+X-KDE-autostart-phase=2
+"""
+
 SHORTCUT_ENTRY = f"""[Desktop Entry]
 Name=Telly Spelly
 Comment=Voice to text transcription
@@ -191,6 +201,25 @@ def install_xfce_shortcuts_silent():
         pass
 
 
+def get_prefetch_autostart_file():
+    """Get the path of the login prefetch autostart entry"""
+    return Path.home() / ".config/autostart/telly-spelly-prefetch.desktop"
+
+
+def install_prefetch_autostart():
+    """Prefetch the configured model into the page cache at login"""
+    autostart_file = get_prefetch_autostart_file()
+    autostart_file.parent.mkdir(parents=True, exist_ok=True)
+    autostart_file.write_text(PREFETCH_AUTOSTART_ENTRY)
+
+
+def remove_prefetch_autostart():
+    """Remove the login prefetch autostart entry"""
+    autostart_file = get_prefetch_autostart_file()
+    if autostart_file.exists():
+        autostart_file.unlink()
+
+
 def install_icon():
     """Install the application icon"""
     icon_dest = Path.home() / ".local/share/icons/hicolor/128x128/apps"
@@ -353,6 +382,7 @@ def uninstall():
     files_to_remove = [
         Path.home() / ".local/share/applications/telly-spelly.desktop",
         Path.home() / ".local/share/icons/hicolor/128x128/apps/telly-spelly.png",
+        get_prefetch_autostart_file(),
     ]
 
     # Remove shortcuts based on desktop environment
@@ -0,0 +1,215 @@
+"""Non-blocking logging: records are queued by the calling thread (the audio callback, the
+transcription worker, the Qt main thread) and written by a background thread, to stdout
+with journal priority prefixes or straight to journald's native socket with structured
+fields
+
+Structured fields come from `extra`: `logger.info(..., extra={'job_id': ..., 'stage': ...,
+'duration': ...})` becomes JOB_ID, STAGE and DURATION in the journal.
+"""
+
+import array
+import atexit
+import copy
+import errno
+import fcntl
+import logging
+import os
+import queue
+import socket
+import struct
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+JOURNAL_SOCKET = "/run/systemd/journal/socket"
+SYSLOG_IDENTIFIER = "telly-spelly"
+
+# Record attributes passed as journal fields when set through `extra`
+STRUCTURED_FIELDS = ('job_id', 'stage', 'duration')
+
+
+def syslog_priority(levelno):
+    """Syslog priority of a logging level"""
+    if levelno >= logging.ERROR:
+        return 3
+    if levelno >= logging.WARNING:
+        return 4
+    if levelno >= logging.INFO:
+        return 6
+    return 7
+
+
+def journal_socket_available(path=JOURNAL_SOCKET):
+    return os.path.exists(path)
+
+
+class JournalHandler(logging.Handler):
+    """Writes to stdout with systemd priority prefixes, for journald's stdout stream"""
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            sys.stdout.write(f"<{syslog_priority(record.levelno)}>{SYSLOG_IDENTIFIER}: {msg}\n")
+            sys.stdout.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class NativeJournalHandler(logging.Handler):
+    """
+    Sends records to journald's native protocol socket, with the code location, thread,
+    logger and STRUCTURED_FIELDS as journal fields.
+
+    Entries too large for a datagram are passed in a sealed memfd, as journald expects.
+    """
+
+    def __init__(self, path=JOURNAL_SOCKET):
+        super().__init__()
+        self.path = path
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    @staticmethod
+    def encode_field(name, value):
+        value = str(value).encode('utf-8', 'replace')
+        if b'\n' in value:
+            return name.encode() + b'\n' + struct.pack('<Q', len(value)) + value + b'\n'
+        return name.encode() + b'=' + value + b'\n'
+
+    def entry(self, record):
+        """The journal entry for a record, in the native protocol's encoding"""
+        fields = {
+            'MESSAGE': self.format(record),
+            'PRIORITY': syslog_priority(record.levelno),
+            'SYSLOG_IDENTIFIER': SYSLOG_IDENTIFIER,
+            'LOGGER': record.name,
+            'THREAD_NAME': record.threadName,
+            'CODE_FILE': record.pathname,
+            'CODE_LINE': record.lineno,
+            'CODE_FUNC': record.funcName,
+        }
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                fields[name.upper()] = value
+        return b''.join(self.encode_field(name, value) for name, value in fields.items())
+
+    def emit(self, record):
+        try:
+            data = self.entry(record)
+            try:
+                self.socket.sendto(data, self.path)
+            except OSError as e:
+                if e.errno != errno.EMSGSIZE:
+                    raise
+                self._send_memfd(data)
+        except Exception:
+            self.handleError(record)
+
+    def _send_memfd(self, data):
+        fd = os.memfd_create("telly-spelly-journal", os.MFD_ALLOW_SEALING)
+        try:
+            os.write(fd, data)
+            fcntl.fcntl(fd, fcntl.F_ADD_SEALS, fcntl.F_SEAL_SHRINK | fcntl.F_SEAL_GROW
+                        | fcntl.F_SEAL_WRITE | fcntl.F_SEAL_SEAL)
+            self.socket.sendmsg([], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                                      array.array('i', [fd]))], 0, self.path)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self.socket.close()
+        super().close()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `burst` records from one call site through per `interval` seconds.
+
+    Meant for warnings repeated in a loop or a callback (such as an input overflow on
+    every audio buffer); the first record let through after a quiet window says how many
+    were dropped.
+    """
+
+    def __init__(self, burst=5, interval=10.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        now = time.monotonic()
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            window = self._sites.get(site)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._sites[site] = [now, 1, 0]
+            else:
+                window[1] += 1
+                if window[1] > self.burst:
+                    window[2] += 1
+                    return False
+                return True
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queues records for the writer thread without ever waiting: when the queue is full
+    records are dropped and counted, and a warning is queued once there is room again.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record):
+        # Resolve the message now (its arguments may change), but leave formatting and
+        # tracebacks to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+            return
+        if self._unreported:
+            notice = logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"{self._unreported} log records dropped, the log queue was full"})
+            self._unreported = 0
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                pass
+
+
+def start_queue_logging(handlers, level=logging.INFO, max_records=10000):
+    """
+    Route the root logger through a queue to handlers run by a background thread.
+
+    Returns:
+        The running QueueListener; it is stopped (and the queue drained) at exit
+    """
+    log_queue = queue.Queue(max_records)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(queue_handler)
+    return listener
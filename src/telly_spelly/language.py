@@ -0,0 +1,136 @@
+"""Language detection restricted to candidate languages, with a confidence-based cache"""
+
+import logging
+import time
+from collections import Counter, deque
+
+import whisper
+
+from . import vad
+
+logger = logging.getLogger(__name__)
+
+
+class LanguageDetector:
+    """
+    Detects the spoken language for 'auto' mode.
+
+    Detection only considers the candidate languages and runs on a short speech-only
+    prefix of the clip. A confident detection is reused for following utterances until
+    a transcription comes back with low confidence, the cache ages out, or
+    recheck_every utterances have passed.
+    """
+
+    def __init__(self, candidates=None, confidence_threshold=0.85, prefix_seconds=4.0,
+                 recheck_every=10, max_age_seconds=600, logprob_threshold=-0.8):
+        self.candidates = list(candidates) if candidates else None
+        self.confidence_threshold = confidence_threshold
+        self.prefix_seconds = prefix_seconds
+        self.recheck_every = recheck_every
+        self.max_age_seconds = max_age_seconds
+        self.logprob_threshold = logprob_threshold
+
+        self.cached_language = None
+        self.cached_probability = 0.0
+        self.cached_at = 0.0
+        self.uses_since_detection = 0
+
+        # Per-utterance statistics
+        self.counts = Counter()
+        self.history = deque(maxlen=50)
+
+    def set_candidates(self, candidates):
+        """Restrict detection to these language codes (None or empty = all)"""
+        candidates = list(candidates) if candidates else None
+        if candidates != self.candidates:
+            self.candidates = candidates
+            if candidates and self.cached_language not in candidates:
+                self.invalidate()
+
+    def invalidate(self):
+        self.cached_language = None
+        self.cached_probability = 0.0
+        self.uses_since_detection = 0
+
+    def _cache_valid(self):
+        return (
+            self.cached_language is not None
+            and self.cached_probability >= self.confidence_threshold
+            and self.uses_since_detection < self.recheck_every
+            and time.monotonic() - self.cached_at < self.max_age_seconds
+        )
+
+    def detect(self, model, audio):
+        """
+        Get the language of a 16 kHz clip.
+
+        Returns:
+            dict with 'language', 'probability', 'source' ('cached', 'detected' or
+            'english-only') and 'elapsed' seconds spent detecting
+        """
+        start_time = time.monotonic()
+        if not model.is_multilingual:
+            return self._record({'language': 'en', 'probability': 1.0,
+                                 'source': 'english-only', 'elapsed': 0.0})
+
+        if self._cache_valid():
+            self.uses_since_detection += 1
+            return self._record({'language': self.cached_language,
+                                 'probability': self.cached_probability,
+                                 'source': 'cached', 'elapsed': 0.0})
+
+        prefix = vad.speech_prefix(audio, self.prefix_seconds)
+        probs = self._language_probs(model, prefix)
+        language = max(probs, key=probs.get)
+
+        self.cached_language = language
+        self.cached_probability = probs[language]
+        self.cached_at = time.monotonic()
+        self.uses_since_detection = 0
+
+        info = {'language': language, 'probability': probs[language], 'source': 'detected',
+                'elapsed': time.monotonic() - start_time}
+        logger.info(f"Detected language {language} (p={probs[language]:.2f}) "
+                    f"in {info['elapsed'] * 1000:.0f} ms")
+        return self._record(info)
+
+    def _language_probs(self, model, audio):
+        """Candidate-restricted language probabilities for a (short) clip"""
+        if isinstance(model, whisper.model.Whisper):
+            from .decoding import audio_ctx_for_duration, compute_mel, detect_language, encode
+
+            tokenizer = whisper.tokenizer.get_tokenizer(
+                model.is_multilingual, num_languages=model.num_languages)
+            n_audio_ctx = audio_ctx_for_duration(model, len(audio) / vad.SAMPLE_RATE)
+            features = encode(model, compute_mel(model, audio, n_audio_ctx))
+            return detect_language(model, features, tokenizer, self.candidates)[0]
+
+        # ONNX Runtime model: the exported encoder always takes a full 30 s window
+        from whisper.audio import N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+        # Like whisper's transcribe(): the audio is padded, so the tail is log-floor frames
+        mel = pad_or_trim(log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES),
+                          N_FRAMES)
+        cross_kv = model.encode(mel.numpy()[None])
+        _, probs = model.detect_language(cross_kv, candidates=self.candidates)
+        return probs
+
+    def observe(self, avg_logprob):
+        """Feed back the confidence of the transcription that used the detected language"""
+        if avg_logprob is not None and avg_logprob < self.logprob_threshold:
+            if self.cached_language is not None:
+                logger.info(f"Low transcription confidence ({avg_logprob:.2f}), "
+                            "language will be re-detected")
+            self.invalidate()
+
+    def _record(self, info):
+        self.counts[info['language']] += 1
+        self.history.append(info)
+        return info
+
+    def summary(self):
+        """Short human-readable summary of detected languages, most common first"""
+        if not self.counts:
+            return "No detections yet"
+        detected = sum(1 for info in self.history if info['source'] == 'detected')
+        languages = ", ".join(f"{code} {count}" for code, count in self.counts.most_common())
+        return f"{languages} ({detected} of last {len(self.history)} detected, rest cached)"
@@ -0,0 +1,289 @@
+"""Long-form transcription: VAD-split chunks transcribed in parallel worker processes"""
+
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import vad
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = vad.SAMPLE_RATE
+MAX_CHUNK_SECONDS = 30.0
+
+# Languages written without spaces between words
+UNSPACED_LANGUAGES = {'zh', 'yue', 'ja', 'th', 'lo', 'my', 'km', 'bo'}
+
+# Set in each worker process by _init_worker(); the load time is reported with the
+# worker's first chunk
+_pool_model = None
+_pool_load_seconds = 0.0
+
+# Worker pool kept between recordings: (model_name, workers) key, executor, log listener
+_pool_lock = threading.Lock()
+_pool = None
+
+
+def split_at_pauses(audio, max_seconds=MAX_CHUNK_SECONDS, min_seconds=10.0):
+    """
+    Split a clip into chunks of at most max_seconds, cutting in the middle of pauses.
+
+    Pauses come from the energy VAD. A chunk is closed at the last pause that keeps it
+    under max_seconds once it is at least min_seconds long; speech that runs longer than
+    max_seconds without a pause is cut hard.
+
+    Returns:
+        List of (start, end) sample ranges covering the clip
+    """
+    max_samples = int(max_seconds * SAMPLE_RATE)
+    min_samples = int(min_seconds * SAMPLE_RATE)
+    regions = vad.speech_regions(audio)
+
+    # Candidate cut points: middle of every gap between speech regions
+    cuts = [(end + next_start) // 2 for (_, end), (next_start, _) in zip(regions, regions[1:])]
+
+    chunks = []
+    start = 0
+    while len(audio) - start > max_samples:
+        candidates = [c for c in cuts if start + min_samples <= c <= start + max_samples]
+        end = candidates[-1] if candidates else start + max_samples
+        chunks.append((start, end))
+        start = end
+    chunks.append((start, len(audio)))
+    return chunks
+
+
+def _normalize_word(word):
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def merge_texts(texts, max_overlap_words=6, language=None):
+    """
+    Join chunk texts in order, dropping words repeated across a chunk boundary.
+
+    Whisper sometimes transcribes a word cut at the boundary in both chunks; the longest
+    run of up to max_overlap_words at the end of one chunk that reappears at the start
+    of the next is removed from the next chunk. Texts in UNSPACED_LANGUAGES have no
+    words to compare and are joined as they are, without spaces.
+    """
+    if language in UNSPACED_LANGUAGES:
+        return "".join(text.strip() for text in texts)
+
+    words = []
+    for text in texts:
+        new_words = text.split()
+        if not new_words:
+            continue
+        tail = [_normalize_word(w) for w in words[-max_overlap_words:]]
+        head = [_normalize_word(w) for w in new_words[:max_overlap_words]]
+        overlap = 0
+        for n in range(min(len(tail), len(head)), 0, -1):
+            if tail[-n:] == head[:n] and any(tail[-n:]):
+                overlap = n
+                break
+        words.extend(new_words[overlap:])
+    return " ".join(words)
+
+
+def can_parallelize(model):
+    """
+    Whether worker processes can load the same weights as model: a named whisper
+    checkpoint on the CPU, with fast model loading enabled so workers map one shared copy
+    """
+    import whisper
+    from . import fast_load
+    from .settings import Settings
+
+    return (isinstance(model, whisper.model.Whisper) and model.device.type == 'cpu'
+            and getattr(model, 'checkpoint_name', None) in whisper._MODELS
+            and fast_load.is_available() and Settings().get_fast_load_enabled())
+
+
+class _ParentLogHandler(logging.Handler):
+    """Hands records from worker processes to the parent's loggers"""
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def _init_worker(model_name, threads_per_worker, log_queue):
+    global _pool_model, _pool_load_seconds
+
+    # Workers log through the parent, whose handlers run in its own writer thread
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(logging.INFO)
+
+    # A fresh process: set before torch starts its thread pools
+    import torch
+    from . import fast_load
+    torch.set_num_threads(threads_per_worker)
+    start_time = time.monotonic()
+    _pool_model = fast_load.load_model(model_name, 'cpu')
+    _pool_load_seconds = time.monotonic() - start_time
+
+
+def _transcribe_chunk(chunk, options):
+    global _pool_load_seconds
+    from .transcriber import transcribe_audio
+    load_seconds, _pool_load_seconds = _pool_load_seconds, 0.0
+    start_time = time.monotonic()
+    result = transcribe_audio(_pool_model, chunk, **options)
+    return result, time.monotonic() - start_time, load_seconds, os.getpid()
+
+
+def _get_pool(model_name, workers, threads_per_worker):
+    """
+    The worker pool for a model and worker count, started if there is none.
+
+    A pool for another model or count is shut down first. Workers load the model once,
+    when they start, and keep it for later recordings.
+
+    Returns:
+        (executor, whether it was already running)
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool[0] == (model_name, workers):
+            return _pool[1], True
+        _shutdown_locked()
+
+        context = multiprocessing.get_context('forkserver')
+        log_queue = context.Queue()
+        log_listener = logging.handlers.QueueListener(log_queue, _ParentLogHandler())
+        log_listener.start()
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                       initializer=_init_worker,
+                                       initargs=(model_name, threads_per_worker, log_queue))
+        _pool = ((model_name, workers), executor, log_listener, log_queue)
+        return executor, False
+
+
+def _shutdown_locked():
+    global _pool
+    if _pool is None:
+        return
+    (model_name, workers), executor, log_listener, log_queue = _pool
+    _pool = None
+    # Chunks already submitted still finish
+    executor.shutdown(wait=False)
+    log_listener.stop()
+    log_queue.close()
+    logger.info(f"Stopped {workers} long-form workers for {model_name}")
+
+
+def shutdown_pool(model_name=None):
+    """Stop the long-form worker processes, or only those running model_name"""
+    with _pool_lock:
+        if _pool is not None and model_name in (None, _pool[0][0]):
+            _shutdown_locked()
+
+
+atexit.register(shutdown_pool)
+
+
+def transcribe_long(model, audio, language=None, workers=2, profile='balanced', prompt=None):
+    """
+    Transcribe a long clip by splitting it at pauses and decoding chunks in parallel.
+
+    Workers come from a forkserver, not forked from this multithreaded process (Qt,
+    PortAudio, torch's thread pools): each loads the model by name from its
+    memory-mapped safetensors copy (see fast_load), so the weights are shared through
+    the page cache, and gets cpu_count // workers intra-op threads. Worker log records
+    are forwarded to this process. The model must pass can_parallelize().
+
+    The pool stays up for the next recording with the same model and worker count, until
+    shutdown_pool() (called when the model is unloaded, and at exit).
+
+    Returns:
+        Result dict like whisper's transcribe(), with segment times relative to the clip,
+        the summed "fallbacks", per-chunk timings under "chunks" (with the model load
+        time a newly started worker paid before the chunk under "load"), the total of
+        those load times under "worker_load" and whether the pool was reused
+    """
+    from . import fast_load
+
+    model_name = model.checkpoint_name
+    chunks = split_at_pauses(audio)
+    workers = max(1, min(workers, len(chunks)))
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    logger.info(f"Long-form transcription: {len(audio) / SAMPLE_RATE:.0f}s in {len(chunks)} "
+                f"chunks across {workers} processes x {threads_per_worker} threads")
+
+    # Convert once here rather than racing in every worker
+    if not fast_load.is_converted(model_name):
+        fast_load.convert(model_name)
+
+    pool, reused = _get_pool(model_name, workers, threads_per_worker)
+    options = {'language': language, 'profile': profile, 'prompt': prompt}
+    pieces = [audio[start:end] for start, end in chunks]
+    outputs = list(pool.map(_transcribe_chunk, pieces, [options] * len(pieces)))
+
+    segments = []
+    texts = []
+    chunk_stats = []
+    fallbacks = 0
+    detected_language = language
+    for (start, end), (result, elapsed, load_seconds, pid) in zip(chunks, outputs):
+        offset = start / SAMPLE_RATE
+        for segment in result.get('segments', []):
+            segments.append({**segment, 'start': segment['start'] + offset,
+                             'end': segment['end'] + offset})
+        texts.append(result['text'].strip())
+        fallbacks += result.get('fallbacks', 0)
+        detected_language = detected_language or result.get('language')
+        chunk_stats.append({'start': offset, 'end': end / SAMPLE_RATE,
+                            'elapsed': elapsed, 'load': load_seconds, 'pid': pid})
+
+    worker_load = sum(stats['load'] for stats in chunk_stats)
+    if worker_load:
+        logger.info(f"Long-form workers spent {worker_load:.1f}s loading {model_name}")
+
+    return {
+        'text': merge_texts(texts, language=detected_language),
+        'segments': segments,
+        'language': detected_language,
+        'fallbacks': fallbacks,
+        'chunks': chunk_stats,
+        'worker_load': worker_load,
+        'pool_reused': reused,
+    }
+
+
+def benchmark_workers(model, audio, worker_counts=(1, 2, 4), language='en', profile='fast'):
+    """Measure long-form wall time and speedup over worker counts"""
+    results = []
+    baseline = None
+    for workers in worker_counts:
+        start_time = time.perf_counter()
+        transcribe_long(model, audio, language, workers, profile)
+        elapsed = time.perf_counter() - start_time
+        baseline = baseline or elapsed
+        results.append({'workers': workers, 'seconds': elapsed, 'speedup': baseline / elapsed})
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    import whisper
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3:
+        print("Usage: python -m telly_spelly.longform MODEL AUDIO_FILE [WORKERS,...]")
+        sys.exit(1)
+    counts = [int(n) for n in sys.argv[3].split(',')] if len(sys.argv) > 3 else [1, 2, 4]
+    clip = whisper.load_audio(sys.argv[2]).astype(np.float32)
+    cli_model = whisper.load_model(sys.argv[1], device='cpu')
+    cli_model.checkpoint_name = sys.argv[1]
+    for row in benchmark_workers(cli_model, clip, counts):
+        print(f"{row['workers']} workers: {row['seconds']:.1f}s (x{row['speedup']:.2f})")
@@ -1,4 +1,5 @@
 import sys
+import argparse
 
 # Initialize D-Bus GLib main loop BEFORE importing Qt
 # This is required for proper D-Bus/Qt integration
@@ -17,80 +18,50 @@ from .transcriber import WhisperTranscriber
 from PyQt6.QtCore import pyqtSignal
 import warnings
 import ctypes
+import multiprocessing
 import os
 from .shortcuts import GlobalShortcuts
 from .settings import Settings
 from .install import install_silent
+from .telemetry import telemetry
+from .profiler import profiler
+from .memory import accounting
+from .journal import (JournalHandler, NativeJournalHandler, journal_socket_available,
+                      start_queue_logging)
 from . import gpu
 # from mic_debug import MicDebugWindow
 
-# Setup logging with systemd journal support
-class JournalHandler(logging.Handler):
-    """Custom journal handler that writes to systemd journal"""
-
-    def __init__(self):
-        super().__init__()
-        self.level = logging.INFO
-
-    def emit(self, record):
-        try:
-            import sys
-            # Format message
-            msg = self.format(record)
-
-            # Write to stdout which systemd captures
-            # Add prefix for systemd to categorize
-            prefix = ""
-            if record.levelno >= logging.ERROR:
-                prefix = "<3>"  # Error
-            elif record.levelno >= logging.WARNING:
-                prefix = "<4>"  # Warning
-            elif record.levelno >= logging.INFO:
-                prefix = "<6>"  # Info
-            else:
-                prefix = "<7>"  # Debug
-
-            # Write to stdout with systemd priority prefix
-            sys.stdout.write(f"{prefix}telly-spelly: {msg}\n")
-            sys.stdout.flush()
-
-        except Exception:
-            self.handleError(record)
-
 def setup_logging():
-    """Setup logging that works well with systemd"""
-    import logging
-    import sys
+    """Setup logging that works well with systemd; records are written by a background thread"""
+    # Long-form worker processes import this module too; they log through the parent
+    if multiprocessing.parent_process() is not None:
+        return logging.getLogger(__name__)
 
     # Check if we're running under systemd
     running_under_systemd = 'INVOCATION_ID' in os.environ or 'JOURNAL_STREAM' in os.environ
 
     if running_under_systemd:
-        # Use systemd-friendly logging
-        journal_handler = JournalHandler()
+        # Structured entries on journald's native socket, or its stdout stream as fallback
+        if journal_socket_available():
+            journal_handler = NativeJournalHandler()
+        else:
+            journal_handler = JournalHandler()
         journal_handler.setLevel(logging.INFO)
-
-        formatter = logging.Formatter('%(message)s')
-        journal_handler.setFormatter(formatter)
-
-        root_logger = logging.getLogger()
-        root_logger.setLevel(logging.INFO)
-        root_logger.addHandler(journal_handler)
+        journal_handler.setFormatter(logging.Formatter('%(message)s'))
 
         # Also keep stderr for errors
         error_handler = logging.StreamHandler(sys.stderr)
         error_handler.setLevel(logging.ERROR)
         error_handler.setFormatter(logging.Formatter('ERROR: %(name)s: %(message)s'))
-        root_logger.addHandler(error_handler)
+        handlers = [journal_handler, error_handler]
 
     else:
         # Regular console logging for development
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(name)s: %(levelname)s: %(message)s',
-            stream=sys.stderr
-        )
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(logging.Formatter('%(name)s: %(levelname)s: %(message)s'))
+        handlers = [console_handler]
 
+    start_queue_logging(handlers, logging.INFO)
     return logging.getLogger(__name__)
 
 logger = setup_logging()
@@ -164,6 +135,7 @@ class TrayRecorder(QSystemTrayIcon):
         self.shortcuts.start_recording_triggered.connect(self.start_recording)
         self.shortcuts.stop_recording_triggered.connect(self.stop_recording)
         self.shortcuts.toggle_recording_triggered.connect(self.toggle_recording)
+        self.shortcuts.retry_triggered.connect(self.retry_transcription)
 
     def initialize(self):
         """Initialize the tray recorder after showing loading window"""
@@ -202,6 +174,18 @@ class TrayRecorder(QSystemTrayIcon):
         self.record_action = QAction("Start Recording", menu)
         self.record_action.triggered.connect(self.toggle_recording)
         menu.addAction(self.record_action)
+
+        # Decode the last recording again with another language or profile
+        self.retry_menu = menu.addMenu("Retry Last Recording")
+        for code in Settings().get_language_candidates():
+            action = self.retry_menu.addAction(f"As {Settings.VALID_LANGUAGES[code]}")
+            action.triggered.connect(lambda checked, code=code: self.retry_transcription(code, ""))
+        self.retry_menu.addSeparator()
+        for profile in Settings.DECODING_PROFILES:
+            action = self.retry_menu.addAction(f"With {profile.capitalize()} Decoding")
+            action.triggered.connect(
+                lambda checked, profile=profile: self.retry_transcription("", profile))
+        menu.aboutToShow.connect(self.update_retry_menu)
         
         # Add settings action
         self.settings_action = QAction("Settings", menu)
@@ -263,6 +247,9 @@ class TrayRecorder(QSystemTrayIcon):
             self.record_action.setText("Stop Recording")
             self.setIcon(self.recording_icon)
             self.recorder.start_recording()
+            # An idle-unloaded model loads while the user speaks
+            if self.transcriber:
+                self.transcriber.prepare()
 
     def stop_recording(self):
         """Handle stopping the recording and starting processing"""
@@ -325,7 +312,8 @@ class TrayRecorder(QSystemTrayIcon):
             self.progress_window.set_status("Starting transcription...")
         
         if self.transcriber:
-            self.transcriber.transcribe_file(audio_file)
+            self.transcriber.transcribe_file(audio_file,
+                                             self.recorder.take_features(audio_file))
         else:
             logger.error("Transcriber not initialized")
             if self.progress_window:
@@ -353,18 +341,80 @@ class TrayRecorder(QSystemTrayIcon):
             self.showMessage("Transcription Complete", 
                            "Text has been copied to clipboard",
                            self.normal_icon)
+        telemetry.delivered(copied=bool(text))
+        accounting.after_dictation()
+        self.update_tooltip()
         
-        # Close the progress window
-        if self.progress_window:
+        # Close the progress window, unless it belongs to a newer recording
+        if self.progress_window and not self.recording:
             self.progress_window.close()
             self.progress_window = None
     
+    def update_tooltip(self):
+        """Show the memory breakdown, and any growth warning, in the tray tooltip"""
+        lines = ["Telly Spelly", accounting.format(accounting.snapshot())]
+        if accounting.last_warning:
+            lines.append(f"Warning: {accounting.last_warning}")
+        self.setToolTip("\n".join(lines))
+
+    def setup_memory_accounting(self):
+        """Register the recorder's and transcriber's memory with the accounting"""
+        manager = self.transcriber.model_manager
+        accounting.register('models', manager.memory_usage)
+        accounting.register('models (VRAM)', lambda: manager.memory_usage(vram=True),
+                            in_rss=False)
+        accounting.register('capture buffers', self.recorder.memory_usage)
+        accounting.register('caches', self.transcriber.memory_usage)
+        accounting.register('caches (VRAM)', lambda: self.transcriber.memory_usage(vram=True),
+                            in_rss=False)
+        manager.models_changed.connect(self.update_tooltip)
+        self.update_tooltip()
+
+    def handle_transcription_draft(self, text):
+        """Two-pass mode: put the fast model's draft in the clipboard right away"""
+        QApplication.clipboard().setText(text)
+        telemetry.delivered()
+        self.showMessage("Draft Ready",
+                         "Draft copied to clipboard, refining...",
+                         self.normal_icon)
+
+        # The user can go on; the refinement arrives in the background
+        if self.progress_window and not self.recording:
+            self.progress_window.close()
+            self.progress_window = None
+
+    def handle_transcription_refined(self, draft, text):
+        """Two-pass mode: replace the draft with the final text if it is still in the clipboard"""
+        if not text or text == draft:
+            return
+        clipboard = QApplication.clipboard()
+        if clipboard.text() != draft:
+            logger.info("Clipboard changed since the draft, keeping it")
+            return
+        clipboard.setText(text)
+        self.showMessage("Transcription Refined",
+                         "The clipboard now holds the refined text",
+                         self.normal_icon)
+
     def handle_transcription_error(self, error):
         QMessageBox.critical(None, "Transcription Error", error)
-        if self.progress_window:
+        if self.progress_window and not self.recording:
             self.progress_window.close()
             self.progress_window = None
 
+    def update_retry_menu(self):
+        self.retry_menu.setEnabled(bool(self.transcriber
+                                        and self.transcriber.encoder_cache.last()))
+
+    def retry_transcription(self, language, profile):
+        """Transcribe the last recording again; empty arguments keep the last setting"""
+        if not self.transcriber or not self.transcriber.retry_last(language or None,
+                                                                    profile or None):
+            self.showMessage("Nothing to Retry", "No recent recording is available",
+                             self.normal_icon)
+            return
+        self.showMessage("Retrying", "Decoding the last recording again...", self.normal_icon)
+
     def start_recording(self):
         """Start a new recording"""
         logger.info("TrayRecorder: start_recording called")
@@ -403,6 +453,29 @@ def check_already_running():
     except Exception:
         return False
 
+def parse_arguments(argv):
+    """Parse command-line options, leaving arguments meant for Qt alone"""
+    parser = argparse.ArgumentParser(prog='telly-spelly')
+    parser.add_argument('--profile', type=int, metavar='SECONDS',
+                        help="Sample thread stacks for SECONDS (in the running instance, if any)")
+    parser.add_argument('--profile-transcriptions', type=int, default=1, metavar='N',
+                        help="Also trace the next N transcriptions with torch's profiler")
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+def start_profiling_in_running_instance(seconds, transcriptions):
+    """Ask the running instance to profile itself; returns its output directory or None"""
+    try:
+        import dbus
+        from .desktop_env import get_dbus_service_name
+        bus = dbus.SessionBus()
+        dbus_service = get_dbus_service_name()
+        proxy = bus.get_object(dbus_service, '/TellySpelly')
+        return str(proxy.StartProfiling(seconds, transcriptions, dbus_interface=dbus_service))
+    except Exception as e:
+        logger.error(f"Could not start profiling in the running instance: {e}")
+        return None
+
 def send_notification(title, message, timeout_ms=20000, replaces_id=0):
     """Send a desktop notification via D-Bus"""
     try:
@@ -431,11 +504,19 @@ def close_notification(notification_id):
 
 def main():
     try:
+        args = parse_arguments(sys.argv[1:])
         app = QApplication(sys.argv)
         setup_application_metadata()
 
         # Check if already running
         if check_already_running():
+            if args.profile is not None:
+                directory = start_profiling_in_running_instance(args.profile,
+                                                                args.profile_transcriptions)
+                if directory is None:
+                    return 1
+                print(f"Profiling the running instance, output in {directory}")
+                return 0
             send_notification('Telly Spelly', 'Already running. Check your system tray.', 3000)
             return 0
 
@@ -447,11 +528,12 @@ def main():
         settings = Settings()
         force_cpu = settings.get_force_cpu()
 
-        # Always check GPU availability (it may have changed since last run)
-        if force_cpu:
-            config = gpu.detect_and_configure(force_cpu=True)
-        else:
-            config = gpu.detect_and_configure()
+        # Always check GPU availability (it may have changed since last run);
+        # measured benchmarks for the device replace the static VRAM table
+        config = gpu.detect_and_configure(
+            force_cpu=force_cpu,
+            benchmarks={device: settings.get_model_benchmarks(device) for device in ('cpu', 'cuda')},
+            latency_target=settings.get_latency_target())
 
         # Check if hardware situation changed
         previous_gpu_memory = settings.get_gpu_memory()
@@ -486,6 +568,9 @@ def main():
             send_notification('Telly Spelly', 'Error: System tray not available.', 5000)
             return 1
 
+        if args.profile is not None:
+            profiler.start(args.profile, args.profile_transcriptions)
+
         # Create tray icon but don't initialize yet
         tray = TrayRecorder()
 
@@ -529,6 +614,8 @@ def initialize_tray(tray, startup_notification_id, app):
 
         # Initialize transcriber
         tray.transcriber = WhisperTranscriber()
+        telemetry.textfile = Settings().get_metrics_textfile() or None
+        tray.setup_memory_accounting()
 
         # Connect signals
         tray.recorder.volume_updated.connect(tray.update_volume_meter)
@@ -538,6 +625,8 @@ def initialize_tray(tray, startup_notification_id, app):
         tray.transcriber.transcription_progress.connect(tray.update_processing_status)
         tray.transcriber.transcription_finished.connect(tray.handle_transcription_finished)
         tray.transcriber.transcription_error.connect(tray.handle_transcription_error)
+        tray.transcriber.transcription_draft.connect(tray.handle_transcription_draft)
+        tray.transcriber.transcription_refined.connect(tray.handle_transcription_refined)
 
         # Make tray visible
         tray.setVisible(True)
@@ -0,0 +1,170 @@
+"""Process memory accounting: what the resident memory is made of, and whether it grows from
+one dictation to the next
+
+Run with: python -m telly_spelly.memory [--model NAME]
+"""
+
+import argparse
+import ctypes
+import logging
+import threading
+from collections import deque
+
+from .model_manager import current_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+
+
+class _MallInfo2(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_size_t) for name in (
+        'arena', 'ordblks', 'smblks', 'hblks', 'hblkhd', 'usmblks', 'fsmblks', 'uordblks',
+        'fordblks', 'keepcost')]
+
+
+def tensor_bytes(tensors):
+    """Bytes held by an iterable of tensors"""
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def allocator_usage():
+    """Heap memory freed by the program but still held by malloc (counted in RSS)"""
+    try:
+        mallinfo2 = ctypes.CDLL("libc.so.6").mallinfo2
+    except (OSError, AttributeError):
+        return {}
+    mallinfo2.restype = _MallInfo2
+    return {'malloc free heap': mallinfo2().fordblks}
+
+
+def cuda_allocator_usage():
+    """torch's CUDA allocator: tensors allocated and blocks cached for reuse"""
+    try:
+        import torch
+        if not torch.cuda.is_initialized():
+            return {}
+        allocated = torch.cuda.memory_allocated()
+        return {'torch allocated': allocated,
+                'torch cached': torch.cuda.memory_reserved() - allocated}
+    except ImportError:
+        return {}
+
+
+class MemoryAccounting:
+    """
+    Breaks the process's memory down by category and watches it across dictations.
+
+    Components register sources: callables returning {label: bytes}. Sources of memory
+    that is not part of RSS (VRAM) are registered with in_rss=False and reported apart.
+    Whatever RSS the sources do not explain is reported as 'unaccounted' (Python objects,
+    libraries, fragmentation).
+
+    After each dictation a snapshot is kept; if RSS rose by more than growth_threshold
+    over the last growth_dictations dictations, a warning names the categories that grew.
+    """
+
+    def __init__(self, growth_dictations=5, growth_threshold=200 * MB):
+        self.growth_dictations = growth_dictations
+        self.growth_threshold = growth_threshold
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=growth_dictations + 1)
+        self.last_warning = None
+        self.register('allocator', allocator_usage)
+        self.register('allocator (VRAM)', cuda_allocator_usage, in_rss=False)
+
+    def register(self, category, source, in_rss=True):
+        """Add (or replace) a category of memory"""
+        with self._lock:
+            self._sources[category] = (source, in_rss)
+
+    def snapshot(self):
+        """
+        Current memory by category.
+
+        Returns:
+            dict with 'rss', 'categories' and 'vram' ({category: {label: bytes}}),
+            'accounted' (RSS explained by the categories) and 'unaccounted'
+        """
+        with self._lock:
+            sources = list(self._sources.items())
+        report = {'rss': current_rss_bytes(), 'categories': {}, 'vram': {}}
+        for category, (source, in_rss) in sources:
+            try:
+                usage = {label: int(size) for label, size in source().items() if size}
+            except Exception as e:
+                logger.warning(f"Memory accounting for {category} failed: {e}")
+                continue
+            report['categories' if in_rss else 'vram'][category] = usage
+        report['accounted'] = sum(sum(usage.values())
+                                  for usage in report['categories'].values())
+        report['unaccounted'] = max(0, report['rss'] - report['accounted'])
+        return report
+
+    def after_dictation(self):
+        """Record memory after a dictation; returns a growth warning or None"""
+        report = self.snapshot()
+        logger.info(f"Memory after dictation: {self.format(report, multiline=False)}")
+        with self._lock:
+            self._history.append(report)
+            if len(self._history) < self._history.maxlen:
+                return None
+            first = self._history[0]
+            growth = report['rss'] - first['rss']
+            if growth <= self.growth_threshold or report['rss'] < max(
+                    r['rss'] for r in self._history):
+                return None
+            # Warn once per window of dictations
+            self._history.clear()
+            self._history.append(report)
+
+        def totals(r):
+            return {**{c: sum(u.values()) for c, u in r['categories'].items()},
+                    'unaccounted': r['unaccounted']}
+
+        before, after = totals(first), totals(report)
+        grown = sorted(((after[c] - before.get(c, 0), c) for c in after), reverse=True)
+        detail = ", ".join(f"{category} +{delta / MB:.0f} MB"
+                           for delta, category in grown if delta >= MB)
+        self.last_warning = (f"Memory grew {growth / MB:.0f} MB over the last "
+                             f"{self.growth_dictations} dictations"
+                             f"{f' ({detail})' if detail else ''}")
+        logger.warning(self.last_warning)
+        return self.last_warning
+
+    @staticmethod
+    def format(report, multiline=True):
+        """Human-readable summary of a snapshot"""
+        parts = [f"{category} {sum(usage.values()) / MB:.0f} MB"
+                 for category, usage in report['categories'].items() if usage]
+        parts.append(f"unaccounted {report['unaccounted'] / MB:.0f} MB")
+        vram = [f"{category} {sum(usage.values()) / MB:.0f} MB"
+                for category, usage in report['vram'].items() if usage]
+        summary = f"{report['rss'] / MB:.0f} MB resident"
+        if not multiline:
+            return f"{summary} ({', '.join(parts + vram)})"
+        lines = [f"Memory: {summary}"] + [f"  {part}" for part in parts]
+        if vram:
+            lines += ["VRAM:"] + [f"  {part}" for part in vram]
+        return "\n".join(lines)
+
+
+# Shared by the tray, the D-Bus service and the components reporting their buffers
+accounting = MemoryAccounting()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show this process's memory breakdown, "
+                                                 "optionally with a model loaded")
+    parser.add_argument('--model', help="Whisper model to load first, e.g. tiny")
+    args = parser.parse_args()
+
+    if args.model:
+        from .model_manager import load_model, model_size_bytes, select_device
+        device = select_device()
+        model = load_model(args.model, device=device)
+        accounting.register('models' if device == 'cpu' else 'models (VRAM)',
+                            lambda: {args.model: model_size_bytes(model)},
+                            in_rss=device == 'cpu')
+    print(MemoryAccounting.format(accounting.snapshot()))
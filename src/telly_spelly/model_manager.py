@@ -0,0 +1,518 @@
+"""Keeps several Whisper models resident under a memory budget with LRU eviction"""
+
+import gc
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+
+def select_device(force_cpu=False):
+    """Pick the torch device for inference: CUDA when available unless CPU is forced"""
+    if force_cpu:
+        return "cpu"
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+
+def load_model(model_name, backend='torch', device='cpu'):
+    """Load a model through the given backend on the given device"""
+    from .settings import Settings
+    if backend == 'onnx':
+        from . import onnx_backend
+        from .cpu_tuning import resolve_thread_config
+        threads = resolve_thread_config(Settings())['intra_op_threads']
+        return onnx_backend.load_model(model_name, num_threads=threads)
+
+    if Settings().get_fast_load_enabled():
+        from . import fast_load
+        model = fast_load.load_model(model_name, device)
+    else:
+        import whisper
+        model = whisper.load_model(model_name, device=device)
+    # Lets worker processes load the same weights by name (see longform)
+    model.checkpoint_name = model_name
+    return model
+
+
+def estimate_model_bytes(model_name, backend='torch'):
+    """Estimate the loaded size of a model from its cached checkpoint (0 if unknown)"""
+    if backend == 'onnx':
+        return 0
+    import whisper
+    from .settings import whisper_cache_dir
+    url = whisper._MODELS.get(model_name)
+    if url is None:
+        return 0
+    path = os.path.join(whisper_cache_dir(), os.path.basename(url))
+    # Checkpoints store fp16 weights; whisper builds the model in fp32
+    return os.path.getsize(path) * 2 if os.path.exists(path) else 0
+
+
+def current_rss_bytes():
+    """Resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class PeakMemoryMonitor:
+    """
+    Context manager measuring peak memory while a block runs.
+
+    RAM is sampled from /proc in a background thread; on CUDA devices torch's
+    allocator peak is used.
+    """
+
+    def __init__(self, device='cpu', interval=0.02):
+        self.device = device
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.device.startswith('cuda'):
+            import torch
+            torch.cuda.reset_peak_memory_stats()
+            self.baseline = torch.cuda.memory_allocated()
+        else:
+            self.baseline = self.peak = current_rss_bytes()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_bytes())
+
+    def __exit__(self, *exc):
+        if self.device.startswith('cuda'):
+            import torch
+            self.peak = torch.cuda.max_memory_allocated()
+        else:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, current_rss_bytes())
+        return False
+
+
+def model_size_bytes(model):
+    """Bytes held by a model's weights (parameters and buffers, or ONNX graph files)"""
+    if hasattr(model, 'parameters'):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    model_dir = getattr(model, 'model_dir', None)
+    if model_dir and os.path.isdir(model_dir):
+        return sum(os.path.getsize(os.path.join(model_dir, name))
+                   for name in os.listdir(model_dir))
+    return 0
+
+
+def total_memory_bytes(device):
+    """Total RAM, or VRAM for CUDA devices"""
+    if device.startswith('cuda'):
+        try:
+            import torch
+            return torch.cuda.get_device_properties(0).total_memory
+        except Exception:
+            return 0
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def free_device_memory():
+    """
+    Collect garbage, return freed heap pages to the system and release cached CUDA
+    blocks after dropping a model
+    """
+    gc.collect()
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+class ModelManager(QObject):
+    """
+    Resident model cache keyed by (model name, backend, device).
+
+    Models stay loaded until the per-device memory budget is exceeded (least recently
+    used first, never the active model) or, with idle_minutes set, until they have not
+    been used for that long. Evicted models are reloaded on demand by get().
+
+    Loading happens outside the lock, so looking up resident models (as the Qt main
+    thread does) never waits for a load or download running in a worker thread.
+    """
+
+    models_changed = pyqtSignal()
+    # Models unloaded for being idle: 'models', 'bytes' (weights) and 'rss_reclaimed'
+    idle_unloaded = pyqtSignal(dict)
+
+    def __init__(self, budget_gb=0, idle_minutes=0):
+        super().__init__()
+        self.budget_gb = budget_gb
+        self.idle_minutes = idle_minutes
+        self._models = OrderedDict()
+        self._lock = threading.RLock()
+        self.active_key = None
+        self.last_idle_unload = None
+        # Dropped models, weakly referenced, to show those something still holds on to
+        self._released = []
+        # Models being loaded: key -> {'done': Event, 'error': exception or None}
+        self._loading = {}
+        # Models evicted under the lock, to free once it is released
+        self._evicted = []
+
+        self._idle_timer = QTimer(self)
+        self._idle_timer.timeout.connect(self.unload_idle)
+        self._idle_timer.start(60 * 1000)
+
+    @staticmethod
+    def key(model_name, backend='torch', device='cpu'):
+        return (model_name, backend, 'cpu' if backend == 'onnx' else device)
+
+    def budget_bytes(self, device):
+        """Memory budget for a device; 0 in settings means half of RAM / 80% of VRAM"""
+        if self.budget_gb:
+            return int(self.budget_gb * GB)
+        fraction = 0.8 if device.startswith('cuda') else 0.5
+        return int(total_memory_bytes(device) * fraction)
+
+    def is_resident(self, model_name, backend='torch', device='cpu'):
+        with self._lock:
+            return self.key(model_name, backend, device) in self._models
+
+    def get_resident(self, model_name, backend='torch', device='cpu', activate=False):
+        """A resident model, or None if it is not loaded; never loads or waits"""
+        key = self.key(model_name, backend, device)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None:
+                return None
+            if activate:
+                entry['last_used'] = time.monotonic()
+                self._models.move_to_end(key)
+                self.active_key = key
+            return entry['model']
+
+    def get(self, model_name, backend='torch', device='cpu', activate=False):
+        """
+        Get a resident model, loading it (and evicting others) if needed.
+
+        Concurrent requests for a model that is being loaded wait for that load instead
+        of starting another.
+        """
+        key = self.key(model_name, backend, device)
+        while True:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    entry['last_used'] = time.monotonic()
+                    self._models.move_to_end(key)
+                    if activate:
+                        self.active_key = key
+                    return entry['model']
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._begin_loading(key)
+                    break
+            loading['done'].wait()
+            if loading['error'] is not None:
+                raise loading['error']
+
+        try:
+            logger.info(f"Loading {model_name} ({backend}) on {key[2]}")
+            start_time = time.monotonic()
+            model = load_model(model_name, backend, key[2])
+            size = model_size_bytes(model)
+            with self._lock:
+                self._add(key, model, time.monotonic() - start_time, size)
+                if activate:
+                    self.active_key = key
+        except Exception as e:
+            loading['error'] = e
+            raise
+        finally:
+            self._end_loading(key, loading)
+        self._release_evicted()
+        self.models_changed.emit()
+        return model
+
+    def _begin_loading(self, key):
+        """Mark a model as being loaded by the calling thread; the lock must be held"""
+        loading = {'done': threading.Event(), 'error': None}
+        self._loading[key] = loading
+        return loading
+
+    def _end_loading(self, key, loading):
+        with self._lock:
+            self._loading.pop(key, None)
+        loading['done'].set()
+
+    def put(self, model_name, model, backend='torch', device='cpu', activate=True,
+            load_seconds=0.0):
+        """Register an already loaded model"""
+        key = self.key(model_name, backend, device)
+        size = model_size_bytes(model)
+        with self._lock:
+            replaced = self._models.pop(key, None)
+            if replaced is not None and replaced['model'] is not model:
+                self._track_released(key, replaced)
+            entry = self._add(key, model, load_seconds, size)
+            if activate:
+                self.active_key = key
+        self._release_evicted()
+        self.models_changed.emit()
+        return entry['model']
+
+    def _add(self, key, model, load_seconds, size):
+        """Register a loaded model, evicting others to fit; the lock must be held"""
+        self._enforce_budget(key[2], size, exclude=key)
+        entry = {
+            'model': model,
+            'size': size,
+            'last_used': time.monotonic(),
+            'load_seconds': load_seconds,
+        }
+        self._models[key] = entry
+        logger.info(f"Model {key[0]} ({key[1]}, {key[2]}) resident: {size / GB:.2f} GB, "
+                    f"loaded in {load_seconds:.1f}s")
+        return entry
+
+    def _enforce_budget(self, device, incoming, exclude=None, warn=True):
+        budget = self.budget_bytes(device)
+        if not budget:
+            return
+        used = sum(e['size'] for k, e in self._models.items() if k[2] == device)
+        for key in list(self._models):
+            if used + incoming <= budget:
+                break
+            if key[2] != device or key in (self.active_key, exclude):
+                continue
+            entry = self._pop(key)
+            used -= entry['size']
+            self._evicted.append((key, entry['size'], "memory budget"))
+        if warn and used + incoming > budget:
+            logger.warning(f"Model memory budget exceeded on {device}: "
+                           f"{(used + incoming) / GB:.2f} GB of {budget / GB:.2f} GB")
+
+    def swap(self, model_name, backend='torch', device='cpu', progress=None):
+        """
+        Load a model to replace the active one without doubling peak memory.
+
+        If both models fit the budget the new one is loaded alongside the old. Otherwise
+        other models are evicted first; if that is not enough the old model is dropped
+        before loading. Running transcriptions hold their own reference and finish on the
+        old model.
+
+        The new model is registered but not activated.
+
+        Returns:
+            (model, stats) where stats has 'strategy', 'seconds', 'peak_bytes' and
+            'baseline_bytes'
+        """
+        key = self.key(model_name, backend, device)
+        start_time = time.monotonic()
+        with self._lock:
+            resident = key in self._models or key in self._loading
+            if not resident:
+                loading = self._begin_loading(key)
+        if resident:
+            # Already loaded, or being loaded by another thread
+            return self.get(model_name, backend, key[2]), {
+                'strategy': 'resident', 'seconds': 0.0, 'peak_bytes': 0,
+                'baseline_bytes': 0}
+        try:
+            return self._swap(key, progress, start_time)
+        except Exception as e:
+            loading['error'] = e
+            raise
+        finally:
+            self._end_loading(key, loading)
+
+    def _swap(self, key, progress, start_time):
+        model_name, backend = key[0], key[1]
+        incoming = estimate_model_bytes(model_name, backend)
+        with self._lock:
+            self._enforce_budget(key[2], incoming, exclude=key, warn=False)
+            budget = self.budget_bytes(key[2])
+            used = sum(e['size'] for k, e in self._models.items() if k[2] == key[2])
+            strategy = 'alongside'
+            active = self.active_key if self.active_key in self._models else None
+            if budget and incoming and used + incoming > budget and active:
+                strategy = 'unload-first'
+        # Free what was evicted before loading the new weights
+        self._release_evicted()
+
+        logger.info(f"Swapping to {model_name} ({backend}, {key[2]}): {strategy}")
+        with PeakMemoryMonitor(key[2]) as monitor:
+            if strategy == 'unload-first':
+                if progress:
+                    progress(f"Unloading {active[0]} to make room for {model_name}...")
+                self.unload(*active, reason="making room for swap")
+            model = load_model(model_name, backend, key[2])
+            size = model_size_bytes(model)
+            with self._lock:
+                self._add(key, model, time.monotonic() - start_time, size)
+            self._release_evicted()
+            self.models_changed.emit()
+
+        stats = {
+            'strategy': strategy,
+            'seconds': time.monotonic() - start_time,
+            'peak_bytes': monitor.peak,
+            'baseline_bytes': monitor.baseline,
+        }
+        with self._lock:
+            if key in self._models:
+                self._models[key]['load_seconds'] = stats['seconds']
+        logger.info(f"Swapped to {model_name} via {strategy} in {stats['seconds']:.1f}s, "
+                    f"peak memory {monitor.peak / GB:.2f} GB "
+                    f"(+{(monitor.peak - monitor.baseline) / GB:.2f} GB)")
+        return model, stats
+
+    def unload(self, model_name, backend='torch', device='cpu', reason="requested"):
+        """Drop a model; running transcriptions keep their own reference until done"""
+        key = self.key(model_name, backend, device)
+        with self._lock:
+            entry = self._pop(key)
+        if entry is None:
+            return 0
+        size = entry['size']
+        del entry
+        if backend == 'torch':
+            # Long-form workers hold their own copy of the model
+            from .longform import shutdown_pool
+            shutdown_pool(model_name)
+        free_device_memory()
+        logger.info(f"Unloaded {model_name} ({backend}, {device}), {reason}: "
+                    f"{size / GB:.2f} GB released")
+        self.models_changed.emit()
+        return size
+
+    def unload_idle(self):
+        """
+        Unload models unused for idle_minutes.
+
+        Returns:
+            dict with the unloaded 'models', their weight 'bytes' and the drop in
+            resident memory ('rss_reclaimed'), or None if nothing was idle
+        """
+        if not self.idle_minutes:
+            return None
+        cutoff = time.monotonic() - self.idle_minutes * 60
+        with self._lock:
+            idle = [key for key, entry in self._models.items() if entry['last_used'] < cutoff]
+        if not idle:
+            return None
+        rss_before = current_rss_bytes()
+        size = sum(self.unload(*key, reason=f"idle for {self.idle_minutes} min")
+                   for key in idle)
+        report = {
+            'models': [key[0] for key in idle],
+            'bytes': size,
+            'rss_reclaimed': max(0, rss_before - current_rss_bytes()),
+            'idle_minutes': self.idle_minutes,
+        }
+        logger.info(f"Idle unload of {', '.join(report['models'])}: "
+                    f"{size / GB:.2f} GB of weights, "
+                    f"{report['rss_reclaimed'] / GB:.2f} GB resident memory reclaimed")
+        self.last_idle_unload = report
+        self.idle_unloaded.emit(report)
+        return report
+
+    def _pop(self, key):
+        """Remove a model's entry, or return None; the lock must be held"""
+        entry = self._models.pop(key, None)
+        if entry is not None:
+            if key == self.active_key:
+                self.active_key = None
+            self._track_released(key, entry)
+        return entry
+
+    def _release_evicted(self):
+        """Free the memory of models evicted for the budget, outside the lock"""
+        with self._lock:
+            evicted, self._evicted = self._evicted, []
+        if not evicted:
+            return
+        free_device_memory()
+        for key, size, reason in evicted:
+            logger.info(f"Unloaded {key[0]} ({key[1]}, {key[2]}), {reason}: "
+                        f"{size / GB:.2f} GB released")
+        self.models_changed.emit()
+
+    def _track_released(self, key, entry):
+        try:
+            self._released.append((weakref.ref(entry['model']), key, entry['size']))
+        except TypeError:
+            pass
+
+    def memory_usage(self, vram=False):
+        """
+        Bytes of weights by model, in RAM or (vram=True) on CUDA devices. Dropped models
+        that are still referenced somewhere (a running transcription, a settings window
+        that loaded them) are listed as unreleased.
+        """
+        usage = {}
+        with self._lock:
+            self._released = [item for item in self._released if item[0]() is not None]
+            for key, entry in self._models.items():
+                if key[2].startswith('cuda') == vram:
+                    usage[f"{key[0]} [{key[1]}, {key[2]}]"] = entry['size']
+            for ref, key, size in self._released:
+                if key[2].startswith('cuda') == vram and ref() not in (
+                        entry['model'] for entry in self._models.values()):
+                    label = f"{key[0]} [{key[1]}, {key[2]}] unreleased"
+                    usage[label] = usage.get(label, 0) + size
+        return usage
+
+    def resident(self):
+        """List resident models as dicts, most recently used last"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'name': key[0],
+                'backend': key[1],
+                'device': key[2],
+                'size': entry['size'],
+                'idle_seconds': now - entry['last_used'],
+                'active': key == self.active_key,
+            } for key, entry in self._models.items()]
+
+    def summary(self):
+        """One line per resident model for display"""
+        lines = []
+        for info in self.resident():
+            marker = " (active)" if info['active'] else ""
+            lines.append(f"{info['name']} [{info['backend']}, {info['device']}]: "
+                         f"{info['size'] / GB:.2f} GB{marker}")
+        if not lines and self.last_idle_unload:
+            report = self.last_idle_unload
+            return (f"No models loaded (unloaded after {report['idle_minutes']} min idle, "
+                    f"{report['rss_reclaimed'] / GB:.2f} GB reclaimed)")
+        return "\n".join(lines) if lines else "No models loaded"
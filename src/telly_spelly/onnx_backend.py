@@ -0,0 +1,452 @@
+"""ONNX Runtime execution path for Whisper models (CPU-only deployments)"""
+
+import json
+import logging
+import os
+from dataclasses import asdict
+
+import numpy as np
+
+from .settings import whisper_cache_dir
+
+logger = logging.getLogger(__name__)
+
+ENCODER_FILE = "encoder.onnx"
+DECODER_FILE = "decoder.onnx"
+DIMS_FILE = "dims.json"
+
+ONNX_OPSET = 17
+
+
+def get_onnx_dir(model_name):
+    """
+    Get the directory holding the exported graphs for a model; they live next to the
+    PyTorch checkpoints, one directory per model
+    """
+    return os.path.join(whisper_cache_dir(), "onnx", model_name)
+
+
+def is_onnx_exported(model_name):
+    """Check if a model has already been exported to ONNX"""
+    model_dir = get_onnx_dir(model_name)
+    return all(
+        os.path.exists(os.path.join(model_dir, name))
+        for name in (ENCODER_FILE, DECODER_FILE, DIMS_FILE)
+    )
+
+
+def _attention(attn, x, k, v, mask=None):
+    """Multi-head attention with explicit key/value tensors (mirrors whisper's qkv_attention)"""
+    import torch
+
+    q = attn.query(x)
+    n_batch, n_ctx, n_state = q.shape
+    scale = (n_state // attn.n_head) ** -0.25
+    q = q.view(n_batch, n_ctx, attn.n_head, -1).permute(0, 2, 1, 3)
+    k = k.view(n_batch, k.shape[1], attn.n_head, -1).permute(0, 2, 1, 3)
+    v = v.view(n_batch, v.shape[1], attn.n_head, -1).permute(0, 2, 1, 3)
+
+    qk = (q * scale) @ (k * scale).transpose(-1, -2)
+    if mask is not None:
+        qk = qk + mask
+    w = torch.softmax(qk.float(), dim=-1).to(q.dtype)
+    out = (w @ v).permute(0, 2, 1, 3).flatten(start_dim=2)
+    return attn.out(out)
+
+
+def _build_export_modules(model):
+    """Wrap a Whisper model into encoder/decoder modules with explicit KV-cache tensors"""
+    import torch
+    from torch import nn
+
+    class EncoderWrapper(nn.Module):
+        """mel -> stacked cross-attention keys/values of every decoder block"""
+
+        def __init__(self, model):
+            super().__init__()
+            self.encoder = model.encoder
+            self.decoder = model.decoder
+
+        def forward(self, mel):
+            audio_features = self.encoder(mel)
+            cross_kv = []
+            for block in self.decoder.blocks:
+                cross_kv.append(block.cross_attn.key(audio_features))
+                cross_kv.append(block.cross_attn.value(audio_features))
+            return torch.stack(cross_kv)
+
+    class DecoderWrapper(nn.Module):
+        """(tokens, cross kv, past self kv) -> (logits, present self kv)"""
+
+        def __init__(self, model):
+            super().__init__()
+            self.decoder = model.decoder
+
+        def forward(self, tokens, cross_kv, self_kv):
+            decoder = self.decoder
+            offset = self_kv.shape[2]
+            n_ctx = tokens.shape[-1]
+            x = (
+                decoder.token_embedding(tokens)
+                + decoder.positional_embedding[offset : offset + n_ctx]
+            )
+            mask = decoder.mask[offset : offset + n_ctx, : offset + n_ctx]
+
+            present = []
+            for i, block in enumerate(decoder.blocks):
+                h = block.attn_ln(x)
+                k = torch.cat([self_kv[2 * i], block.attn.key(h)], dim=1)
+                v = torch.cat([self_kv[2 * i + 1], block.attn.value(h)], dim=1)
+                present.append(k)
+                present.append(v)
+                x = x + _attention(block.attn, h, k, v, mask)
+                x = x + _attention(block.cross_attn, block.cross_attn_ln(x),
+                                   cross_kv[2 * i], cross_kv[2 * i + 1])
+                x = x + block.mlp(block.mlp_ln(x))
+
+            x = decoder.ln(x)
+            logits = x @ torch.transpose(decoder.token_embedding.weight, 0, 1)
+            return logits, torch.stack(present)
+
+    return EncoderWrapper(model).eval(), DecoderWrapper(model).eval()
+
+
+def _cpu_copy(model):
+    """fp32 CPU copy of a Whisper model, leaving the original on its device and dtype"""
+    import torch
+    import whisper
+
+    state = {name: tensor.detach().to("cpu", torch.float32 if tensor.is_floating_point()
+                                      else tensor.dtype)
+             for name, tensor in model.state_dict().items()}
+    copy = whisper.model.Whisper(model.dims)
+    copy.load_state_dict(state)
+    return copy.eval()
+
+
+def export_model(model, model_name, model_dir=None):
+    """
+    Export a loaded Whisper model's encoder and decoder to ONNX.
+
+    Args:
+        model: whisper.model.Whisper instance (any device; a CPU fp32 copy is exported)
+        model_name: name used for the cache directory
+        model_dir: directory to write to instead of the cache directory
+
+    Returns:
+        Path of the directory containing the exported graphs
+    """
+    import torch
+
+    model_dir = model_dir or get_onnx_dir(model_name)
+    os.makedirs(model_dir, exist_ok=True)
+
+    model = _cpu_copy(model)
+    dims = model.dims
+    encoder, decoder = _build_export_modules(model)
+
+    n_frames = dims.n_audio_ctx * 2
+    mel = torch.zeros(1, dims.n_mels, n_frames)
+    tokens = torch.zeros(1, 3, dtype=torch.long)
+    cross_kv = torch.zeros(2 * dims.n_text_layer, 1, dims.n_audio_ctx, dims.n_text_state)
+    self_kv = torch.zeros(2 * dims.n_text_layer, 1, 1, dims.n_text_state)
+
+    # Write to temporary names first so an interrupted export is never mistaken for a cached one
+    encoder_path = os.path.join(model_dir, ENCODER_FILE)
+    decoder_path = os.path.join(model_dir, DECODER_FILE)
+
+    logger.info(f"Exporting {model_name} encoder to ONNX")
+    with torch.no_grad():
+        torch.onnx.export(
+            encoder, (mel,), encoder_path + ".tmp",
+            input_names=["mel"],
+            output_names=["cross_kv"],
+            dynamic_axes={"mel": {0: "batch"}, "cross_kv": {1: "batch"}},
+            opset_version=ONNX_OPSET,
+            dynamo=False,
+        )
+
+        logger.info(f"Exporting {model_name} decoder to ONNX")
+        torch.onnx.export(
+            decoder, (tokens, cross_kv, self_kv), decoder_path + ".tmp",
+            input_names=["tokens", "cross_kv", "self_kv"],
+            output_names=["logits", "present_kv"],
+            dynamic_axes={
+                "tokens": {0: "batch", 1: "n_tokens"},
+                "cross_kv": {1: "batch", 2: "n_audio_ctx"},
+                "self_kv": {1: "batch", 2: "n_past"},
+                "logits": {0: "batch", 1: "n_tokens"},
+                "present_kv": {1: "batch", 2: "n_total"},
+            },
+            opset_version=ONNX_OPSET,
+            dynamo=False,
+        )
+
+    os.replace(encoder_path + ".tmp", encoder_path)
+    os.replace(decoder_path + ".tmp", decoder_path)
+    with open(os.path.join(model_dir, DIMS_FILE), "w") as f:
+        json.dump(asdict(dims), f)
+
+    logger.info(f"ONNX export of {model_name} written to {model_dir}")
+    return model_dir
+
+
+class OnnxWhisper:
+    """Whisper inference through ONNX Runtime with a KV-cache-aware greedy decoder"""
+
+    def __init__(self, model_dir, num_threads=0):
+        import onnxruntime as ort
+        from whisper.model import ModelDimensions
+
+        with open(os.path.join(model_dir, DIMS_FILE)) as f:
+            self.dims = ModelDimensions(**json.load(f))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        providers = ["CPUExecutionProvider"]
+
+        self.encoder = ort.InferenceSession(
+            os.path.join(model_dir, ENCODER_FILE), options, providers=providers)
+        self.decoder = ort.InferenceSession(
+            os.path.join(model_dir, DECODER_FILE), options, providers=providers)
+        self.model_dir = model_dir
+        # Decoding options already warned about as ignored
+        self._warned = set()
+
+    @property
+    def device(self):
+        return "cpu"
+
+    @property
+    def is_multilingual(self):
+        return self.dims.n_vocab >= 51865
+
+    @property
+    def num_languages(self):
+        return self.dims.n_vocab - 51765 - int(self.is_multilingual)
+
+    def get_tokenizer(self, language=None, task="transcribe"):
+        from whisper.tokenizer import get_tokenizer
+        return get_tokenizer(self.is_multilingual, num_languages=self.num_languages,
+                             language=language, task=task)
+
+    def encode(self, mel):
+        """Run the encoder on a (batch, n_mels, 3000) mel array, returning cross-attention KV"""
+        return self.encoder.run(None, {"mel": mel.astype(np.float32)})[0]
+
+    def decoder_step(self, tokens, cross_kv, self_kv):
+        """Run the decoder on new tokens, returning (logits, updated self-attention KV)"""
+        logits, present_kv = self.decoder.run(None, {
+            "tokens": tokens.astype(np.int64),
+            "cross_kv": cross_kv,
+            "self_kv": self_kv,
+        })
+        return logits, present_kv
+
+    def empty_kv(self, batch_size=1):
+        return np.zeros((2 * self.dims.n_text_layer, batch_size, 0, self.dims.n_text_state),
+                        dtype=np.float32)
+
+    def detect_language(self, cross_kv, tokenizer=None, candidates=None):
+        """Return (language code, probabilities) from the first decoder step"""
+        tokenizer = tokenizer or self.get_tokenizer()
+        logits, _ = self.decoder_step(np.array([[tokenizer.sot]]), cross_kv, self.empty_kv())
+        codes = list(tokenizer.all_language_codes)
+        language_tokens = list(tokenizer.all_language_tokens)
+        if candidates:
+            keep = [i for i, code in enumerate(codes) if code in set(candidates)]
+            codes = [codes[i] for i in keep]
+            language_tokens = [language_tokens[i] for i in keep]
+        language_logits = logits[0, -1, language_tokens]
+        probs = np.exp(language_logits - language_logits.max())
+        probs /= probs.sum()
+        language_probs = dict(zip(codes, probs.tolist()))
+        return max(language_probs, key=language_probs.get), language_probs
+
+    def greedy_decode(self, cross_kv, tokenizer, sample_len=None):
+        """Greedily decode one 30-second window; the prompt is fed once, then one token per step"""
+        sample_len = sample_len or self.dims.n_text_ctx // 2
+        initial_tokens = list(tokenizer.sot_sequence_including_notimestamps)
+        # Same suppression rules as whisper's DecodingTask with suppress_tokens="-1"
+        suppress = sorted(set(tokenizer.non_speech_tokens) | {
+            tokenizer.transcribe, tokenizer.translate, tokenizer.sot,
+            tokenizer.sot_prev, tokenizer.sot_lm,
+        } | ({tokenizer.no_speech} if tokenizer.no_speech is not None else set()))
+        blank = tokenizer.encode(" ") + [tokenizer.eot]
+
+        tokens = []
+        sum_logprob = 0.0
+        self_kv = self.empty_kv()
+        step_input = np.array([initial_tokens])
+        for i in range(sample_len):
+            logits, self_kv = self.decoder_step(step_input, cross_kv, self_kv)
+            logits = logits[0, -1].astype(np.float64)
+            logits[suppress] = -np.inf
+            if i == 0:
+                logits[blank] = -np.inf
+
+            token = int(np.argmax(logits))
+            logprobs = logits - (logits.max() + np.log(np.exp(logits - logits.max()).sum()))
+            sum_logprob += float(logprobs[token])
+            if token == tokenizer.eot:
+                break
+            tokens.append(token)
+            if len(initial_tokens) + len(tokens) >= self.dims.n_text_ctx:
+                break
+            step_input = np.array([[token]])
+
+        return tokens, sum_logprob / (len(tokens) + 1)
+
+    def _warn_ignored(self, options):
+        """Warn once per option when a profile or prompt asks for more than greedy decoding"""
+        temperature = options.get('temperature')
+        ignored = {
+            'beam search': options.get('beam_size'),
+            'best_of sampling': options.get('best_of'),
+            'temperature fallback': isinstance(temperature, (list, tuple)) and len(temperature) > 1,
+            'conditioning on previous text': options.get('condition_on_previous_text'),
+            'custom vocabulary prompt': options.get('initial_prompt'),
+        }
+        ignored = [name for name, value in ignored.items() if value and name not in self._warned]
+        if ignored:
+            self._warned.update(ignored)
+            logger.warning(f"The ONNX backend decodes greedily without a prompt; ignoring "
+                           f"{', '.join(ignored)}")
+
+    def transcribe(self, audio, language=None, sample_len=None, **kwargs):
+        """
+        Transcribe an audio file or 16 kHz waveform.
+
+        Long audio is cut into consecutive 30-second windows; the result dict mirrors the
+        "text"/"language"/"segments" keys of whisper's transcribe() so callers can treat both
+        backends alike. Unsupported decode options (fp16, beam_size, ...) are ignored, with
+        a warning for those that change the output.
+        """
+        from whisper.audio import (HOP_LENGTH, N_FRAMES, N_SAMPLES, SAMPLE_RATE,
+                                   load_audio, log_mel_spectrogram, pad_or_trim)
+
+        self._warn_ignored(kwargs)
+
+        if isinstance(audio, str):
+            audio = load_audio(audio)
+
+        # Same windowing as whisper's transcribe(): mel of the padded clip, sliced per window
+        mel = log_mel_spectrogram(audio, self.dims.n_mels, padding=N_SAMPLES)
+        content_frames = mel.shape[-1] - N_FRAMES
+
+        segments = []
+        texts = []
+        for seek in range(0, max(content_frames, 1), N_FRAMES):
+            segment_size = min(N_FRAMES, content_frames - seek)
+            mel_segment = pad_or_trim(mel[:, seek:seek + segment_size], N_FRAMES)
+            cross_kv = self.encode(mel_segment.numpy()[None])
+
+            if language is None:
+                if self.is_multilingual:
+                    language, _ = self.detect_language(cross_kv)
+                else:
+                    language = "en"
+
+            tokenizer = self.get_tokenizer(language=language)
+            tokens, avg_logprob = self.greedy_decode(cross_kv, tokenizer, sample_len)
+            text = tokenizer.decode([t for t in tokens if t < tokenizer.eot])
+            texts.append(text)
+            segments.append({
+                "start": seek * HOP_LENGTH / SAMPLE_RATE,
+                "end": (seek + segment_size) * HOP_LENGTH / SAMPLE_RATE,
+                "text": text,
+                "tokens": tokens,
+                "temperature": 0.0,
+                "avg_logprob": avg_logprob,
+            })
+
+        return {"text": "".join(texts), "segments": segments, "language": language}
+
+
+def load_model(model_name, device="cpu", num_threads=0):
+    """
+    Load a model through ONNX Runtime, exporting it from the PyTorch checkpoint on first use.
+
+    Args:
+        model_name: Whisper model name as used in Settings
+        device: ignored, ONNX Runtime always runs on the CPU provider here
+        num_threads: intra-op threads per session (0 = ONNX Runtime default)
+
+    Returns:
+        OnnxWhisper instance
+    """
+    if not is_onnx_exported(model_name):
+        import whisper
+        logger.info(f"No ONNX export of {model_name} found, exporting once")
+        torch_model = whisper.load_model(model_name, device="cpu")
+        export_model(torch_model, model_name)
+        del torch_model
+
+    return OnnxWhisper(get_onnx_dir(model_name), num_threads)
+
+
+def compare_with_torch(model_name, audio_files, language="en"):
+    """
+    Parity check of the ONNX path against the PyTorch path on fixed audio.
+
+    For every file, compares the first-step decoder logits of both backends on the same
+    mel input and the greedy transcription text.
+
+    Returns:
+        List of dicts with the file name, max absolute logit difference and both texts
+    """
+    import torch
+    import whisper
+    from whisper.audio import N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+
+    torch_model = whisper.load_model(model_name, device="cpu")
+    onnx_model = load_model(model_name)
+    tokenizer = onnx_model.get_tokenizer(language=language)
+    initial = list(tokenizer.sot_sequence_including_notimestamps)
+
+    results = []
+    for audio_file in audio_files:
+        audio = whisper.load_audio(audio_file)
+        mel = pad_or_trim(log_mel_spectrogram(audio, torch_model.dims.n_mels,
+                                              padding=N_SAMPLES), N_FRAMES)
+
+        with torch.no_grad():
+            features = torch_model.encoder(mel[None])
+            torch_logits = torch_model.logits(torch.tensor([initial]), features).numpy()
+        cross_kv = onnx_model.encode(mel.numpy()[None])
+        onnx_logits, _ = onnx_model.decoder_step(np.array([initial]), cross_kv,
+                                                 onnx_model.empty_kv())
+
+        torch_text = torch_model.transcribe(audio, language=language, fp16=False,
+                                            temperature=0.0, without_timestamps=True,
+                                            condition_on_previous_text=False,
+                                            no_speech_threshold=None)["text"]
+        onnx_text = onnx_model.transcribe(audio, language=language)["text"]
+        results.append({
+            "file": audio_file,
+            "max_logit_diff": float(np.abs(torch_logits - onnx_logits).max()),
+            "torch_text": torch_text.strip(),
+            "onnx_text": onnx_text.strip(),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3:
+        print("Usage: python -m telly_spelly.onnx_backend MODEL AUDIO_FILE [AUDIO_FILE ...]")
+        sys.exit(1)
+
+    failed = False
+    for result in compare_with_torch(sys.argv[1], sys.argv[2:]):
+        match = result["torch_text"] == result["onnx_text"]
+        failed |= not match or result["max_logit_diff"] > 1e-2
+        print(f"{result['file']}: max logit diff {result['max_logit_diff']:.2e}, "
+              f"text {'matches' if match else 'DIFFERS'}")
+        if not match:
+            print(f"  torch: {result['torch_text']}\n  onnx:  {result['onnx_text']}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,172 @@
+"""Battery- and load-aware inference policy: smaller models, fewer threads or no refinement
+pass while on battery or while the machine is busy
+
+Run with: python -m telly_spelly.power_policy [--on-battery] [--battery PERCENT] [--load LOAD]
+"""
+
+import argparse
+import glob
+import logging
+import os
+
+from .gpu import ACCURACY_ORDER
+
+logger = logging.getLogger(__name__)
+
+POWER_SUPPLY_DIR = "/sys/class/power_supply"
+LOADAVG_FILE = "/proc/loadavg"
+
+# Checked in order, the first matching rule applies. Conditions: 'on_battery',
+# 'battery_below' (percent) and 'load_above' (1-minute load average per CPU). Actions:
+# 'max_model' (largest model to use), 'max_threads', 'free_cores_only' (no more threads
+# than CPUs left idle by the background load) and 'defer_refinement' (two-pass mode keeps
+# the fast draft instead of running the selected model after it).
+DEFAULT_RULES = [
+    {'name': "low battery", 'on_battery': True, 'battery_below': 20,
+     'max_model': 'base', 'max_threads': 2, 'defer_refinement': True},
+    {'name': "on battery", 'on_battery': True,
+     'max_model': 'small', 'max_threads': 4, 'defer_refinement': True},
+    {'name': "busy", 'load_above': 0.75,
+     'free_cores_only': True, 'defer_refinement': True},
+]
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def read_system_state(power_supply_dir=POWER_SUPPLY_DIR, loadavg_file=LOADAVG_FILE):
+    """
+    Current power source, battery level and load.
+
+    Returns:
+        dict with 'on_battery', 'battery_percent' (None without a system battery),
+        'load' (1-minute load average) and 'cpus'
+    """
+    on_ac = False
+    discharging = False
+    capacities = []
+    for supply in glob.glob(os.path.join(power_supply_dir, "*")):
+        supply_type = _read(os.path.join(supply, "type"))
+        if supply_type == "Battery":
+            # Batteries of mice, headsets and the like report scope "Device"
+            if _read(os.path.join(supply, "scope")) == "Device":
+                continue
+            capacity = _read(os.path.join(supply, "capacity"))
+            if capacity and capacity.isdigit():
+                capacities.append(int(capacity))
+            discharging = discharging or _read(os.path.join(supply, "status")) == "Discharging"
+        elif _read(os.path.join(supply, "online")) == "1":
+            on_ac = True
+
+    load = 0.0
+    loadavg = _read(loadavg_file)
+    if loadavg:
+        try:
+            load = float(loadavg.split()[0])
+        except (ValueError, IndexError):
+            pass
+
+    return {
+        'on_battery': bool(capacities) and (discharging or not on_ac),
+        'battery_percent': sum(capacities) / len(capacities) if capacities else None,
+        'load': load,
+        'cpus': os.cpu_count() or 1,
+    }
+
+
+def rule_matches(rule, state):
+    """Check a rule's conditions against a system state"""
+    if 'on_battery' in rule and bool(rule['on_battery']) != state['on_battery']:
+        return False
+    if 'battery_below' in rule:
+        percent = state['battery_percent']
+        if percent is None or percent >= rule['battery_below']:
+            return False
+    if 'load_above' in rule and state['load'] / state['cpus'] <= rule['load_above']:
+        return False
+    return True
+
+
+class PowerPolicy:
+    """
+    Adjusts the model and thread count of each transcription job to the power state and
+    system load.
+
+    state_source is a callable returning a state like read_system_state(); tests and the
+    command line pass a fixed one instead of reading /sys and /proc.
+    """
+
+    def __init__(self, rules=None, state_source=read_system_state):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.state_source = state_source
+
+    def cap_model(self, model_name, max_model, is_available=lambda name: True):
+        """The model_name, or the largest available model up to max_model if it is larger"""
+        if (not max_model or model_name not in ACCURACY_ORDER
+                or max_model not in ACCURACY_ORDER
+                or ACCURACY_ORDER.index(model_name) <= ACCURACY_ORDER.index(max_model)):
+            return model_name
+        for name in reversed(ACCURACY_ORDER[:ACCURACY_ORDER.index(max_model) + 1]):
+            if is_available(name):
+                return name
+        return model_name
+
+    def evaluate(self, model_name, threads, is_available=lambda name: True):
+        """
+        Apply the first matching rule to a job.
+
+        Args:
+            model_name: the model the job would use
+            threads: the intra-op thread count it would use
+            is_available: callable telling whether a model can be used without downloading
+
+        Returns:
+            dict with 'rule' (None if no rule matched), 'model', 'threads',
+            'defer_refinement' and 'state'
+        """
+        state = self.state_source()
+        decision = {'rule': None, 'model': model_name, 'threads': threads,
+                    'defer_refinement': False, 'state': state}
+        rule = next((rule for rule in self.rules if rule_matches(rule, state)), None)
+        if rule is None:
+            return decision
+
+        decision['rule'] = rule.get('name', "unnamed rule")
+        decision['model'] = self.cap_model(model_name, rule.get('max_model'), is_available)
+        if rule.get('max_threads'):
+            decision['threads'] = min(threads, rule['max_threads'])
+        if rule.get('free_cores_only'):
+            free_cores = max(1, int(state['cpus'] - state['load']))
+            decision['threads'] = min(decision['threads'], free_cores)
+        decision['defer_refinement'] = bool(rule.get('defer_refinement'))
+        logger.info(f"Power policy '{decision['rule']}': model {decision['model']}, "
+                    f"{decision['threads']} thread(s)"
+                    f"{', no refinement pass' if decision['defer_refinement'] else ''}")
+        return decision
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the inference policy for this machine's "
+                                                 "power state and load, or for a simulated one")
+    parser.add_argument('--model', default='turbo', help="Configured model")
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--on-battery', action='store_true', help="Simulate running on battery")
+    parser.add_argument('--battery', type=float, help="Simulated battery percent")
+    parser.add_argument('--load', type=float, help="Simulated 1-minute load average")
+    args = parser.parse_args()
+
+    state = read_system_state()
+    if args.on_battery or args.battery is not None:
+        state.update(on_battery=True, battery_percent=args.battery)
+    if args.load is not None:
+        state['load'] = args.load
+    decision = PowerPolicy(state_source=lambda: state).evaluate(args.model, args.threads)
+    print(f"State: {state}")
+    print(f"Rule: {decision['rule'] or 'none'}; model {decision['model']}, "
+          f"{decision['threads']} thread(s), refinement "
+          f"{'deferred' if decision['defer_refinement'] else 'as configured'}")
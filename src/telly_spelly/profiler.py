@@ -0,0 +1,164 @@
+"""On-demand profiling of a running instance: sampled stacks of the Qt main thread, the
+transcription worker and the audio callback as a collapsed-stack (flamegraph) file, and
+torch profiler traces of the next transcriptions
+
+Start it with `telly-spelly --profile SECONDS` (forwarded to a running instance) or the
+D-Bus StartProfiling method.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.01
+
+
+def get_profile_dir():
+    default = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(os.getenv("XDG_CACHE_HOME", default), "telly-spelly", "profiles")
+
+
+def collapse_stack(frame):
+    """A frame's stack, outermost call first, in flamegraph's collapsed format"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                     f"{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of registered threads for a time window.
+
+    Threads register themselves by name and unregister when they end, so the registry
+    only holds live threads; the sampler thread reads their current frames every
+    SAMPLE_INTERVAL seconds and writes the counts as `thread;outer;...;inner count`
+    lines. Threads running native code without holding Python frames (torch kernels, the
+    audio driver) are seen at the Python call that entered it.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or get_profile_dir()
+        self._threads = {threading.main_thread().ident: 'qt-main'}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self.torch_remaining = 0
+        self.last_output = None
+
+    def register_thread(self, name):
+        """
+        Name the calling thread so its stacks are sampled.
+
+        Returns:
+            The thread's identifier, for unregister_thread() from another thread
+        """
+        ident = threading.get_ident()
+        self._threads[ident] = name
+        return ident
+
+    def unregister_thread(self, ident=None):
+        """Stop sampling a thread (the calling one by default), e.g. when it finishes"""
+        self._threads.pop(threading.get_ident() if ident is None else ident, None)
+
+    @property
+    def running(self):
+        return self._sampler is not None and self._sampler.is_alive()
+
+    def start(self, seconds=30, transcriptions=0):
+        """
+        Sample for `seconds` and trace the next `transcriptions` with torch's profiler.
+
+        Returns:
+            Directory the output is written to
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self.torch_remaining = max(0, int(transcriptions))
+            if seconds > 0 and not self.running:
+                self._stop.clear()
+                self._sampler = threading.Thread(target=self._sample, args=(seconds,),
+                                                 name="telly-spelly-profiler", daemon=True)
+                self._sampler.start()
+        logger.info(f"Profiling for {seconds}s and {transcriptions} transcription(s), "
+                    f"output in {self.directory}")
+        return self.directory
+
+    def stop(self):
+        """Stop sampling early and stop tracing; returns the collapsed-stack file or None"""
+        with self._lock:
+            self.torch_remaining = 0
+            sampler = self._sampler
+        if sampler is None:
+            return self.last_output
+        self._stop.set()
+        sampler.join()
+        return self.last_output
+
+    def _sample(self, seconds):
+        counts = Counter()
+        started = time.strftime("%Y%m%d-%H%M%S")
+        deadline = time.monotonic() + seconds
+        samples = 0
+        while time.monotonic() < deadline and not self._stop.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for ident, name in list(self._threads.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    counts[f"{name};{collapse_stack(frame)}"] += 1
+            samples += 1
+            del frames
+
+        path = os.path.join(self.directory, f"stacks-{started}.folded")
+        try:
+            with open(path, 'w') as f:
+                for stack, count in counts.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.last_output = path
+            logger.info(f"Wrote {samples} stack samples to {path}")
+        except OSError as e:
+            logger.warning(f"Failed to write stack samples: {e}")
+        with self._lock:
+            self._sampler = None
+
+    @contextmanager
+    def torch_trace(self, label):
+        """Record the block with torch's profiler if transcriptions are left to trace"""
+        with self._lock:
+            if self.torch_remaining <= 0:
+                tracing = False
+            else:
+                self.torch_remaining -= 1
+                tracing = True
+        if not tracing:
+            yield
+            return
+
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        with profile(activities=activities) as prof:
+            yield
+        path = os.path.join(self.directory,
+                            f"torch-{time.strftime('%Y%m%d-%H%M%S')}-{label}.json")
+        try:
+            prof.export_chrome_trace(path)
+            logger.info(f"Wrote torch profiler trace to {path}")
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"Failed to write torch profiler trace: {e}")
+
+
+# Shared by the recorder, the transcription workers and the D-Bus service
+profiler = SamplingProfiler()
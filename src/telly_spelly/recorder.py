@@ -6,6 +6,9 @@ import os
 import logging
 import numpy as np
 from .settings import Settings
+from .streaming_mel import BackgroundLogMel, model_n_mels
+from .telemetry import telemetry
+from .profiler import profiler
 from scipy import signal
 
 logger = logging.getLogger(__name__)
@@ -24,6 +27,12 @@ class AudioRecorder(QObject):
         self.is_testing = False
         self.test_stream = None
         self.current_device_info = None
+        self.sample_rate = None
+        # Log-mel features computed while recording a 16 kHz stream, by saved file path
+        self.streaming_mel = None
+        self.features = {}
+        self._audio_seen = False
+        self._callback_thread = None
         # Keep a reference to self to prevent premature deletion
         self._instance = self
         
@@ -33,6 +42,7 @@ class AudioRecorder(QObject):
             
         try:
             self.frames = []
+            self._audio_seen = False
             self.is_recording = True
             
             # Get selected mic index from settings
@@ -55,9 +65,22 @@ class AudioRecorder(QObject):
             # Store device info for later use
             self.current_device_info = device_info
             
-            # Get supported sample rate from device
+            # Capture at Whisper's 16 kHz when the device allows it, so that features can
+            # be computed while recording; otherwise use the device rate and resample at stop
             sample_rate = int(device_info['defaultSampleRate'])
+            try:
+                if self.audio.is_format_supported(16000, input_device=mic_index,
+                                                  input_channels=1,
+                                                  input_format=pyaudio.paInt16):
+                    sample_rate = 16000
+            except ValueError:
+                pass
+            self.sample_rate = sample_rate
             logger.info(f"Using sample rate: {sample_rate}")
+            self.streaming_mel = None
+            if sample_rate == 16000:
+                n_mels = model_n_mels(settings.get('model', 'turbo'))
+                self.streaming_mel = BackgroundLogMel(n_mels)
             
             self.stream = self.audio.open(
                 format=pyaudio.paInt16,
@@ -70,12 +93,14 @@ class AudioRecorder(QObject):
             )
             
             self.stream.start_stream()
+            telemetry.mark('stream_open')
             logger.info("Recording started")
             
         except Exception as e:
             logger.error(f"Failed to start recording: {e}")
             self.recording_error.emit(f"Failed to start recording: {e}")
             self.is_recording = False
+            self._close_streaming_mel()
         
     def _callback(self, in_data, frame_count, time_info, status):
         if status:
@@ -83,6 +108,13 @@ class AudioRecorder(QObject):
         try:
             if self.is_recording:
                 self.frames.append(in_data)
+                if not self._audio_seen:
+                    self._audio_seen = True
+                    telemetry.mark('first_audio')
+                    self._callback_thread = profiler.register_thread('audio-callback')
+                if self.streaming_mel is not None:
+                    # Computed on the feature thread, never in the callback
+                    self.streaming_mel.append(in_data)
                 # Calculate and emit volume level
                 try:
                     audio_data = np.frombuffer(in_data, dtype=np.int16)
@@ -112,6 +144,7 @@ class AudioRecorder(QObject):
             
         logger.info("Stopping recording")
         self.is_recording = False
+        telemetry.mark('stop')
         
         try:
             # Stop and close the stream first
@@ -119,9 +152,11 @@ class AudioRecorder(QObject):
                 self.stream.stop_stream()
                 self.stream.close()
                 self.stream = None
+            self._unregister_callback_thread()
             
             # Check if we have any recorded frames
             if not self.frames:
+                self._close_streaming_mel()
                 logger.error("No audio data recorded")
                 self.recording_error.emit("No audio was recorded")
                 return
@@ -139,11 +174,47 @@ class AudioRecorder(QObject):
             temp_file = tempfile.mktemp(suffix='.wav')
             logger.info("Processing recording...")
             self.save_audio(temp_file)
-            logger.info(f"Recording processed and saved to: {os.path.abspath(temp_file)}")
+            logger.info(f"Recording processed and saved to: {os.path.abspath(temp_file)}",
+                        extra={'job_id': os.path.basename(temp_file), 'stage': 'saved'})
+            if self.streaming_mel is not None:
+                streamed_frames = self.streaming_mel.n_frames
+                features = self.streaming_mel.finish()
+                self.streaming_mel = None
+                if features is not None:
+                    self.features[temp_file] = features
+                    logger.info(f"{streamed_frames} feature frames were computed while "
+                                f"recording")
+            telemetry.attach(temp_file)
             self.recording_finished.emit(temp_file)
         except Exception as e:
+            self._close_streaming_mel()
             logger.error(f"Failed to process recording: {e}")
             self.recording_error.emit(f"Failed to process recording: {e}")
+
+    def _unregister_callback_thread(self):
+        # PortAudio starts a new callback thread for each stream
+        if self._callback_thread is not None:
+            profiler.unregister_thread(self._callback_thread)
+            self._callback_thread = None
+
+    def _close_streaming_mel(self):
+        if self.streaming_mel is not None:
+            self.streaming_mel.close()
+            self.streaming_mel = None
+
+    def memory_usage(self):
+        """Bytes held by capture buffers, for memory accounting"""
+        streaming_mel = self.streaming_mel
+        return {
+            'recorded frames': sum(len(frame) for frame in list(self.frames)),
+            'streaming features': streaming_mel.nbytes if streaming_mel is not None else 0,
+            'saved features': sum(mel.numel() * mel.element_size()
+                                  for mel in list(self.features.values())),
+        }
+
+    def take_features(self, audio_file):
+        """Log-mel features computed while recording a saved file, or None"""
+        return self.features.pop(audio_file, None)
         
     def save_audio(self, filename):
         """Save recorded audio to a WAV file"""
@@ -154,8 +225,8 @@ class AudioRecorder(QObject):
             if self.current_device_info is None:
                 raise ValueError("No device info available")
                 
-            # Get original sample rate from stored device info
-            original_rate = int(self.current_device_info['defaultSampleRate'])
+            # Get the rate the stream was opened with
+            original_rate = self.sample_rate or int(self.current_device_info['defaultSampleRate'])
             
             # Resample to 16000Hz if needed
             if original_rate != 16000:
@@ -238,6 +309,7 @@ class AudioRecorder(QObject):
             self.stream.stop_stream()
             self.stream.close()
             self.stream = None
+        self._unregister_callback_thread()
         if self.test_stream:
             self.test_stream.stop_stream()
             self.test_stream.close()
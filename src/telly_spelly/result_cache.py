@@ -0,0 +1,145 @@
+"""Persistent transcription results keyed by audio content, model and decoding options"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Bump when the stored result format or the meaning of the key changes
+CACHE_VERSION = 1
+
+
+def get_result_cache_dir():
+    default = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(os.getenv("XDG_CACHE_HOME", default), "telly-spelly", "results")
+
+
+def _key_options(options):
+    """The transcribe_audio() options that can change the text, in a stable form"""
+    from .settings import Settings
+
+    key_options = {name: value for name, value in options.items()
+                   if name not in ('language_detector', 'draft_model', 'speculative_tokens')}
+    profile = key_options.get('profile', 'balanced')
+    key_options['profile'] = {'name': profile, **Settings.DECODING_PROFILES.get(profile, {})}
+    return key_options
+
+
+class ResultCache:
+    """
+    Size-bounded on-disk LRU of transcription results.
+
+    An entry is keyed by a hash of the 16 kHz waveform together with the model, backend,
+    language and decoding options, so any change to those misses. Entries are small JSON
+    files; a hit refreshes the file's mtime and eviction removes the oldest files once the
+    directory exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 ** 2, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory or get_result_cache_dir()
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    def key(self, audio, model_name, backend, language, options):
+        digest = hashlib.sha256(audio.tobytes())
+        digest.update(json.dumps({
+            'version': CACHE_VERSION,
+            'model': model_name,
+            'backend': backend,
+            'language': language or 'auto',
+            'options': _key_options(options),
+        }, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Cached result dict, or None"""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Store the parts of a result needed to reproduce the transcription"""
+        entry = {
+            'text': result.get('text', ""),
+            'language': result.get('language'),
+            'fallbacks': result.get('fallbacks', 0),
+            'segments': [{'start': s.get('start'), 'end': s.get('end'), 'text': s.get('text')}
+                         for s in result.get('segments', [])],
+        }
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+            with self._lock:
+                if self._size is not None:
+                    self._size += os.path.getsize(path)
+            self._evict()
+        except OSError as e:
+            logger.warning(f"Failed to store transcription result: {e}")
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            if self._size <= self.max_bytes:
+                return
+            entries = sorted(self._entries())
+            self._size = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self._size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    self._size -= size
+                except OSError:
+                    pass
+
+    def summary(self):
+        """Number of entries and bytes on disk"""
+        entries = self._entries()
+        return len(entries), sum(size for _, size, _ in entries)
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
@@ -0,0 +1,103 @@
+"""Deadline-aware choice of the model that transcribes each job"""
+
+import logging
+import wave
+
+from .gpu import ACCURACY_ORDER
+
+logger = logging.getLogger(__name__)
+
+# Without benchmarks, clips up to this long go to the fast model
+SHORT_CLIP_SECONDS = 5.0
+# Audio beyond the target's clip length may take this long to transcribe per second;
+# nobody waits on a long dictation the way they wait on a short command
+LONG_CLIP_REALTIME_FACTOR = 0.5
+
+
+def wav_duration(path):
+    """Duration of a WAV recording in seconds (0 if it cannot be read)"""
+    try:
+        with wave.open(path, 'rb') as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except (OSError, EOFError, wave.Error):
+        return 0.0
+
+
+class ModelRouter:
+    """
+    Picks the model for a transcription job.
+
+    Candidates are the configured (accurate) model and a fast model. With on-device
+    benchmarks the most accurate candidate whose predicted latency meets the deadline is
+    chosen. The prediction covers the job's audio plus the audio queued behind it, and
+    adds load time for models that are not resident. The deadline is the latency target,
+    relaxed for audio beyond the target's clip length, so long dictations and idle
+    moments with an empty queue get the accurate model while short commands and
+    backlogs get the fast one. Without benchmarks, short clips go to the fast model when it
+    is resident.
+    """
+
+    def __init__(self, benchmarks, latency_target, fast_model):
+        self.benchmarks = benchmarks or {}
+        self.target_seconds, self.target_clip_seconds = latency_target
+        self.fast_model = fast_model
+
+    def deadline(self, duration):
+        """Allowed latency for a job of this many seconds of audio"""
+        extra_seconds = max(0.0, duration - self.target_clip_seconds)
+        return self.target_seconds + extra_seconds * LONG_CLIP_REALTIME_FACTOR
+
+    def predict(self, model_name, audio_seconds, resident):
+        """Predicted seconds to transcribe audio_seconds, or None without a benchmark"""
+        result = self.benchmarks.get(model_name)
+        if result is None:
+            return None
+        load_seconds = 0.0 if resident else result.get('load_seconds', 0.0)
+        return load_seconds + result['realtime_factor'] * audio_seconds
+
+    def route(self, primary_model, duration, queued_seconds=0.0, queue_depth=0,
+              is_resident=lambda name: False):
+        """
+        Choose the model for a job.
+
+        Args:
+            primary_model: the configured model
+            duration: seconds of audio in the job
+            queued_seconds: seconds of audio waiting behind the job
+            queue_depth: number of recordings waiting behind the job
+            is_resident: callable telling whether a model is loaded
+
+        Returns:
+            dict with 'model', 'reason', 'duration', 'queue_depth', 'deadline' and
+            'predicted_latency' (None when unknown)
+        """
+        deadline = self.deadline(duration)
+        decision = {'model': primary_model, 'duration': duration, 'queue_depth': queue_depth,
+                    'deadline': deadline, 'predicted_latency': None}
+
+        candidates = [primary_model]
+        if self.fast_model and self.fast_model != primary_model:
+            candidates.append(self.fast_model)
+        # Most accurate first
+        candidates.sort(key=lambda name: -ACCURACY_ORDER.index(name)
+                        if name in ACCURACY_ORDER else 0)
+
+        predictions = {name: self.predict(name, duration + queued_seconds, is_resident(name))
+                       for name in candidates}
+        if all(p is not None for p in predictions.values()):
+            for name in candidates:
+                if predictions[name] <= deadline:
+                    decision.update(model=name, predicted_latency=predictions[name],
+                                    reason="most accurate model meeting deadline")
+                    return decision
+            fastest = min(candidates, key=predictions.get)
+            decision.update(model=fastest, predicted_latency=predictions[fastest],
+                            reason="no model meets deadline, using fastest")
+            return decision
+
+        if (self.fast_model in candidates and duration <= SHORT_CLIP_SECONDS
+                and is_resident(self.fast_model)):
+            decision.update(model=self.fast_model, reason="short clip, fast model resident")
+        else:
+            decision['reason'] = "configured model"
+        return decision
@@ -1,5 +1,39 @@
 from PyQt6.QtCore import QSettings
 import json
+import os
+
+
+def whisper_cache_dir():
+    """Directory where whisper.load_model() keeps downloaded checkpoints"""
+    default = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(os.getenv("XDG_CACHE_HOME", default), "whisper")
+
+
+# Mapping from model name to cache filename
+MODEL_CACHE_FILES = {
+    'tiny': 'tiny.pt',
+    'tiny.en': 'tiny.en.pt',
+    'base': 'base.pt',
+    'base.en': 'base.en.pt',
+    'small': 'small.pt',
+    'small.en': 'small.en.pt',
+    'medium': 'medium.pt',
+    'medium.en': 'medium.en.pt',
+    'large': 'large-v3.pt',
+    'large-v1': 'large-v1.pt',
+    'large-v2': 'large-v2.pt',
+    'large-v3': 'large-v3.pt',
+    'turbo': 'large-v3-turbo.pt',
+    'large-v3-turbo': 'large-v3-turbo.pt',
+}
+
+
+def is_model_cached(model_name):
+    """Check if a model is already downloaded"""
+    cache_file = MODEL_CACHE_FILES.get(model_name, f"{model_name}.pt")
+    cache_path = os.path.join(whisper_cache_dir(), cache_file)
+    return os.path.exists(cache_path)
+
 
 class Settings:
     ALL_MODELS = ['tiny', 'base', 'small', 'medium', 'large', 'turbo']
@@ -20,6 +54,38 @@ class Settings:
         'ru': 'Russian',
         # Add more languages as needed
     }
+    # Decoding profiles trading accuracy for bounded latency. 'temperature' is the fallback
+    # schedule used when whisper's compression-ratio/logprob checks fail, and
+    # 'max_tokens_per_second' caps the tokens sampled per second of audio (None = no cap).
+    # 'balanced' is whisper's own transcribe() defaults; speed trade-offs belong in 'fast'.
+    DECODING_PROFILES = {
+        'fast': {
+            'beam_size': None,
+            'best_of': None,
+            'temperature': (0.0,),
+            'max_tokens_per_second': 8,
+            'condition_on_previous_text': False,
+        },
+        'balanced': {
+            'beam_size': None,
+            'best_of': None,
+            'temperature': (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+            'max_tokens_per_second': None,
+            'condition_on_previous_text': True,
+        },
+        'accurate': {
+            'beam_size': 5,
+            'best_of': 5,
+            'temperature': (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+            'max_tokens_per_second': None,
+            'condition_on_previous_text': True,
+        },
+    }
+    # Inference backends selectable in the settings window
+    VALID_BACKENDS = {
+        'torch': 'PyTorch',
+        'onnx': 'ONNX Runtime (CPU)',
+    }
     
     def __init__(self):
         self.settings = QSettings('TellySpelly', 'TellySpelly')
@@ -37,6 +103,12 @@ class Settings:
                 return default
         elif key == 'language' and value not in self.VALID_LANGUAGES:
             return 'auto'  # Default to auto-detect
+        elif key == 'backend' and value not in self.VALID_BACKENDS:
+            return 'torch'
+        elif key == 'decoding_profile' and value not in self.DECODING_PROFILES:
+            return 'balanced'
+        elif key == 'routing_fast_model' and value not in self.VALID_MODELS:
+            return default
                 
         return value
         
@@ -51,6 +123,12 @@ class Settings:
                 raise ValueError(f"Invalid mic_index: {value}")
         elif key == 'language' and value not in self.VALID_LANGUAGES:
             raise ValueError(f"Invalid language: {value}")
+        elif key == 'backend' and value not in self.VALID_BACKENDS:
+            raise ValueError(f"Invalid backend: {value}")
+        elif key == 'decoding_profile' and value not in self.DECODING_PROFILES:
+            raise ValueError(f"Invalid decoding profile: {value}")
+        elif key == 'routing_fast_model' and value not in self.VALID_MODELS:
+            raise ValueError(f"Invalid model: {value}")
                 
         self.settings.setValue(key, value)
         self.settings.sync()
@@ -106,4 +184,330 @@ class Settings:
     def set_force_cpu(self, force_cpu):
         """Set whether to force CPU-only mode"""
         self.settings.setValue('force_cpu', force_cpu)
-        self.settings.sync()
\ No newline at end of file
+        self.settings.sync()
+
+    def get_short_utterance_seconds(self):
+        """Get the clip length up to which the short-utterance fast path is tried (0 = off)"""
+        if not self.settings.value('short_utterance_enabled', True, type=bool):
+            return 0
+        try:
+            return float(self.settings.value('short_utterance_max_seconds', 10.0))
+        except (ValueError, TypeError):
+            return 10.0
+
+    def set_short_utterance_enabled(self, enabled):
+        """Set whether short clips are encoded on a truncated audio context"""
+        self.settings.setValue('short_utterance_enabled', enabled)
+        self.settings.sync()
+
+    def get_language_candidates(self):
+        """Get the language codes auto-detection chooses from (defaults to all offered languages)"""
+        candidates_json = self.settings.value('language_candidates', None)
+        if candidates_json:
+            try:
+                candidates = [c for c in json.loads(candidates_json) if c in self.VALID_LANGUAGES]
+                if candidates:
+                    return candidates
+            except (json.JSONDecodeError, TypeError):
+                pass
+        return [code for code in self.VALID_LANGUAGES if code != 'auto']
+
+    def set_language_candidates(self, candidates):
+        """Set the language codes auto-detection chooses from"""
+        invalid = [c for c in candidates if c not in self.VALID_LANGUAGES or c == 'auto']
+        if invalid:
+            raise ValueError(f"Invalid languages: {', '.join(invalid)}")
+        self.settings.setValue('language_candidates', json.dumps(list(candidates)))
+        self.settings.sync()
+
+    def get_custom_vocabulary(self):
+        """Get the words and phrases passed to Whisper as its initial prompt"""
+        vocabulary_json = self.settings.value('custom_vocabulary', None)
+        if vocabulary_json:
+            try:
+                return [str(word) for word in json.loads(vocabulary_json)]
+            except (json.JSONDecodeError, TypeError):
+                pass
+        return []
+
+    def set_custom_vocabulary(self, words):
+        """Set the words and phrases passed to Whisper as its initial prompt"""
+        self.settings.setValue('custom_vocabulary', json.dumps(list(words)))
+        self.settings.sync()
+
+    def get_max_batch_size(self):
+        """Get how many queued recordings (or 30 s windows) are encoded in one batch"""
+        try:
+            return max(1, int(self.settings.value('max_batch_size', 4)))
+        except (ValueError, TypeError):
+            return 4
+
+    def set_max_batch_size(self, size):
+        """Set how many queued recordings are encoded in one batch"""
+        self.settings.setValue('max_batch_size', max(1, int(size)))
+        self.settings.sync()
+
+    def get_longform_workers(self):
+        """Get the number of worker processes for long recordings (1 = no parallelism)"""
+        default = max(1, min(4, (os.cpu_count() or 1) // 2))
+        try:
+            return max(1, int(self.settings.value('longform_workers', default)))
+        except (ValueError, TypeError):
+            return default
+
+    def set_longform_workers(self, workers):
+        """Set the number of worker processes for long recordings"""
+        self.settings.setValue('longform_workers', max(1, int(workers)))
+        self.settings.sync()
+
+    def get_longform_min_seconds(self):
+        """Get the recording length above which the parallel long-form path is used"""
+        try:
+            return float(self.settings.value('longform_min_seconds', 60.0))
+        except (ValueError, TypeError):
+            return 60.0
+
+    def get_model_memory_budget_gb(self):
+        """Get the memory budget for resident models in GB (0 = half of RAM / 80% of VRAM)"""
+        try:
+            return max(0.0, float(self.settings.value('model_memory_budget_gb', 0)))
+        except (ValueError, TypeError):
+            return 0.0
+
+    def set_model_memory_budget_gb(self, budget_gb):
+        """Set the memory budget for resident models in GB"""
+        self.settings.setValue('model_memory_budget_gb', max(0.0, float(budget_gb)))
+        self.settings.sync()
+
+    def get_model_idle_minutes(self):
+        """Get the minutes after which an unused model is unloaded (0 = never)"""
+        try:
+            return max(0, int(self.settings.value('model_idle_minutes', 0)))
+        except (ValueError, TypeError):
+            return 0
+
+    def set_model_idle_minutes(self, minutes):
+        """Set the minutes after which an unused model is unloaded"""
+        self.settings.setValue('model_idle_minutes', max(0, int(minutes)))
+        self.settings.sync()
+
+    def get_fast_load_enabled(self):
+        """
+        Get whether models load from memory-mapped safetensors copies (off by default:
+        each copy is written on the model's first load and takes twice the checkpoint's
+        disk space)
+        """
+        return bool(self.settings.value('fast_load_enabled', False, type=bool))
+
+    def set_fast_load_enabled(self, enabled):
+        """Set whether models load from memory-mapped safetensors copies"""
+        self.settings.setValue('fast_load_enabled', enabled)
+        self.settings.sync()
+
+    def get_prefetch_at_login(self):
+        """Get whether the model files are read into the page cache at login"""
+        return bool(self.settings.value('prefetch_at_login', False, type=bool))
+
+    def set_prefetch_at_login(self, enabled):
+        """Set whether the model files are read into the page cache at login"""
+        self.settings.setValue('prefetch_at_login', enabled)
+        self.settings.sync()
+
+    def get_warmup_seconds(self):
+        """Get the length of the synthetic clip transcribed after a model load (0 = no warm-up)"""
+        try:
+            return max(0.0, float(self.settings.value('warmup_seconds', 3.0)))
+        except (ValueError, TypeError):
+            return 3.0
+
+    def set_warmup_seconds(self, seconds):
+        """Set the length of the warm-up clip (0 disables the warm-up)"""
+        self.settings.setValue('warmup_seconds', max(0.0, float(seconds)))
+        self.settings.sync()
+
+    def get_thread_config(self, fingerprint):
+        """Get the autotuned thread configuration stored for a hardware fingerprint"""
+        configs_json = self.settings.value('thread_configs', None)
+        if configs_json:
+            try:
+                config = json.loads(configs_json).get(fingerprint)
+                if isinstance(config, dict):
+                    return config
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                pass
+        return None
+
+    def set_thread_config(self, fingerprint, config):
+        """Store the autotuned thread configuration for a hardware fingerprint"""
+        configs = {}
+        configs_json = self.settings.value('thread_configs', None)
+        if configs_json:
+            try:
+                configs = json.loads(configs_json)
+            except (json.JSONDecodeError, TypeError):
+                pass
+        configs[fingerprint] = config
+        self.settings.setValue('thread_configs', json.dumps(configs))
+        self.settings.sync()
+
+    def get_manual_thread_config(self):
+        """Get manually set inference threads and CPU affinity (0 / empty = automatic)"""
+        try:
+            intra = max(0, int(self.settings.value('intra_op_threads', 0)))
+            inter = max(0, int(self.settings.value('inter_op_threads', 0)))
+        except (ValueError, TypeError):
+            intra = inter = 0
+        return {
+            'intra_op_threads': intra,
+            'inter_op_threads': inter,
+            'affinity': str(self.settings.value('cpu_affinity', '') or ''),
+        }
+
+    def set_manual_thread_config(self, intra_op_threads=0, inter_op_threads=0, affinity=''):
+        """Set inference threads and CPU affinity manually (0 / empty = automatic)"""
+        self.settings.setValue('intra_op_threads', max(0, int(intra_op_threads)))
+        self.settings.setValue('inter_op_threads', max(0, int(inter_op_threads)))
+        self.settings.setValue('cpu_affinity', affinity)
+        self.settings.sync()
+
+    def get_model_benchmarks(self, device):
+        """Get measured model benchmarks for a device as {model: result}"""
+        benchmarks_json = self.settings.value('model_benchmarks', None)
+        if benchmarks_json:
+            try:
+                benchmarks = json.loads(benchmarks_json).get(device, {})
+                if isinstance(benchmarks, dict):
+                    return benchmarks
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                pass
+        return {}
+
+    def set_model_benchmarks(self, device, benchmarks):
+        """Store measured model benchmarks for a device"""
+        all_benchmarks = {}
+        benchmarks_json = self.settings.value('model_benchmarks', None)
+        if benchmarks_json:
+            try:
+                all_benchmarks = json.loads(benchmarks_json)
+            except (json.JSONDecodeError, TypeError):
+                pass
+        all_benchmarks[device] = benchmarks
+        self.settings.setValue('model_benchmarks', json.dumps(all_benchmarks))
+        self.settings.sync()
+
+    def get_latency_target(self):
+        """Get the latency target as (seconds, clip_seconds), e.g. 1.5 s for a 10 s clip"""
+        try:
+            return (float(self.settings.value('latency_target_seconds', 1.5)),
+                    float(self.settings.value('latency_target_clip_seconds', 10.0)))
+        except (ValueError, TypeError):
+            return (1.5, 10.0)
+
+    def set_latency_target(self, seconds, clip_seconds=10.0):
+        """Set the latency target the recommended model has to meet"""
+        self.settings.setValue('latency_target_seconds', float(seconds))
+        self.settings.setValue('latency_target_clip_seconds', float(clip_seconds))
+        self.settings.sync()
+
+    def get_routing_enabled(self):
+        """Get whether each job may be routed to the fast model to meet the latency target"""
+        return bool(self.settings.value('routing_enabled', False, type=bool))
+
+    def set_routing_enabled(self, enabled):
+        """Set whether each job may be routed to the fast model"""
+        self.settings.setValue('routing_enabled', enabled)
+        self.settings.sync()
+
+    def get_two_pass_enabled(self):
+        """Get whether the fast model drafts each recording before the selected model refines it"""
+        return bool(self.settings.value('two_pass_enabled', False, type=bool))
+
+    def set_two_pass_enabled(self, enabled):
+        """Set whether the fast model drafts each recording"""
+        self.settings.setValue('two_pass_enabled', enabled)
+        self.settings.sync()
+
+    def get_encoder_cache_recordings(self):
+        """Get how many recent recordings keep their audio and encoder outputs for retries"""
+        try:
+            return max(0, int(self.settings.value('encoder_cache_recordings', 5)))
+        except (ValueError, TypeError):
+            return 5
+
+    def set_encoder_cache_recordings(self, count):
+        """Set how many recent recordings are kept for retries (0 = off)"""
+        self.settings.setValue('encoder_cache_recordings', max(0, int(count)))
+        self.settings.sync()
+
+    def get_result_cache_mb(self):
+        """
+        Get the disk space for cached transcription results in MB (0 = off, the default).
+
+        The cache stores the transcribed text on disk, so it is opt-in.
+        """
+        try:
+            return max(0, int(self.settings.value('result_cache_mb', 0)))
+        except (ValueError, TypeError):
+            return 0
+
+    def set_result_cache_mb(self, size_mb):
+        """Set the disk space for cached transcription results in MB (0 = off)"""
+        self.settings.setValue('result_cache_mb', max(0, int(size_mb)))
+        self.settings.sync()
+
+    def get_speculative_enabled(self):
+        """Get whether the fast model drafts tokens for the selected model to verify"""
+        return bool(self.settings.value('speculative_enabled', False, type=bool))
+
+    def set_speculative_enabled(self, enabled):
+        """Set whether greedy decoding is sped up with the fast model's drafted tokens"""
+        self.settings.setValue('speculative_enabled', enabled)
+        self.settings.sync()
+
+    def get_speculative_tokens(self):
+        """Get how many tokens the fast model drafts per verification pass"""
+        try:
+            return max(1, int(self.settings.value('speculative_tokens', 4)))
+        except (ValueError, TypeError):
+            return 4
+
+    def set_speculative_tokens(self, count):
+        """Set how many tokens the fast model drafts per verification pass"""
+        self.settings.setValue('speculative_tokens', max(1, int(count)))
+        self.settings.sync()
+
+    def get_power_policy_enabled(self):
+        """Get whether the model and threads adapt to battery power and system load"""
+        return bool(self.settings.value('power_policy_enabled', False, type=bool))
+
+    def set_power_policy_enabled(self, enabled):
+        """Set whether the model and threads adapt to battery power and system load"""
+        self.settings.setValue('power_policy_enabled', enabled)
+        self.settings.sync()
+
+    def get_power_policy_rules(self):
+        """Get the power policy rules (see power_policy.DEFAULT_RULES)"""
+        from .power_policy import DEFAULT_RULES
+        rules_json = self.settings.value('power_policy_rules', None)
+        if rules_json:
+            try:
+                rules = json.loads(rules_json)
+                if isinstance(rules, list) and all(isinstance(rule, dict) for rule in rules):
+                    return rules
+            except (json.JSONDecodeError, TypeError):
+                pass
+        return DEFAULT_RULES
+
+    def set_power_policy_rules(self, rules):
+        """Set the power policy rules"""
+        self.settings.setValue('power_policy_rules', json.dumps(rules))
+        self.settings.sync()
+
+    def get_metrics_textfile(self):
+        """Get the Prometheus textfile that latency metrics are written to ('' = off)"""
+        return str(self.settings.value('metrics_textfile', '') or '')
+
+    def set_metrics_textfile(self, path):
+        """Set the Prometheus textfile for latency metrics ('' = off)"""
+        self.settings.setValue('metrics_textfile', path.strip())
+        self.settings.sync()
@@ -1,54 +1,35 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QComboBox,
                             QGroupBox, QFormLayout, QPushButton,
-                            QMessageBox, QCheckBox)
+                            QMessageBox, QCheckBox, QListWidget, QListWidgetItem,
+                            QDoubleSpinBox, QLineEdit, QSpinBox)
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
 import logging
 import subprocess
 import os
-from .settings import Settings
+from .settings import Settings, is_model_cached
+from .model_manager import GB, load_model, select_device
 from .desktop_env import get_desktop_environment, get_dbus_service_name
 
 logger = logging.getLogger(__name__)
 
-# Mapping from model name to cache filename
-MODEL_CACHE_FILES = {
-    'tiny': 'tiny.pt',
-    'tiny.en': 'tiny.en.pt',
-    'base': 'base.pt',
-    'base.en': 'base.en.pt',
-    'small': 'small.pt',
-    'small.en': 'small.en.pt',
-    'medium': 'medium.pt',
-    'medium.en': 'medium.en.pt',
-    'large': 'large-v3.pt',
-    'large-v1': 'large-v1.pt',
-    'large-v2': 'large-v2.pt',
-    'large-v3': 'large-v3.pt',
-    'turbo': 'large-v3-turbo.pt',
-    'large-v3-turbo': 'large-v3-turbo.pt',
-}
-
-
-def is_model_cached(model_name):
-    """Check if a model is already downloaded"""
-    cache_file = MODEL_CACHE_FILES.get(model_name, f"{model_name}.pt")
-    cache_path = os.path.join(os.path.expanduser("~"), ".cache", "whisper", cache_file)
-    return os.path.exists(cache_path)
-
-
 class ModelLoaderThread(QThread):
     """Thread to load whisper model without blocking UI"""
     progress = pyqtSignal(str)
     finished = pyqtSignal(object)  # Emits the loaded model
     error = pyqtSignal(str)
 
-    def __init__(self, model_name):
+    def __init__(self, model_name, backend='torch', model_manager=None):
         super().__init__()
         self.model_name = model_name
+        self.backend = backend
+        self.model_manager = model_manager
+        # Swap strategy, duration and peak memory, set when loading finishes
+        self.stats = None
 
     def run(self):
         try:
-            import whisper
+            # Same device policy as the transcriber uses at startup
+            device = select_device(Settings().get_force_cpu())
 
             # Check if model needs to be downloaded
             if is_model_cached(self.model_name):
@@ -56,7 +37,16 @@ class ModelLoaderThread(QThread):
             else:
                 self.progress.emit(f"Downloading {self.model_name} model...")
 
-            model = whisper.load_model(self.model_name)
+            if self.backend == 'onnx':
+                from . import onnx_backend
+                if not onnx_backend.is_onnx_exported(self.model_name):
+                    self.progress.emit(f"Exporting {self.model_name} model to ONNX...")
+
+            if self.model_manager:
+                model, self.stats = self.model_manager.swap(
+                    self.model_name, self.backend, device, progress=self.progress.emit)
+            else:
+                model = load_model(self.model_name, self.backend, device)
             self.finished.emit(model)
 
         except Exception as e:
@@ -64,6 +54,58 @@ class ModelLoaderThread(QThread):
             self.error.emit(str(e))
 
 
+class AutotuneThread(QThread):
+    """Thread to benchmark inference thread settings without blocking UI"""
+    finished = pyqtSignal(dict)  # Emits the fastest configuration
+    error = pyqtSignal(str)
+
+    def __init__(self, model, recordings=None):
+        super().__init__()
+        self.model = model
+        self.recordings = recordings
+
+    def run(self):
+        try:
+            from .benchmark import load_clips
+            from .cpu_tuning import autotune, hardware_fingerprint
+
+            clips = load_clips(count=3, seconds=5.0, recordings=self.recordings)
+            best, _ = autotune(self.model, clips)
+            Settings().set_thread_config(hardware_fingerprint(), best)
+            self.finished.emit(best)
+
+        except Exception as e:
+            logger.exception("CPU thread tuning failed")
+            self.error.emit(str(e))
+
+
+class BenchmarkThread(QThread):
+    """Thread to benchmark the downloaded models without blocking UI"""
+    progress = pyqtSignal(str)
+    finished = pyqtSignal(dict)  # Emits {model: result}
+    error = pyqtSignal(str)
+
+    def __init__(self, device, clip_seconds, recordings=None, model_manager=None):
+        super().__init__()
+        self.device = device
+        self.clip_seconds = clip_seconds
+        self.recordings = recordings
+        self.model_manager = model_manager
+
+    def run(self):
+        try:
+            from .gpu import benchmark_cached_models
+            results = benchmark_cached_models(self.device, self.clip_seconds,
+                                              progress=self.progress.emit,
+                                              recordings=self.recordings,
+                                              model_manager=self.model_manager)
+            self.finished.emit(results)
+
+        except Exception as e:
+            logger.exception("Model benchmark failed")
+            self.error.emit(str(e))
+
+
 class SettingsWindow(QWidget):
     model_changed = pyqtSignal(object, str)  # Emits (new_model, model_name)
 
@@ -97,6 +139,16 @@ class SettingsWindow(QWidget):
         self.model_combo.currentTextChanged.connect(self.on_model_changed)
         model_layout.addRow("Whisper Model:", self.model_combo)
 
+        self.backend_combo = QComboBox()
+        for code, name in Settings.VALID_BACKENDS.items():
+            self.backend_combo.addItem(name, code)
+        self.current_backend = self.settings.get('backend', 'torch')
+        index = self.backend_combo.findData(self.current_backend)
+        if index >= 0:
+            self.backend_combo.setCurrentIndex(index)
+        self.backend_combo.currentIndexChanged.connect(self.on_backend_changed)
+        model_layout.addRow("Backend:", self.backend_combo)
+
         # Status label for loading/downloading
         self.status_label = QLabel("")
         self.status_label.setStyleSheet("color: #666; font-style: italic;")
@@ -109,23 +161,150 @@ class SettingsWindow(QWidget):
         else:
             gpu_text = "GPU: Not detected (CPU mode)"
 
-        # Check for excluded models
-        all_models = Settings.ALL_MODELS
-        excluded = [m for m in all_models if m not in available_models]
-        if excluded:
-            gpu_text += f"\nExcluded models (insufficient VRAM): {', '.join(excluded)}"
-
         gpu_label = QLabel(gpu_text)
         gpu_label.setStyleSheet("color: gray; font-size: 10px;")
         gpu_label.setWordWrap(True)
         model_layout.addRow("", gpu_label)
 
+        # Measured speed and memory of the downloaded models on this machine
+        target_seconds, self.target_clip_seconds = self.settings.get_latency_target()
+        self.latency_spin = QDoubleSpinBox()
+        self.latency_spin.setRange(0.1, 60.0)
+        self.latency_spin.setSingleStep(0.5)
+        self.latency_spin.setDecimals(1)
+        self.latency_spin.setSuffix(f" s for a {self.target_clip_seconds:.0f} s clip")
+        self.latency_spin.setValue(target_seconds)
+        self.latency_spin.valueChanged.connect(self.on_latency_target_changed)
+        model_layout.addRow("Latency target:", self.latency_spin)
+
+        self.benchmark_label = QLabel("")
+        self.benchmark_label.setStyleSheet("color: gray; font-size: 10px;")
+        self.benchmark_label.setWordWrap(True)
+        model_layout.addRow("", self.benchmark_label)
+
+        # Per-recording routing between the selected model and a faster one
+        self.routing_checkbox = QCheckBox("Use a faster model when the target would be missed")
+        self.routing_checkbox.setToolTip(
+            "Each recording goes to the most accurate of the two models that is predicted\n"
+            "to meet the latency target, given its length and the recordings queued behind it.")
+        self.routing_checkbox.setChecked(self.settings.get_routing_enabled())
+        self.routing_checkbox.stateChanged.connect(self.on_routing_changed)
+        model_layout.addRow("", self.routing_checkbox)
+
+        self.two_pass_checkbox = QCheckBox("Copy a fast draft first, then refine it")
+        self.two_pass_checkbox.setToolTip(
+            "The fast model's text goes to the clipboard immediately and is replaced by the\n"
+            "selected model's text when ready, unless something else was copied meanwhile.")
+        self.two_pass_checkbox.setChecked(self.settings.get_two_pass_enabled())
+        self.two_pass_checkbox.stateChanged.connect(self.on_two_pass_changed)
+        model_layout.addRow("", self.two_pass_checkbox)
+
+        self.speculative_checkbox = QCheckBox("Speed up decoding with the fast model")
+        self.speculative_checkbox.setToolTip(
+            "The fast model proposes a few tokens at a time and the selected model checks\n"
+            "them in one pass. The text is unchanged; only greedy profiles are sped up and\n"
+            "the fast model must share the selected model's vocabulary (not turbo or large).")
+        self.speculative_checkbox.setChecked(self.settings.get_speculative_enabled())
+        self.speculative_checkbox.stateChanged.connect(self.on_speculative_changed)
+        model_layout.addRow("", self.speculative_checkbox)
+
+        self.fast_model_combo = QComboBox()
+        self.fast_model_combo.addItems(available_models)
+        self.fast_model_combo.setCurrentText(self.settings.get('routing_fast_model', 'base'))
+        self.fast_model_combo.setEnabled(self._uses_fast_model())
+        self.fast_model_combo.currentTextChanged.connect(self.on_fast_model_changed)
+        model_layout.addRow("Fast model:", self.fast_model_combo)
+
+        self.power_policy_checkbox = QCheckBox("Save power on battery and under heavy load")
+        self.power_policy_checkbox.setToolTip(
+            "On battery, use at most the small model (base below 20%) and fewer threads.\n"
+            "While other programs keep the CPUs busy, only use the idle cores. In both\n"
+            "cases two-pass mode keeps the fast draft without refining it.")
+        self.power_policy_checkbox.setChecked(self.settings.get_power_policy_enabled())
+        self.power_policy_checkbox.stateChanged.connect(self.on_power_policy_changed)
+        model_layout.addRow("", self.power_policy_checkbox)
+
+        self.benchmark_button = QPushButton("Benchmark downloaded models")
+        self.benchmark_button.clicked.connect(self.on_benchmark_models)
+        self.benchmark_thread = None
+        model_layout.addRow("", self.benchmark_button)
+        self._update_benchmark_label()
+
+        # Models kept in memory by the transcriber's model manager
+        self.resident_label = QLabel("")
+        self.resident_label.setStyleSheet("color: gray; font-size: 10px;")
+        self.resident_label.setWordWrap(True)
+        model_layout.addRow("Resident models:", self.resident_label)
+
+        self.idle_spin = QSpinBox()
+        self.idle_spin.setRange(0, 24 * 60)
+        self.idle_spin.setSingleStep(5)
+        self.idle_spin.setSuffix(" min")
+        self.idle_spin.setSpecialValueText("Never")
+        self.idle_spin.setToolTip(
+            "Free the model's memory after this long without a recording. Starting a\n"
+            "recording reloads it while you speak, using fast model loading if enabled.")
+        self.idle_spin.setValue(self.settings.get_model_idle_minutes())
+        self.idle_spin.valueChanged.connect(self.on_idle_minutes_changed)
+        model_layout.addRow("Unload when idle:", self.idle_spin)
+
+        # Fast-load cache checkboxes
+        self.fast_load_checkbox = QCheckBox("Fast model loading (memory-mapped cache)")
+        self.fast_load_checkbox.setToolTip(
+            "Convert each model once into a safetensors file next to the Whisper cache.\n"
+            "Later loads map the weights instead of unpickling the checkpoint.\n"
+            "The copy is fp32, twice the size of the checkpoint: about 3 GB for turbo\n"
+            "and 6 GB for large, written on the model's first load.")
+        self.fast_load_checkbox.setChecked(self.settings.get_fast_load_enabled())
+        self.fast_load_checkbox.stateChanged.connect(self.on_fast_load_changed)
+        model_layout.addRow("", self.fast_load_checkbox)
+
+        self.prefetch_checkbox = QCheckBox("Preload model files at login")
+        self.prefetch_checkbox.setChecked(self.settings.get_prefetch_at_login())
+        self.prefetch_checkbox.stateChanged.connect(self.on_prefetch_changed)
+        model_layout.addRow("", self.prefetch_checkbox)
+
         # Force CPU checkbox
         self.force_cpu_checkbox = QCheckBox("Disable GPU (use CPU only)")
         self.force_cpu_checkbox.setChecked(self.settings.get_force_cpu())
         self.force_cpu_checkbox.stateChanged.connect(self.on_force_cpu_changed)
         model_layout.addRow("", self.force_cpu_checkbox)
 
+        # Inference threads (PyTorch on CPU)
+        self.threads_label = QLabel("")
+        self.threads_label.setStyleSheet("color: gray; font-size: 10px;")
+        self.tune_button = QPushButton("Tune CPU threads")
+        self.tune_button.setToolTip(
+            "Benchmark the loaded model with different thread counts and core\n"
+            "affinities and keep the fastest setting for this computer.")
+        self.tune_button.clicked.connect(self.on_tune_threads)
+        self.autotune_thread = None
+        model_layout.addRow("CPU threads:", self.threads_label)
+        model_layout.addRow("", self.tune_button)
+        self._update_threads_label()
+
+        self.profile_combo = QComboBox()
+        for name in Settings.DECODING_PROFILES:
+            self.profile_combo.addItem(name.capitalize(), name)
+        index = self.profile_combo.findData(self.settings.get('decoding_profile', 'balanced'))
+        if index >= 0:
+            self.profile_combo.setCurrentIndex(index)
+        self.profile_combo.setToolTip(
+            "Fast: greedy, no fallback, output capped at 8 tokens per second.\n"
+            "Balanced: Whisper's defaults, greedy with its full temperature fallback.\n"
+            "Accurate: beam search (5 beams) with the same fallback schedule.")
+        self.profile_combo.currentIndexChanged.connect(self.on_profile_changed)
+        model_layout.addRow("Decoding:", self.profile_combo)
+
+        # Short-utterance fast path checkbox
+        self.short_utterance_checkbox = QCheckBox("Fast path for short recordings")
+        self.short_utterance_checkbox.setToolTip(
+            "Encode only the recorded length of short clips instead of a padded 30 s window.\n"
+            "Falls back to the full window automatically if the result looks unreliable.")
+        self.short_utterance_checkbox.setChecked(self.settings.get_short_utterance_seconds() > 0)
+        self.short_utterance_checkbox.stateChanged.connect(self.on_short_utterance_changed)
+        model_layout.addRow("", self.short_utterance_checkbox)
+
         self.lang_combo = QComboBox()
         # Add all supported languages
         for code, name in Settings.VALID_LANGUAGES.items():
@@ -138,6 +317,62 @@ class SettingsWindow(QWidget):
         self.lang_combo.currentIndexChanged.connect(self.on_language_changed)
         model_layout.addRow("Language:", self.lang_combo)
 
+        # Candidate languages for auto-detection
+        self.candidates_list = QListWidget()
+        candidates = self.settings.get_language_candidates()
+        for code, name in Settings.VALID_LANGUAGES.items():
+            if code == 'auto':
+                continue
+            item = QListWidgetItem(name)
+            item.setData(Qt.ItemDataRole.UserRole, code)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked if code in candidates
+                               else Qt.CheckState.Unchecked)
+            self.candidates_list.addItem(item)
+        self.candidates_list.setMaximumHeight(100)
+        self.candidates_list.setEnabled(current_lang == 'auto')
+        self.candidates_list.itemChanged.connect(self.on_candidates_changed)
+        model_layout.addRow("Detect among:", self.candidates_list)
+
+        self.language_stats_label = QLabel("")
+        self.language_stats_label.setStyleSheet("color: gray; font-size: 10px;")
+        self.language_stats_label.setWordWrap(True)
+        model_layout.addRow("", self.language_stats_label)
+
+        # Domain words passed to Whisper as its initial prompt
+        self.vocabulary_edit = QLineEdit(", ".join(self.settings.get_custom_vocabulary()))
+        self.vocabulary_edit.setPlaceholderText("Product names, colleagues, jargon...")
+        self.vocabulary_edit.setToolTip(
+            "Comma-separated words and phrases Whisper should prefer when spelling.")
+        self.vocabulary_edit.editingFinished.connect(self.on_vocabulary_changed)
+        model_layout.addRow("Custom vocabulary:", self.vocabulary_edit)
+
+        # Latency percentiles for node_exporter's textfile collector
+        self.metrics_edit = QLineEdit(self.settings.get_metrics_textfile())
+        self.metrics_edit.setPlaceholderText("Off")
+        self.metrics_edit.setToolTip(
+            "Path of a .prom file rewritten with latency percentiles after each dictation,\n"
+            "e.g. in the directory of node_exporter's textfile collector.")
+        self.metrics_edit.editingFinished.connect(self.on_metrics_textfile_changed)
+        model_layout.addRow("Metrics file:", self.metrics_edit)
+
+        # Transcribed text kept on disk so identical audio is not transcribed twice
+        from .result_cache import get_result_cache_dir
+        self.result_cache_spin = QSpinBox()
+        self.result_cache_spin.setRange(0, 1024)
+        self.result_cache_spin.setSingleStep(16)
+        self.result_cache_spin.setSuffix(" MB")
+        self.result_cache_spin.setSpecialValueText("Off")
+        self.result_cache_spin.setToolTip(
+            "Keep transcription results, including the dictated text, on disk in\n"
+            f"{get_result_cache_dir()} so transcribing the same audio again is instant.")
+        self.result_cache_spin.setValue(self.settings.get_result_cache_mb())
+        self.result_cache_spin.valueChanged.connect(self.on_result_cache_changed)
+        model_layout.addRow("Result cache:", self.result_cache_spin)
+        self.clear_result_cache_button = QPushButton("Clear cached results")
+        self.clear_result_cache_button.clicked.connect(self.on_clear_result_cache)
+        model_layout.addRow("", self.clear_result_cache_button)
+
         model_group.setLayout(model_layout)
         layout.addWidget(model_group)
 
@@ -180,6 +415,22 @@ class SettingsWindow(QWidget):
 
         # Show initial model status
         self._update_initial_status()
+        self._connect_transcriber_stats()
+
+    def _update_resident_models(self):
+        """Show which models the transcriber keeps loaded"""
+        if self.transcriber:
+            self.resident_label.setText(self.transcriber.model_manager.summary())
+        else:
+            self.resident_label.setText("")
+
+    def _update_language_stats(self, stats=None):
+        """Show which languages auto-detection has picked so far"""
+        if self.transcriber and self.settings.get('language', 'auto') == 'auto':
+            self.language_stats_label.setText(
+                f"Detected: {self.transcriber.language_detector.summary()}")
+        else:
+            self.language_stats_label.setText("")
 
     def _update_initial_status(self):
         """Show status of currently loaded model"""
@@ -194,6 +445,185 @@ class SettingsWindow(QWidget):
         """Set the transcriber reference for model updates"""
         self.transcriber = transcriber
         self._update_initial_status()
+        self._connect_transcriber_stats()
+
+    def _connect_transcriber_stats(self):
+        if self.transcriber:
+            self.transcriber.transcription_stats.connect(self._update_language_stats)
+            self.transcriber.model_manager.models_changed.connect(self._update_resident_models)
+            self.transcriber.warmup_finished.connect(self._on_warmup_finished)
+        self._update_language_stats()
+        self._update_resident_models()
+
+    def _on_warmup_finished(self, stats):
+        if 'seconds' in stats and not self.is_loading:
+            text = self.status_label.text()
+            if not text.startswith(f"Model {stats['model']} loaded"):
+                text = f"Model {stats['model']} loaded"
+            self.status_label.setText(f"{text}, warmed up in {stats['seconds']:.1f}s")
+
+    def _benchmark_device(self):
+        return select_device(self.settings.get_force_cpu())
+
+    def _update_benchmark_label(self):
+        """Show measured latency and memory per model and the recommendation"""
+        from .gpu import ACCURACY_ORDER, recommend_model
+
+        benchmarks = self.settings.get_model_benchmarks(self._benchmark_device())
+        if not benchmarks:
+            self.benchmark_label.setText(
+                "No measurements yet; model choices are based on estimated memory needs.")
+            return
+
+        target = self.latency_spin.value()
+        lines = []
+        for name in ACCURACY_ORDER:
+            if name in benchmarks:
+                result = benchmarks[name]
+                latency = result['realtime_factor'] * self.target_clip_seconds
+                mark = "✓" if latency <= target else "✗"
+                lines.append(f"{mark} {name}: {latency:.1f} s, RTF {result['realtime_factor']:.2f}, "
+                             f"{result['peak_bytes'] / GB:.1f} GB")
+        recommended = recommend_model(benchmarks, target, self.target_clip_seconds)
+        lines.append(f"Recommended: {recommended}")
+        self.benchmark_label.setText("\n".join(lines))
+
+    def on_routing_changed(self, state):
+        enabled = state == Qt.CheckState.Checked.value
+        self.settings.set_routing_enabled(enabled)
+        self._on_fast_model_use_changed(enabled)
+
+    def on_two_pass_changed(self, state):
+        enabled = state == Qt.CheckState.Checked.value
+        self.settings.set_two_pass_enabled(enabled)
+        self._on_fast_model_use_changed(enabled)
+
+    def on_speculative_changed(self, state):
+        enabled = state == Qt.CheckState.Checked.value
+        self.settings.set_speculative_enabled(enabled)
+        self._on_fast_model_use_changed(enabled)
+
+    def _uses_fast_model(self):
+        return (self.settings.get_routing_enabled() or self.settings.get_two_pass_enabled()
+                or self.settings.get_speculative_enabled())
+
+    def _on_fast_model_use_changed(self, enabled):
+        self.fast_model_combo.setEnabled(self._uses_fast_model())
+        if enabled and self.transcriber:
+            # Load and warm up the fast model in the background
+            self.transcriber.warm_up()
+
+    def on_fast_model_changed(self, model_name):
+        try:
+            self.settings.set('routing_fast_model', model_name)
+        except ValueError as e:
+            logger.error(f"Failed to set fast model: {e}")
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        if self._uses_fast_model() and self.transcriber:
+            self.transcriber.warm_up()
+
+    def on_latency_target_changed(self, value):
+        self.settings.set_latency_target(value, self.target_clip_seconds)
+        self._update_benchmark_label()
+
+    def on_benchmark_models(self):
+        if self.is_loading:
+            QMessageBox.warning(self, "Loading", "Please wait for current model to finish loading.")
+            return
+        # The benchmark decodes with resident models and may evict them
+        if self.transcriber and not self.transcriber.begin_swap():
+            self.transcriber.end_swap()
+            QMessageBox.warning(self, "Benchmark", "Please wait for the transcription to finish.")
+            return
+        self.benchmark_button.setEnabled(False)
+        # Time recent recordings within the resident models' memory budget
+        recordings, model_manager = None, None
+        if self.transcriber:
+            recordings = self.transcriber.encoder_cache.recordings()
+            model_manager = self.transcriber.model_manager
+        self.benchmark_thread = BenchmarkThread(self._benchmark_device(), self.target_clip_seconds,
+                                                recordings, model_manager)
+        self.benchmark_thread.progress.connect(self.benchmark_label.setText)
+        self.benchmark_thread.finished.connect(self._on_benchmark_finished)
+        self.benchmark_thread.error.connect(self._on_benchmark_error)
+        self.benchmark_thread.start()
+
+    def _on_benchmark_finished(self, results):
+        self.settings.set_model_benchmarks(self.benchmark_thread.device, results)
+        # Models measured to run here become selectable
+        available = self.settings.get_available_models()
+        for name in Settings.ALL_MODELS:
+            if name in results and name not in available:
+                available.append(name)
+                self.model_combo.addItem(name)
+                self.fast_model_combo.addItem(name)
+        self.settings.set_available_models([m for m in Settings.ALL_MODELS if m in available])
+        self._finish_benchmark()
+        self._update_benchmark_label()
+
+    def _on_benchmark_error(self, error):
+        self._finish_benchmark()
+        self._update_benchmark_label()
+        QMessageBox.critical(self, "Benchmark Error", f"Failed to benchmark models: {error}")
+
+    def _finish_benchmark(self):
+        self.benchmark_button.setEnabled(True)
+        if self.benchmark_thread:
+            self.benchmark_thread.wait()
+            self.benchmark_thread.deleteLater()
+            self.benchmark_thread = None
+        if self.transcriber:
+            self.transcriber.end_swap()
+
+    def _update_threads_label(self):
+        from .cpu_tuning import hardware_fingerprint, resolve_thread_config
+        config = resolve_thread_config(self.settings)
+        tuned = self.settings.get_thread_config(hardware_fingerprint()) is not None
+        cores = config['affinity'] or "all cores"
+        self.threads_label.setText(
+            f"{config['intra_op_threads']} threads on {cores}"
+            f"{' (tuned)' if tuned else ''}")
+
+    def on_tune_threads(self):
+        model = self.transcriber.model if self.transcriber else None
+        if model is None or self.is_loading:
+            QMessageBox.warning(self, "Tuning", "Please wait until a model is loaded.")
+            return
+        import whisper
+        if not isinstance(model, whisper.model.Whisper) or str(model.device) != 'cpu':
+            QMessageBox.information(self, "Tuning",
+                "Thread tuning applies to the PyTorch backend on the CPU.")
+            return
+        if not self.transcriber.begin_swap():
+            self.transcriber.end_swap()
+            QMessageBox.warning(self, "Tuning", "Please wait for the transcription to finish.")
+            return
+
+        self.tune_button.setEnabled(False)
+        self.threads_label.setText("Tuning, this can take a minute...")
+        self.autotune_thread = AutotuneThread(model, self.transcriber.encoder_cache.recordings())
+        self.autotune_thread.finished.connect(self._on_tune_finished)
+        self.autotune_thread.error.connect(self._on_tune_error)
+        self.autotune_thread.start()
+
+    def _on_tune_finished(self, config):
+        self._finish_tuning()
+        self._update_threads_label()
+
+    def _on_tune_error(self, error):
+        self._finish_tuning()
+        self._update_threads_label()
+        QMessageBox.critical(self, "Tuning Error", f"Failed to tune CPU threads: {error}")
+
+    def _finish_tuning(self):
+        self.tune_button.setEnabled(True)
+        if self.transcriber:
+            self.transcriber.end_swap()
+        if self.autotune_thread:
+            self.autotune_thread.wait()
+            self.autotune_thread.deleteLater()
+            self.autotune_thread = None
 
     def on_force_cpu_changed(self, state):
         force_cpu = state == Qt.CheckState.Checked.value
@@ -201,6 +631,40 @@ class SettingsWindow(QWidget):
         QMessageBox.information(self, "Restart Required",
             "Please restart Telly Spelly for this change to take effect.")
 
+    def on_power_policy_changed(self, state):
+        self.settings.set_power_policy_enabled(state == Qt.CheckState.Checked.value)
+
+    def on_idle_minutes_changed(self, minutes):
+        self.settings.set_model_idle_minutes(minutes)
+        if self.transcriber:
+            self.transcriber.model_manager.idle_minutes = minutes
+
+    def on_fast_load_changed(self, state):
+        self.settings.set_fast_load_enabled(state == Qt.CheckState.Checked.value)
+
+    def on_prefetch_changed(self, state):
+        from .install import install_prefetch_autostart, remove_prefetch_autostart
+        enabled = state == Qt.CheckState.Checked.value
+        self.settings.set_prefetch_at_login(enabled)
+        try:
+            if enabled:
+                install_prefetch_autostart()
+            else:
+                remove_prefetch_autostart()
+        except OSError as e:
+            logger.error(f"Failed to update prefetch autostart entry: {e}")
+            QMessageBox.warning(self, "Error", str(e))
+
+    def on_profile_changed(self, index):
+        try:
+            self.settings.set('decoding_profile', self.profile_combo.currentData())
+        except ValueError as e:
+            logger.error(f"Failed to set decoding profile: {e}")
+            QMessageBox.warning(self, "Error", str(e))
+
+    def on_short_utterance_changed(self, state):
+        self.settings.set_short_utterance_enabled(state == Qt.CheckState.Checked.value)
+
     def on_language_changed(self, index):
         language_code = self.lang_combo.currentData()
         try:
@@ -208,6 +672,51 @@ class SettingsWindow(QWidget):
         except ValueError as e:
             logger.error(f"Failed to set language: {e}")
             QMessageBox.warning(self, "Error", str(e))
+        self.candidates_list.setEnabled(language_code == 'auto')
+        self._update_language_stats()
+
+    def on_candidates_changed(self, item):
+        candidates = []
+        for row in range(self.candidates_list.count()):
+            candidate = self.candidates_list.item(row)
+            if candidate.checkState() == Qt.CheckState.Checked:
+                candidates.append(candidate.data(Qt.ItemDataRole.UserRole))
+        if not candidates:
+            # Keep at least one language to detect from
+            self.candidates_list.blockSignals(True)
+            item.setCheckState(Qt.CheckState.Checked)
+            self.candidates_list.blockSignals(False)
+            return
+        try:
+            self.settings.set_language_candidates(candidates)
+        except ValueError as e:
+            logger.error(f"Failed to set language candidates: {e}")
+            QMessageBox.warning(self, "Error", str(e))
+
+    def on_vocabulary_changed(self):
+        words = [word.strip() for word in self.vocabulary_edit.text().split(",")]
+        self.settings.set_custom_vocabulary([word for word in words if word])
+
+    def on_metrics_textfile_changed(self):
+        from .telemetry import telemetry
+        self.settings.set_metrics_textfile(self.metrics_edit.text())
+        telemetry.textfile = self.settings.get_metrics_textfile() or None
+        telemetry.export()
+
+    def on_result_cache_changed(self, size_mb):
+        self.settings.set_result_cache_mb(size_mb)
+        if self.transcriber:
+            self.transcriber.set_result_cache_mb(size_mb)
+
+    def on_clear_result_cache(self):
+        from .result_cache import ResultCache
+        cache = (self.transcriber and self.transcriber.result_cache) or ResultCache()
+        entries, size = cache.summary()
+        cache.clear()
+        logger.info(f"Cleared {entries} cached transcription results")
+        QMessageBox.information(self, "Result Cache Cleared",
+            f"Removed {entries} cached transcription(s) ({size / 1024:.0f} KB) "
+            f"from {cache.directory}.")
 
     def on_device_changed(self, index):
         try:
@@ -235,12 +744,55 @@ class SettingsWindow(QWidget):
             QMessageBox.warning(self, "Error", str(e))
             return
 
-        # Disable combo while loading
+        # Switch instantly if the model is still resident
+        if self.transcriber and self.transcriber.switch_model(model_name, self.current_backend):
+            self.current_model_name = model_name
+            self.status_label.setText(f"Model {model_name} loaded")
+            self.model_changed.emit(self.transcriber.model, model_name)
+            return
+
+        self._start_model_load(model_name, self.current_backend)
+
+    def on_backend_changed(self, index):
+        backend = self.backend_combo.currentData()
+        if backend == self.current_backend:
+            return
+
+        if self.is_loading:
+            self.backend_combo.blockSignals(True)
+            self.backend_combo.setCurrentIndex(self.backend_combo.findData(self.current_backend))
+            self.backend_combo.blockSignals(False)
+            QMessageBox.warning(self, "Loading", "Please wait for current model to finish loading.")
+            return
+
+        try:
+            self.settings.set('backend', backend)
+        except ValueError as e:
+            logger.error(f"Failed to set backend: {e}")
+            QMessageBox.warning(self, "Error", str(e))
+            return
+
+        # Reload the selected model through the new backend
+        if self.transcriber and self.transcriber.switch_model(self.current_model_name, backend):
+            self.current_backend = backend
+            self.status_label.setText(f"Model {self.current_model_name} loaded")
+            self.model_changed.emit(self.transcriber.model, self.current_model_name)
+            return
+        self._start_model_load(self.current_model_name, backend)
+
+    def _start_model_load(self, model_name, backend):
+        # Disable combos while loading
         self.is_loading = True
         self.model_combo.setEnabled(False)
+        self.backend_combo.setEnabled(False)
 
-        # Start loading in background thread
-        self.loader_thread = ModelLoaderThread(model_name)
+        # Start loading in background thread; the transcriber holds new recordings
+        # until the swap is done
+        model_manager = None
+        if self.transcriber:
+            model_manager = self.transcriber.model_manager
+            self.transcriber.begin_swap()
+        self.loader_thread = ModelLoaderThread(model_name, backend, model_manager)
         self.loader_thread.progress.connect(self._on_load_progress)
         self.loader_thread.finished.connect(lambda model: self._on_load_finished(model, model_name))
         self.loader_thread.error.connect(self._on_load_error)
@@ -252,28 +804,22 @@ class SettingsWindow(QWidget):
     def _on_load_finished(self, model, model_name):
         self.is_loading = False
         self.model_combo.setEnabled(True)
+        self.backend_combo.setEnabled(True)
         self.status_label.setText(f"Model {model_name} loaded")
 
-        # Update the transcriber with new model
-        if self.transcriber:
-            # Clear old model from memory
-            import gc
-            old_model = self.transcriber.model
-            self.transcriber.model = model
-            del old_model
-            gc.collect()
-
-            # Try to free GPU memory
-            try:
-                import torch
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-            except ImportError:
-                pass
-
-            logger.info(f"Transcriber model updated to {model_name}")
-
         self.current_model_name = model_name
+        if self.loader_thread:
+            self.current_backend = self.loader_thread.backend
+            stats = self.loader_thread.stats
+            if stats and stats['strategy'] != 'resident':
+                self.status_label.setText(
+                    f"Model {model_name} loaded in {stats['seconds']:.1f}s "
+                    f"(peak memory {stats['peak_bytes'] / GB:.1f} GB)")
+
+        # Hand the new model to the transcriber; the model manager keeps the previous
+        # one resident while it fits the memory budget
+        if self.transcriber:
+            self.transcriber.set_model(model, model_name, self.current_backend)
         self.model_changed.emit(model, model_name)
 
         # Clean up thread
@@ -284,16 +830,24 @@ class SettingsWindow(QWidget):
     def _on_load_error(self, error):
         self.is_loading = False
         self.model_combo.setEnabled(True)
+        self.backend_combo.setEnabled(True)
         self.status_label.setText(f"Error: {error}")
+        if self.transcriber:
+            self.transcriber.end_swap()
 
         # Revert to previous model
         self.model_combo.blockSignals(True)
         self.model_combo.setCurrentText(self.current_model_name)
         self.model_combo.blockSignals(False)
 
-        # Restore setting
+        self.backend_combo.blockSignals(True)
+        self.backend_combo.setCurrentIndex(self.backend_combo.findData(self.current_backend))
+        self.backend_combo.blockSignals(False)
+
+        # Restore settings
         try:
             self.settings.set('model', self.current_model_name)
+            self.settings.set('backend', self.current_backend)
         except ValueError:
             pass
 
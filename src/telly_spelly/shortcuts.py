@@ -1,8 +1,12 @@
 from PyQt6.QtCore import QObject, pyqtSignal
 from PyQt6.QtGui import QKeySequence
 from PyQt6.QtWidgets import QApplication
+import json
 import logging
 from .desktop_env import get_desktop_environment, get_dbus_service_name
+from .telemetry import telemetry
+from .profiler import profiler
+from .memory import accounting
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +36,7 @@ class DBusService(dbus.service.Object):
 
     @dbus.service.method(DBUS_INTERFACE, in_signature='', out_signature='b')
     def StartRecording(self):
+        telemetry.begin()
         logger.info("D-Bus: StartRecording called")
         self.shortcuts.start_recording_triggered.emit()
         return True
@@ -44,10 +49,48 @@ class DBusService(dbus.service.Object):
 
     @dbus.service.method(DBUS_INTERFACE, in_signature='', out_signature='b')
     def ToggleRecording(self):
+        telemetry.begin()
         logger.info("D-Bus: ToggleRecording called")
         self.shortcuts.toggle_recording_triggered.emit()
         return True
 
+    @dbus.service.method(DBUS_INTERFACE, in_signature='ss', out_signature='b')
+    def RetryLastTranscription(self, language, profile):
+        """Decode the last recording again; empty arguments keep the last language/profile"""
+        logger.info(f"D-Bus: RetryLastTranscription called ({language!r}, {profile!r})")
+        from .settings import Settings
+        if ((language and language not in Settings.VALID_LANGUAGES)
+                or (profile and profile not in Settings.DECODING_PROFILES)):
+            return False
+        self.shortcuts.retry_triggered.emit(str(language), str(profile))
+        return True
+
+    @dbus.service.method(DBUS_INTERFACE, in_signature='', out_signature='s')
+    def GetMetrics(self):
+        """Rolling latency percentiles per model and stage, as JSON"""
+        return json.dumps(telemetry.metrics())
+
+    @dbus.service.method(DBUS_INTERFACE, in_signature='', out_signature='s')
+    def GetMemory(self):
+        """Resident memory broken down by model, capture buffers, caches and allocator,
+        as JSON"""
+        report = accounting.snapshot()
+        report['growth_warning'] = accounting.last_warning
+        return json.dumps(report)
+
+    @dbus.service.method(DBUS_INTERFACE, in_signature='ii', out_signature='s')
+    def StartProfiling(self, seconds, transcriptions):
+        """Sample thread stacks for seconds and trace the next transcriptions with torch's
+        profiler; returns the output directory"""
+        logger.info(f"D-Bus: StartProfiling called ({seconds}s, {transcriptions} transcriptions)")
+        return profiler.start(int(seconds), int(transcriptions))
+
+    @dbus.service.method(DBUS_INTERFACE, in_signature='', out_signature='s')
+    def StopProfiling(self):
+        """Stop profiling early; returns the collapsed-stack file, or an empty string"""
+        logger.info("D-Bus: StopProfiling called")
+        return profiler.stop() or ""
+
 
 class GlobalShortcuts(QObject):
     """Global Shortcuts via D-Bus API (supports both KDE and XFCE4)"""
@@ -55,6 +98,7 @@ class GlobalShortcuts(QObject):
     start_recording_triggered = pyqtSignal()
     stop_recording_triggered = pyqtSignal()
     toggle_recording_triggered = pyqtSignal()
+    retry_triggered = pyqtSignal(str, str)  # (language, profile), empty = keep the last
 
     def __init__(self):
         super().__init__()
@@ -186,6 +230,7 @@ class GlobalShortcuts(QObject):
 
     def _on_kde_shortcut_pressed(self, component_unique, shortcut_unique, timestamp):
         """Handle shortcut press signal from KGlobalAccel"""
+        telemetry.begin()
         logger.info(f"KGlobalAccel shortcut pressed: {component_unique}/{shortcut_unique}")
         self.toggle_recording_triggered.emit()
 
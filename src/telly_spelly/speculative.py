@@ -0,0 +1,320 @@
+"""Speculative greedy decoding: a small draft model proposes tokens, the selected model verifies them
+
+Run with: python -m telly_spelly.speculative MODEL DRAFT_MODEL [AUDIO_FILE ...]
+"""
+
+import logging
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import whisper
+from whisper.audio import N_FRAMES, N_SAMPLES, SAMPLE_RATE, log_mel_spectrogram, pad_or_trim
+from whisper.decoding import DecodingOptions, DecodingResult, DecodingTask
+from whisper.utils import compression_ratio
+
+logger = logging.getLogger(__name__)
+
+DRAFT_TOKENS = 4
+
+
+def is_compatible(model, draft_model):
+    """Check that a draft model shares the tokenizer and input features of a model"""
+    return (
+        isinstance(model, whisper.model.Whisper)
+        and isinstance(draft_model, whisper.model.Whisper)
+        and model is not draft_model
+        and model.dims.n_vocab == draft_model.dims.n_vocab
+        and model.dims.n_mels == draft_model.dims.n_mels
+    )
+
+
+def _select(logits, tokens, logit_filters):
+    """
+    Greedy choice for one position after whisper's logit filters, given the tokens before it.
+
+    Returns:
+        (token, log probability of the token after the filters)
+    """
+    logits = logits[None].clone()
+    prefix = torch.tensor([tokens])
+    for logit_filter in logit_filters:
+        logit_filter.apply(logits, prefix)
+    token = int(logits.argmax(dim=-1))
+    return token, float(F.log_softmax(logits[0], dim=-1)[token])
+
+
+def _attend(attention, q, k, v, offset=None):
+    """Multi-head attention; with an offset, queries are causal positions offset, offset+1..."""
+    n_head = attention.n_head
+    q, k, v = (t.view(*t.shape[:2], n_head, -1).permute(0, 2, 1, 3) for t in (q, k, v))
+    mask = None
+    if offset is not None and q.shape[2] > 1:
+        # Whisper's own causal mask assumes queries start at position 0
+        positions = torch.arange(k.shape[2], device=q.device)
+        mask = positions[None, :] <= offset + torch.arange(q.shape[2], device=q.device)[:, None]
+    out = F.scaled_dot_product_attention(q, k, v, attn_mask=mask)
+    return attention.out(out.permute(0, 2, 1, 3).flatten(start_dim=2))
+
+
+class DecoderState:
+    """
+    Self-attention keys/values of one decoder for one window.
+
+    Unlike whisper's kv-cache hooks this scores several new tokens per call against the
+    cache and can roll back to a shorter prefix when drafted tokens are rejected.
+    """
+
+    def __init__(self, decoder, audio_features):
+        self.decoder = decoder
+        self.length = 0
+        self.keys = [None] * len(decoder.blocks)
+        self.values = [None] * len(decoder.blocks)
+        self.cross = [(block.cross_attn.key(audio_features), block.cross_attn.value(audio_features))
+                      for block in decoder.blocks]
+
+    def forward(self, tokens):
+        """Logits for each of tokens (a list), which follow the cached ones"""
+        decoder = self.decoder
+        offset = self.length
+        x = torch.tensor([tokens], device=decoder.positional_embedding.device)
+        x = (decoder.token_embedding(x)
+             + decoder.positional_embedding[offset:offset + len(tokens)])
+        for i, block in enumerate(decoder.blocks):
+            h = block.attn_ln(x)
+            k, v = block.attn.key(h), block.attn.value(h)
+            if offset:
+                k = torch.cat([self.keys[i], k], dim=1)
+                v = torch.cat([self.values[i], v], dim=1)
+            self.keys[i], self.values[i] = k, v
+            x = x + _attend(block.attn, block.attn.query(h), k, v, offset)
+            h = block.cross_attn_ln(x)
+            x = x + _attend(block.cross_attn, block.cross_attn.query(h), *self.cross[i])
+            x = x + block.mlp(block.mlp_ln(x))
+        self.length = offset + len(tokens)
+        x = decoder.ln(x)
+        return (x @ decoder.token_embedding.weight.to(x.dtype).T).float()[0]
+
+    def truncate(self, length):
+        """Forget cached positions from length on"""
+        if length < self.length:
+            self.keys = [k[:, :length] for k in self.keys]
+            self.values = [v[:, :length] for v in self.values]
+            self.length = length
+
+
+def decode_window(model, draft_model, mel, language, draft_tokens=DRAFT_TOKENS,
+                  sample_len=None, prompt=None):
+    """
+    Greedily decode one 30-second mel window with speculative decoding.
+
+    The draft model proposes up to draft_tokens tokens one step at a time; the model then
+    scores all of them in a single decoder pass and keeps the longest prefix matching its
+    own greedy choice, plus its own token at the first mismatch. The output is the model's
+    plain greedy decoding without timestamps (up to floating-point ties).
+
+    Returns:
+        (result, stats): a whisper DecodingResult with the model's average log probability,
+        no-speech probability and compression ratio, as whisper's quality checks use them,
+        and stats with 'tokens', 'proposed', 'accepted', 'target_steps', 'draft_steps',
+        'target_seconds' (the model's decoder passes after the prompt) and
+        'decode_seconds' (the whole loop, draft included)
+    """
+    options = DecodingOptions(language=language, without_timestamps=True, fp16=False,
+                              sample_len=sample_len, prompt=prompt)
+    task = DecodingTask(model, options)
+    draft_task = DecodingTask(draft_model, options)
+    tokenizer = task.tokenizer
+    eot = tokenizer.eot
+    initial = list(task.initial_tokens)
+    max_len = min(len(initial) + task.sample_len, model.dims.n_text_ctx + 1)
+
+    stats = {'proposed': 0, 'accepted': 0, 'target_steps': 0, 'draft_steps': 0,
+             'target_seconds': 0.0}
+
+    with torch.no_grad():
+        audio_features = model.embed_audio(mel.to(model.device)[None])
+        target = DecoderState(model.decoder, audio_features)
+        draft = DecoderState(draft_model.decoder,
+                             draft_model.embed_audio(mel.to(draft_model.device)[None]))
+
+        loop_start = time.perf_counter()
+        tokens = list(initial)
+        logits = target.forward(tokens)
+        stats['target_steps'] += 1
+        no_speech_prob = float(logits[task.sot_index].softmax(dim=-1)[tokenizer.no_speech])
+        token, sum_logprob = _select(logits[-1], tokens, task.logit_filters)
+        tokens.append(token)
+
+        while tokens[-1] != eot and len(tokens) < max_len:
+            # Draft proposals, one cheap step each
+            proposals = []
+            feed = tokens[draft.length:]
+            for _ in range(min(draft_tokens, max_len - len(tokens))):
+                draft_logits = draft.forward(feed)
+                stats['draft_steps'] += 1
+                proposal, _ = _select(draft_logits[-1], tokens + proposals,
+                                      draft_task.logit_filters)
+                proposals.append(proposal)
+                if proposal == eot:
+                    break
+                feed = [proposal]
+            stats['proposed'] += len(proposals)
+
+            # One verification pass over the last token and all proposals
+            pass_start = time.perf_counter()
+            logits = target.forward([tokens[-1]] + proposals)
+            stats['target_seconds'] += time.perf_counter() - pass_start
+            stats['target_steps'] += 1
+            accepted = []
+            for i in range(len(proposals) + 1):
+                choice, logprob = _select(logits[i], tokens + accepted, task.logit_filters)
+                accepted.append(choice)
+                if len(tokens) + len(accepted) <= max_len:
+                    sum_logprob += logprob
+                if i == len(proposals) or choice != proposals[i] or choice == eot:
+                    break
+            stats['accepted'] += sum(1 for a, p in zip(accepted, proposals) if a == p)
+
+            tokens = (tokens + accepted)[:max_len]
+            # Everything but the newest token stays cached
+            target.truncate(len(tokens) - 1)
+            draft.truncate(len(tokens) - 1)
+
+        stats['decode_seconds'] = time.perf_counter() - loop_start
+
+    sampled = tokens[len(initial):]
+    if eot in sampled:
+        sampled = sampled[:sampled.index(eot)]
+    stats['tokens'] = len(sampled)
+    text = tokenizer.decode(sampled).strip()
+    result = DecodingResult(audio_features=audio_features[0], language=language,
+                            tokens=sampled, text=text,
+                            avg_logprob=sum_logprob / (len(sampled) + 1),
+                            no_speech_prob=no_speech_prob, temperature=0.0,
+                            compression_ratio=compression_ratio(text))
+    return result, stats
+
+
+def transcribe_speculative(model, draft_model, audio, language, draft_tokens=DRAFT_TOKENS,
+                           max_tokens_per_second=None, prompt=None, mel=None):
+    """
+    Transcribe a 16 kHz clip of at most 30 seconds with speculative greedy decoding.
+
+    mel, if given, is the clip's log_mel_spectrogram(audio, padding=N_SAMPLES) computed
+    beforehand.
+
+    Returns:
+        Result dict like transcribe(), or None when the result fails whisper's quality
+        checks (see decoding.needs_fallback()). 'speculative' holds the acceptance rate,
+        the ratio of decoder passes of the selected model ('pass_ratio') and the
+        wall-clock 'speedup' of the decoding loop: greedy decoding is estimated as one
+        pass per token at the measured time of the model's passes, against the loop's
+        measured time including the draft model
+    """
+    from .decoding import is_silence, needs_fallback, sample_len_for_duration
+
+    if len(audio) > N_SAMPLES:
+        raise ValueError("transcribe_speculative() only takes clips of at most 30 seconds")
+    start_time = time.monotonic()
+    if mel is None:
+        mel = log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES)
+    n_frames = mel.shape[-1] - N_FRAMES
+    window = pad_or_trim(mel[:, :max(n_frames, 1)], N_FRAMES)
+    duration = len(audio) / SAMPLE_RATE
+    result, stats = decode_window(model, draft_model, window, language, draft_tokens,
+                                  sample_len_for_duration(model, duration,
+                                                          max_tokens_per_second),
+                                  prompt)
+    elapsed = time.monotonic() - start_time
+
+    verify_steps = stats['target_steps'] - 1
+    seconds_per_pass = stats['target_seconds'] / verify_steps if verify_steps else 0.0
+    # Without speculation the selected model runs one decoder pass per token
+    greedy_steps = stats['tokens'] + 1
+    speculative = {
+        **stats,
+        'acceptance_rate': stats['accepted'] / stats['proposed'] if stats['proposed'] else 0.0,
+        'pass_ratio': greedy_steps / stats['target_steps'],
+        'speedup': (greedy_steps * seconds_per_pass / stats['decode_seconds']
+                    if seconds_per_pass else 1.0),
+        'elapsed': elapsed,
+    }
+    logger.info(f"Speculative decoding: {stats['tokens']} tokens, acceptance "
+                f"{speculative['acceptance_rate']:.0%}, {stats['target_steps']} passes "
+                f"instead of {greedy_steps}, decoding {stats['decode_seconds']:.2f}s "
+                f"(x{speculative['speedup']:.2f} wall clock vs greedy, estimated)")
+
+    reason = needs_fallback(result, duration, max_tokens_per_second)
+    if reason:
+        logger.info(f"Speculative result failed quality checks ({reason})")
+        return None
+    text = "" if is_silence(result) else result.text
+    return {
+        'text': text,
+        'segments': [{
+            'id': 0,
+            'start': 0.0,
+            'end': duration,
+            'text': text,
+            'tokens': result.tokens,
+            'temperature': 0.0,
+            'avg_logprob': result.avg_logprob,
+            'compression_ratio': result.compression_ratio,
+            'no_speech_prob': result.no_speech_prob,
+        }],
+        'language': language,
+        'fallbacks': 0,
+        'speculative': speculative,
+    }
+
+
+def compare_with_greedy(model, draft_model, audios, language='en'):
+    """
+    Parity and speed check against whisper's own greedy decoding without timestamps.
+
+    Returns:
+        List of dicts with 'match', 'greedy_seconds', 'speculative_seconds', 'speedup' and
+        'acceptance_rate' per clip
+    """
+    rows = []
+    for audio in audios:
+        mel = pad_or_trim(log_mel_spectrogram(audio, model.dims.n_mels, padding=N_SAMPLES),
+                          N_FRAMES)
+        options = DecodingOptions(language=language, without_timestamps=True, fp16=False)
+        start = time.perf_counter()
+        expected = whisper.decode(model, mel.to(model.device), options).text.strip()
+        greedy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result, stats = decode_window(model, draft_model, mel, language)
+        speculative_seconds = time.perf_counter() - start
+        rows.append({
+            'match': result.text == expected,
+            'greedy_seconds': greedy_seconds,
+            'speculative_seconds': speculative_seconds,
+            'speedup': greedy_seconds / speculative_seconds,
+            'acceptance_rate': stats['accepted'] / stats['proposed'] if stats['proposed'] else 0.0,
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    from .benchmark import load_clips
+
+    logging.basicConfig(level=logging.WARNING)
+    if len(sys.argv) < 3:
+        print("Usage: python -m telly_spelly.speculative MODEL DRAFT_MODEL [AUDIO_FILE ...]")
+        sys.exit(1)
+    target = whisper.load_model(sys.argv[1], device='cpu')
+    draft = whisper.load_model(sys.argv[2], device='cpu')
+    if not is_compatible(target, draft):
+        print(f"{sys.argv[2]} cannot draft for {sys.argv[1]} (different vocabulary or mel bins)")
+        sys.exit(1)
+    clips = [clip.astype(np.float32) for clip in load_clips(sys.argv[3:], count=4)]
+    for row in compare_with_greedy(target, draft, clips):
+        print(f"match={row['match']} greedy {row['greedy_seconds']:.2f}s "
+              f"speculative {row['speculative_seconds']:.2f}s (x{row['speedup']:.2f}), "
+              f"acceptance {row['acceptance_rate']:.0%}")
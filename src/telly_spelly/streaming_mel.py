@@ -0,0 +1,216 @@
+"""Log-mel features computed while recording, so only encoder and decoder work is left at stop
+
+Run with: python -m telly_spelly.streaming_mel [AUDIO_FILE ...]
+"""
+
+import logging
+import queue
+import sys
+import threading
+
+import numpy as np
+import torch
+from whisper.audio import HOP_LENGTH, N_FFT, N_FRAMES, N_SAMPLES, log_mel_spectrogram, mel_filters
+
+logger = logging.getLogger(__name__)
+
+# Models whose encoder takes 128 mel bins instead of 80
+MODELS_128_MELS = ('large', 'turbo')
+
+
+def model_n_mels(model_name):
+    """Mel bins of a model's input features"""
+    return 128 if model_name in MODELS_128_MELS else 80
+
+
+class StreamingLogMel:
+    """
+    Growing log-mel spectrogram of a 16 kHz stream.
+
+    Mel power frames are computed as soon as the samples under their STFT window have
+    arrived. finish() adds the frames over the end of the clip and whisper's zero padding
+    and applies the log scaling, which needs the maximum of the whole clip; the result
+    equals log_mel_spectrogram(audio, n_mels, padding=N_SAMPLES) of the same samples.
+    """
+
+    def __init__(self, n_mels=80):
+        self.n_mels = n_mels
+        self.n_samples = 0
+        self._filters = mel_filters('cpu', n_mels)
+        self._window = torch.hann_window(N_FFT)
+        # Samples from the first frame not computed yet, in the reflect-padded stream
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._started = False
+        self._frames = []
+
+    @property
+    def n_frames(self):
+        """Number of mel frames computed so far"""
+        return sum(frames.shape[-1] for frames in self._frames)
+
+    @property
+    def nbytes(self):
+        """Bytes held by buffered samples and computed frames"""
+        return self._pending.nbytes + sum(frames.numel() * frames.element_size()
+                                          for frames in self._frames)
+
+    def append(self, samples):
+        """Add float32 samples (or int16 PCM bytes) and compute the frames they complete"""
+        if isinstance(samples, bytes):
+            samples = np.frombuffer(samples, dtype=np.int16).astype(np.float32) / 32768.0
+        self.n_samples += len(samples)
+        self._pending = np.concatenate([self._pending, samples])
+        if not self._started:
+            # torch.stft(center=True) reflects the first N_FFT // 2 samples around the start
+            if len(self._pending) <= N_FFT // 2:
+                return
+            self._pending = np.concatenate(
+                [self._pending[1:N_FFT // 2 + 1][::-1], self._pending])
+            self._started = True
+        self._compute()
+
+    def _compute(self, max_frames=None):
+        n_frames = (len(self._pending) - N_FFT) // HOP_LENGTH + 1
+        if max_frames is not None:
+            n_frames = min(n_frames, max_frames)
+        if n_frames <= 0:
+            return
+        segment = torch.from_numpy(self._pending[:(n_frames - 1) * HOP_LENGTH + N_FFT].copy())
+        stft = torch.stft(segment, N_FFT, HOP_LENGTH, window=self._window, center=False,
+                          return_complex=True)
+        self._frames.append(self._filters @ (stft.abs() ** 2))
+        self._pending = self._pending[n_frames * HOP_LENGTH:]
+
+    def finish(self):
+        """
+        Log-mel features of everything appended.
+
+        Returns:
+            tensor (n_mels, n_samples // HOP_LENGTH + N_FRAMES), like whisper's
+            log_mel_spectrogram(audio, n_mels, padding=N_SAMPLES)
+        """
+        total_frames = (self.n_samples + N_SAMPLES) // HOP_LENGTH
+        if not self._started:
+            # Too short to have started: reflect around the start of the zero-padded clip
+            samples, self._pending = self._pending, np.zeros(0, dtype=np.float32)
+            self.append(np.concatenate([samples, np.zeros(N_FFT, dtype=np.float32)]))
+            self.n_samples -= N_FFT
+        else:
+            self._pending = np.concatenate([self._pending, np.zeros(N_FFT, dtype=np.float32)])
+        # Frames past these only cover zero padding
+        content_frames = -(-(self.n_samples + N_FFT // 2) // HOP_LENGTH)
+        self._compute(min(total_frames, content_frames) - self.n_frames)
+
+        frames = self._frames + [torch.zeros(self.n_mels, total_frames - self.n_frames)]
+        log_spec = torch.clamp(torch.cat(frames, dim=-1), min=1e-10).log10()
+        log_spec = torch.maximum(log_spec, log_spec.max() - 8.0)
+        return (log_spec + 4.0) / 4.0
+
+
+class BackgroundLogMel:
+    """
+    StreamingLogMel fed from a queue by its own thread, so the audio callback only
+    queues the raw PCM buffers and never runs an STFT.
+
+    A failure in the feature thread drops the features; the recording is unaffected.
+    """
+
+    def __init__(self, n_mels=80):
+        self.streaming_mel = StreamingLogMel(n_mels)
+        self.failed = False
+        self._queue = queue.SimpleQueue()
+        # Updated by the audio callback and the feature thread
+        self._queued_bytes = 0
+        self._queued_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="streaming-mel", daemon=True)
+        self._thread.start()
+
+    @property
+    def n_frames(self):
+        return self.streaming_mel.n_frames
+
+    @property
+    def nbytes(self):
+        """Bytes held by queued buffers, buffered samples and computed frames"""
+        with self._queued_lock:
+            queued = self._queued_bytes
+        return queued + self.streaming_mel.nbytes
+
+    def append(self, data):
+        """Queue int16 PCM bytes (or float32 samples); only waits on the byte counter"""
+        with self._queued_lock:
+            self._queued_bytes += len(data)
+        self._queue.put(data)
+
+    def _run(self):
+        from .profiler import profiler
+
+        profiler.register_thread('streaming-mel')
+        try:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    return
+                with self._queued_lock:
+                    self._queued_bytes -= len(data)
+                if self.failed:
+                    continue
+                try:
+                    self.streaming_mel.append(data)
+                except Exception as e:
+                    logger.warning(f"Incremental feature extraction failed: {e}")
+                    self.failed = True
+        finally:
+            profiler.unregister_thread()
+
+    def close(self):
+        """Stop the feature thread without waiting, discarding the features"""
+        self.failed = True
+        self._queue.put(None)
+
+    def finish(self):
+        """
+        Wait for the queued buffers and return the features (see StreamingLogMel.finish()),
+        or None if extraction failed
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self.failed:
+            return None
+        return self.streaming_mel.finish()
+
+
+def check_parity(audio, n_mels=80, chunk_size=1024):
+    """
+    Compare streamed features of a 16 kHz clip, fed chunk_size samples at a time, with
+    whisper's log_mel_spectrogram.
+
+    Returns:
+        Largest absolute difference
+    """
+    streaming = StreamingLogMel(n_mels)
+    for start in range(0, len(audio), chunk_size):
+        streaming.append(audio[start:start + chunk_size])
+    expected = log_mel_spectrogram(audio, n_mels, padding=N_SAMPLES)
+    streamed = streaming.finish()
+    if streamed.shape != expected.shape:
+        raise ValueError(f"Shape mismatch: {tuple(streamed.shape)} != {tuple(expected.shape)}")
+    return float((streamed - expected).abs().max())
+
+
+if __name__ == "__main__":
+    from .benchmark import load_clips
+
+    logging.basicConfig(level=logging.WARNING)
+    clips = [clip.astype(np.float32) for clip in load_clips(sys.argv[1:], count=4)]
+    # Very short clips exercise the reflection at the start of the padded clip
+    clips += [clips[0][:100], clips[0][:1000]]
+    failed = False
+    for index, clip in enumerate(clips):
+        for n_mels in (80, 128):
+            for chunk_size in (160, 1024, 4096):
+                diff = check_parity(clip, n_mels, chunk_size)
+                failed = failed or diff > 1e-4
+                print(f"clip {index} ({len(clip)} samples) n_mels={n_mels} "
+                      f"chunk={chunk_size}: max difference {diff:.2e}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,237 @@
+"""End-to-end dictation latency: stage timestamps, rolling per-model histograms and a
+Prometheus textfile exporter"""
+
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Stages of one dictation, in order. A trace starts at the shortcut or D-Bus trigger
+# (or at stream_open when recording was started from the tray):
+#   trigger        shortcut or D-Bus call received
+#   stream_open    audio stream started
+#   first_audio    first audio buffer captured
+#   stop           recording stopped
+#   saved          recording processed and written
+#   model_start    model ready, transcription starting
+#   first_decode   first decoder pass, i.e. the first window is encoded
+#   result         text ready
+#   clipboard      text in the clipboard
+STAGES = ['trigger', 'stream_open', 'first_audio', 'stop', 'saved', 'model_start',
+          'first_decode', 'result', 'clipboard']
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# A trigger not followed by a recording within this long is forgotten
+TRIGGER_TIMEOUT = 5.0
+# Traces that never reach the clipboard (failed recordings) are dropped after this long
+MAX_TRACE_AGE = 600.0
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty sequence"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class LatencyTelemetry:
+    """
+    Collects stage timestamps per dictation and keeps rolling latency histograms.
+
+    The trace being recorded is the current one; once saved it is keyed by its audio file
+    so the transcription worker can mark it. Completed traces feed the last `window`
+    durations of every stage (time since the previous stage reached), the whole dictation
+    ('total') and the wait after stopping ('stop_to_clipboard'), per model.
+    Marks may come from any thread.
+    """
+
+    def __init__(self, window=500, textfile=None):
+        self.window = window
+        # Prometheus textfile collector output, rewritten after each dictation
+        self.textfile = textfile
+        self._lock = threading.Lock()
+        self._current = None
+        self._traces = {}
+        self._delivering = deque()
+        self._histograms = {}
+        self.completed = 0
+
+    def _new_trace(self):
+        return {'stages': {}, 'model': None, 'created': time.monotonic()}
+
+    def begin(self):
+        """A shortcut or D-Bus trigger arrived; starts a trace unless one is recording"""
+        now = time.monotonic()
+        with self._lock:
+            current = self._current
+            # A trigger while recording stops it
+            if (current and 'stream_open' in current['stages']
+                    and 'stop' not in current['stages']):
+                return
+            self._current = self._new_trace()
+            self._current['stages']['trigger'] = now
+
+    def mark(self, stage, key=None, model=None):
+        """Record the first time a trace reaches a stage (key None: the current recording)"""
+        now = time.monotonic()
+        with self._lock:
+            if key is None:
+                current = self._current
+                # A recording started from the tray, or one whose trigger led nowhere
+                if (current is None or stage == 'stream_open'
+                        and ('stream_open' in current['stages']
+                             or now - current['created'] > TRIGGER_TIMEOUT)):
+                    self._current = self._new_trace()
+                trace = self._current
+            else:
+                trace = self._traces.get(key)
+                if trace is None:
+                    return
+            trace['stages'].setdefault(stage, now)
+            if model and not trace['model']:
+                trace['model'] = model
+            if stage == 'result' and key is not None:
+                self._delivering.append(key)
+
+    def attach(self, key):
+        """The current recording was saved as key (its audio file)"""
+        now = time.monotonic()
+        with self._lock:
+            trace, self._current = self._current, None
+            if trace is None:
+                return
+            trace['stages'].setdefault('saved', now)
+            self._traces[key] = trace
+            cutoff = now - MAX_TRACE_AGE
+            for old in [k for k, t in self._traces.items() if t['created'] < cutoff]:
+                del self._traces[old]
+
+    @contextmanager
+    def watch_first_decode(self, model, keys):
+        """Mark first_decode for keys at the model's first decoder step inside the block"""
+        decoder = getattr(model, 'decoder', None)
+        if not keys or decoder is None or not hasattr(decoder, 'token_embedding'):
+            yield
+            return
+        seen = []
+
+        def hook(module, inputs, output):
+            if not seen:
+                seen.append(True)
+                for key in keys:
+                    self.mark('first_decode', key)
+
+        # Every decoding path (whisper's, speculative, prompt prefix) embeds tokens first
+        handle = decoder.token_embedding.register_forward_hook(hook)
+        try:
+            yield
+        finally:
+            handle.remove()
+
+    def delivered(self, copied=True):
+        """The oldest marked result reached the user (or was empty, copied=False)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._delivering:
+                key = self._delivering.popleft()
+                trace = self._traces.pop(key, None)
+                if trace is not None:
+                    break
+            else:
+                return None
+            if not copied or not trace['model']:
+                return None
+            trace['stages']['clipboard'] = now
+            self._record(trace, key)
+            self.completed += 1
+        self.export()
+        return trace
+
+    def _record(self, trace, key=None):
+        stages = trace['stages']
+        reached = [stage for stage in STAGES if stage in stages]
+        durations = {stage: stages[stage] - stages[previous]
+                     for previous, stage in zip(reached, reached[1:])}
+        durations['total'] = stages['clipboard'] - stages[reached[0]]
+        if 'stop' in stages:
+            durations['stop_to_clipboard'] = stages['clipboard'] - stages['stop']
+        histograms = self._histograms.setdefault(trace['model'], {})
+        for stage, seconds in durations.items():
+            histograms.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+        logger.info(f"Dictation latency with {trace['model']}: "
+                    f"{durations['total']:.2f}s total, "
+                    + ", ".join(f"{stage} +{seconds * 1000:.0f} ms"
+                                for stage, seconds in durations.items()
+                                if stage in STAGES),
+                    extra={'job_id': os.path.basename(key) if key else None,
+                           'stage': 'clipboard', 'duration': durations['total']})
+
+    def metrics(self):
+        """
+        {model: {stage: {'count', 'sum', 'p50', 'p95', 'p99'}}} of the rolling windows, in
+        seconds
+        """
+        with self._lock:
+            snapshot = {model: {stage: list(values) for stage, values in stages.items()}
+                        for model, stages in self._histograms.items()}
+        return {model: {stage: {'count': len(values), 'sum': sum(values),
+                                **{f"p{int(q * 100)}": percentile(values, q)
+                                   for q in QUANTILES}}
+                        for stage, values in stages.items()}
+                for model, stages in snapshot.items()}
+
+    def prometheus_text(self, version=None):
+        """The metrics in Prometheus text exposition format"""
+        name = "telly_spelly_latency_seconds"
+        lines = [
+            "# HELP telly_spelly_info Telly Spelly version",
+            "# TYPE telly_spelly_info gauge",
+            f'telly_spelly_info{{version="{_escape(version or _version())}"}} 1',
+            f"# HELP {name} Dictation stage latency over the last {self.window} dictations",
+            f"# TYPE {name} summary",
+        ]
+        for model, stages in sorted(self.metrics().items()):
+            for stage, summary in sorted(stages.items()):
+                labels = f'model="{_escape(model)}",stage="{_escape(stage)}"'
+                for q in QUANTILES:
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} '
+                                 f'{summary[f"p{int(q * 100)}"]:.6f}')
+                lines.append(f"{name}_sum{{{labels}}} {summary['sum']:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Rewrite the Prometheus textfile, if one is configured"""
+        if not self.textfile:
+            return
+        try:
+            directory = os.path.dirname(self.textfile)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.textfile}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, self.textfile)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics to {self.textfile}: {e}")
+
+
+def _version():
+    try:
+        from importlib.metadata import version
+        return version("telly-spelly")
+    except Exception:
+        return "unknown"
+
+
+# Shared by the recorder, the transcriber, the D-Bus service and the tray
+telemetry = LatencyTelemetry()
@@ -1,69 +1,587 @@
-from PyQt6.QtCore import QObject, pyqtSignal, QThread, QTimer
+from PyQt6.QtCore import QObject, pyqtSignal, QThread
 import whisper
 import os
 import logging
 import time
-from .settings import Settings
+from .settings import Settings, is_model_cached
+from .language import LanguageDetector
+from .model_manager import ModelManager, current_rss_bytes, select_device
+from .cpu_tuning import apply_thread_config, resolve_thread_config
+from .routing import ModelRouter, wav_duration
+from .speculative import is_compatible, transcribe_speculative
+from .encoder_cache import EncoderCache, redecode
+from .result_cache import ResultCache
+from .vocabulary import format_prompt, prefix_state_bytes
+from .power_policy import PowerPolicy
+from .telemetry import telemetry
+from .profiler import profiler
 logger = logging.getLogger(__name__)
 
+
+def _average_logprob(result):
+    logprobs = [segment['avg_logprob'] for segment in result.get('segments', [])
+                if 'avg_logprob' in segment]
+    return sum(logprobs) / len(logprobs) if logprobs else None
+
+
+def transcribe_audio(model, audio, language=None, short_utterance_seconds=0,
+                     profile='balanced', language_detector=None, longform_workers=1,
+                     longform_min_seconds=60, draft_model=None, speculative_tokens=4,
+                     prompt=None, mel=None):
+    """
+    Transcribe a 16 kHz waveform with the given model.
+
+    Clips no longer than short_utterance_seconds first go through the truncated-context
+    fast path (PyTorch models only); if its quality checks fail the full 30-second window
+    is decoded as usual. Clips longer than longform_min_seconds are split at pauses and
+    transcribed by longform_workers processes (named PyTorch CPU models with safetensors
+    installed, see longform.can_parallelize()).
+    Decoding follows the named profile from Settings.DECODING_PROFILES.
+    Without a language, the language_detector (if given) picks it before decoding.
+    With a compatible draft_model, greedy profiles decode clips of up to 30 s
+    speculatively: draft_model proposes speculative_tokens tokens per decoder pass of the
+    model. Output failing whisper's quality checks is decoded again the normal way.
+    A prompt (custom vocabulary) steers all paths except the ONNX backend.
+    A mel computed while recording (log_mel_spectrogram(audio, padding=N_SAMPLES)) is used
+    by the short-utterance and speculative paths instead of computing it again.
+
+    Returns:
+        whisper result dict, with the number of temperature fallbacks under "fallbacks"
+        and the detection details under "language_detection"
+    """
+    from .decoding import count_fallbacks, transcribe_options, transcribe_short
+
+    decoding = Settings.DECODING_PROFILES[profile]
+    duration = len(audio) / whisper.audio.SAMPLE_RATE
+
+    if mel is not None and (not isinstance(model, whisper.model.Whisper)
+                            or mel.shape[0] != model.dims.n_mels):
+        mel = None
+
+    detection = None
+    if language is None and language_detector is not None:
+        detection = language_detector.detect(model, audio)
+        language = detection['language']
+
+    result = None
+    if longform_workers > 1 and duration > longform_min_seconds:
+        from .longform import can_parallelize, transcribe_long
+        if can_parallelize(model):
+            result = transcribe_long(model, audio, language, longform_workers, profile, prompt)
+        else:
+            logger.info("Long-form workers need a named CPU model and safetensors, "
+                        "transcribing in this process")
+
+    elif (short_utterance_seconds and isinstance(model, whisper.model.Whisper)
+            and duration <= short_utterance_seconds):
+        result = transcribe_short(model, audio, language=language,
+                                  beam_size=decoding['beam_size'],
+                                  max_tokens_per_second=decoding['max_tokens_per_second'],
+                                  prompt=prompt, mel=mel)
+
+    if (result is None and draft_model is not None and decoding['beam_size'] is None
+            and len(audio) <= whisper.audio.N_SAMPLES and is_compatible(model, draft_model)):
+        if language is None and not model.is_multilingual:
+            language = 'en'
+        elif language is None:
+            # Speculation needs a fixed language for both models' prompts; detected like
+            # whisper's transcribe() does, on the mel of the padded audio
+            window = (mel if mel is not None
+                      else whisper.log_mel_spectrogram(audio, model.dims.n_mels,
+                                                       padding=whisper.audio.N_SAMPLES))
+            _, probs = model.detect_language(
+                whisper.pad_or_trim(window, whisper.audio.N_FRAMES).to(model.device))
+            language = max(probs, key=probs.get)
+        result = transcribe_speculative(model, draft_model, audio, language,
+                                        speculative_tokens, decoding['max_tokens_per_second'],
+                                        prompt, mel)
+
+    if result is None:
+        options = transcribe_options(model, decoding, duration)
+        result = model.transcribe(audio, fp16=False, language=language, initial_prompt=prompt,
+                                  **options)
+        result["fallbacks"] = count_fallbacks(result, options['temperature'])
+
+    if detection is not None:
+        language_detector.observe(_average_logprob(result))
+        result["language_detection"] = detection
+    return result
+
+
 class TranscriptionWorker(QThread):
     finished = pyqtSignal(str)
     progress = pyqtSignal(str)
     error = pyqtSignal(str)
+    stats = pyqtSignal(dict)  # Per-transcription details (profile, fallbacks, timings...)
+    batch_done = pyqtSignal()  # All queued files of this worker have been handled
+    # Two-pass mode: the fast model's text, then (draft, final) instead of finished
+    draft = pyqtSignal(str)
+    refined = pyqtSignal(str, str)
 
-    def __init__(self, model, audio_file, language=None):
+    def __init__(self, model, audio_files, language=None, options=None, max_batch_size=1,
+                 model_provider=None, thread_config=None, routing=None,
+                 draft_provider=None, draft_model_name=None, speculative_provider=None,
+                 model_name=None, encoder_cache=None, backend='torch', result_cache=None,
+                 features=None, policy=None):
         super().__init__()
+        # Power policy decision that adjusted the model or threads, recorded in the stats
+        self.policy = policy
+        # Identical audio with identical settings is answered from disk
+        self.result_cache = result_cache
+        self.backend = backend
+        # Keeps each recording and its first encoder window for retries
+        self.encoder_cache = encoder_cache
+        self.model_name = model_name
+        self.cache_keys = []
+        # Speculative decoding: loads the fast model that proposes tokens for the final pass
+        self.speculative_provider = speculative_provider
+        # Two-pass mode: loads the fast model that drafts each clip before the final pass
+        self.draft_provider = draft_provider
+        self.draft_model_name = draft_model_name
+        self.thread_config = thread_config
+        # Routing decision that picked the model, recorded in the stats
+        self.routing = routing
+        # None if the model was unloaded; model_provider then reloads it in this thread
         self.model = model
-        self.audio_file = audio_file
+        self.model_provider = model_provider
+        # A single path or a list of paths transcribed as one batch
+        self.audio_files = [audio_files] if isinstance(audio_files, str) else list(audio_files)
+        # Log-mel features computed while recording, per audio file (or None)
+        self.features = list(features) if features else [None] * len(self.audio_files)
         self.language = language
+        # Keyword arguments for transcribe_audio()
+        self.options = options or {}
+        self.max_batch_size = max_batch_size
+
+    def _transcribe_clip(self, model, audio, language, key=None, mel=None, files=(),
+                         **overrides):
+        """
+        Transcribe one clip. A failure is logged and returned as an empty result with
+        "error" set, so the other clips of the batch are still delivered.
+        """
+        options = {**self.options, **overrides}
+        try:
+            with telemetry.watch_first_decode(model, files):
+                if self.encoder_cache is None or model is not self.model:
+                    return transcribe_audio(model, audio, language, **options, mel=mel)
+                with self.encoder_cache.capture(key, model, self.model_name):
+                    return transcribe_audio(model, audio, language, **options, mel=mel)
+        except Exception as e:
+            logger.error(f"Transcription error: {e}")
+            return {"text": "", "segments": [], "language": language, "fallbacks": 0,
+                    "error": str(e)}
+
+    def _transcribe(self, audios, model, cache_keys=None, mels=None, files=None):
+        """
+        Transcribe all clips, batching short ones through shared encoder passes when possible.
+
+        Clips longer than one 30 s window always go through whisper's transcribe() (or the
+        long-form workers), which seeks, timestamps and conditions on previous text.
+        files are the clips' audio files, for latency telemetry.
+        """
+        from .decoding import transcribe_batch
+
+        # Speculative decoding runs clip by clip
+        can_batch = (isinstance(model, whisper.model.Whisper) and self.max_batch_size > 1
+                     and self.options.get('draft_model') is None)
+        short = [index for index, audio in enumerate(audios)
+                 if len(audio) <= whisper.audio.N_SAMPLES]
+        if not can_batch or len(short) < 2:
+            short = []
+
+        results = [None] * len(audios)
+        for index, audio in enumerate(audios):
+            if index not in short:
+                results[index] = self._transcribe_clip(
+                    model, audio, self.language, cache_keys[index] if cache_keys else None,
+                    mels[index] if mels else None, [files[index]] if files else [])
+
+        # Group clips by language so each batch shares one tokenizer
+        detector = self.options.get('language_detector')
+        detections = [None] * len(audios)
+        groups = {}
+        for index in short:
+            language = self.language
+            if language is None and detector is not None:
+                detections[index] = detector.detect(model, audios[index])
+                language = detections[index]['language']
+            groups.setdefault(language, []).append(index)
+
+        profile = Settings.DECODING_PROFILES[self.options.get('profile', 'balanced')]
+        for language, indices in groups.items():
+            try:
+                with telemetry.watch_first_decode(model,
+                                                  [files[i] for i in indices] if files else []):
+                    batch = transcribe_batch(model, [audios[i] for i in indices], language,
+                                             profile['max_tokens_per_second'],
+                                             self.max_batch_size, self.options.get('prompt'))
+            except Exception as e:
+                logger.error(f"Batched transcription failed ({e}), transcribing clips one by one")
+                batch = [{"needs_fallback": True} for _ in indices]
+            for index, result in zip(indices, batch):
+                if result.pop("needs_fallback"):
+                    logger.info("Batched result failed quality checks, re-transcribing clip")
+                    fallbacks = result.get("fallbacks", 0) + 1
+                    result = self._transcribe_clip(
+                        model, audios[index], language,
+                        cache_keys[index] if cache_keys else None,
+                        mels[index] if mels else None, language_detector=None)
+                    result["fallbacks"] = result.get("fallbacks", 0) + fallbacks
+                if detections[index] is not None:
+                    result["language_detection"] = detections[index]
+                results[index] = result
+        return results
 
     def run(self):
+        profiler.register_thread('transcription')
         try:
-            if not os.path.exists(self.audio_file):
-                raise FileNotFoundError(f"Audio file not found: {self.audio_file}")
+            if self.thread_config:
+                apply_thread_config(self.thread_config)
+
+            for audio_file in self.audio_files:
+                if not os.path.exists(audio_file):
+                    raise FileNotFoundError(f"Audio file not found: {audio_file}")
 
             self.progress.emit("Loading audio file...")
+            audios = [whisper.load_audio(audio_file) for audio_file in self.audio_files]
+            mels = []
+            for audio, mel in zip(audios, self.features):
+                # Features made while recording must cover exactly the decoded samples
+                if (mel is not None and mel.shape[-1] - whisper.audio.N_FRAMES
+                        != len(audio) // whisper.audio.HOP_LENGTH):
+                    logger.warning("Features computed while recording do not match the audio")
+                    mel = None
+                mels.append(mel)
+            if self.encoder_cache is not None:
+                self.cache_keys = [self.encoder_cache.add(audio, mel)
+                                   for audio, mel in zip(audios, mels)]
+
+            results = [None] * len(audios)
+            result_keys = []
+            if self.result_cache is not None:
+                result_keys = [self.result_cache.key(audio, self.model_name, self.backend,
+                                                     self.language, self.options)
+                               for audio in audios]
+                results = [self.result_cache.get(key) for key in result_keys]
+            todo = [index for index, result in enumerate(results) if result is None]
+            todo_audios = [audios[index] for index in todo]
+            todo_mels = [mels[index] for index in todo]
+            todo_files = [self.audio_files[index] for index in todo]
+            todo_keys = [self.cache_keys[index] for index in todo] if self.cache_keys else None
+
+            if todo and self.model is None:
+                self.progress.emit("Loading model...")
+                self.model = self.model_provider()
+            for audio_file in todo_files:
+                telemetry.mark('model_start', audio_file,
+                               model=self.draft_model_name if self.draft_provider
+                               else self.model_name)
+
+            drafts = [""] * len(audios)
+            draft_elapsed = None
+            if self.draft_provider and todo:
+                self.progress.emit("Drafting with fast model...")
+                start_time = time.monotonic()
+                for index, result in zip(todo, self._transcribe(todo_audios,
+                                                                self.draft_provider(),
+                                                                mels=todo_mels,
+                                                                files=todo_files)):
+                    drafts[index] = result["text"].strip()
+                draft_elapsed = time.monotonic() - start_time
+                for audio_file, text in zip(self.audio_files, drafts):
+                    if text:
+                        telemetry.mark('result', audio_file)
+                        self.draft.emit(text)
+
+            if self.speculative_provider and todo:
+                self.options = {**self.options, 'draft_model': self.speculative_provider()}
 
-            # Load and transcribe
+            # Transcribe
             self.progress.emit("Processing audio with Whisper...")
-            result = self.model.transcribe(
-                self.audio_file,
-                fp16=False,
-                language=self.language
-            )
+            start_time = time.monotonic()
+            if todo:
+                # In two-pass mode the draft pass already reached the first decode
+                files = None if self.draft_provider else todo_files
+                with profiler.torch_trace(self.model_name):
+                    transcribed = self._transcribe(todo_audios, self.model, todo_keys,
+                                                   todo_mels, files)
+                for index, result in zip(todo, transcribed):
+                    results[index] = result
+                    if result_keys and 'error' not in result:
+                        self.result_cache.put(result_keys[index], result)
+            elapsed = time.monotonic() - start_time
+
+            for index, (audio, result, draft) in enumerate(zip(audios, results, drafts)):
+                if 'error' in result:
+                    # Only this clip failed; the others of the batch are still delivered
+                    if draft:
+                        logger.warning("Refinement failed, keeping the draft")
+                        continue
+                    self.error.emit(f"Transcription failed: {result['error']}")
+                    self.finished.emit("")
+                    continue
+                stats = {
+                    'duration': len(audio) / whisper.audio.SAMPLE_RATE,
+                    'elapsed': elapsed,
+                    'batch_size': len(audios),
+                    'profile': self.options.get('profile', 'balanced'),
+                    'fallbacks': result.get('fallbacks', 0),
+                    'short_path': 'audio_ctx' in result,
+                    'language': result.get('language'),
+                    'streamed_features': mels[index] is not None,
+                }
+                if self.routing:
+                    stats['model'] = self.routing['model']
+                    stats['routing'] = self.routing
+                if self.policy and self.policy['rule']:
+                    stats['model'] = self.model_name
+                    stats['power_policy'] = self.policy['rule']
+                    stats['threads'] = self.policy['threads']
+                if result_keys:
+                    stats['result_cache'] = 'miss' if index in todo else 'hit'
+                    stats['result_cache_hit_rate'] = self.result_cache.hit_rate
+                speculative = result.get('speculative')
+                if speculative:
+                    stats['speculative_acceptance'] = speculative['acceptance_rate']
+                    stats['speculative_speedup'] = speculative['speedup']
+                detection = result.get('language_detection')
+                if detection:
+                    stats['language_probability'] = detection['probability']
+                    stats['language_source'] = detection['source']
+                text = result["text"].strip()
+                if self.cache_keys:
+                    self.encoder_cache.set_result(self.cache_keys[index],
+                                                  language=result.get('language'),
+                                                  profile=stats['profile'],
+                                                  model=self.model_name, text=text)
+                if draft_elapsed is not None:
+                    stats['draft_model'] = self.draft_model_name
+                    stats['draft_elapsed'] = draft_elapsed
+                    stats['refined_changed'] = text != draft
+                logger.info(f"Transcription stats: {stats}",
+                            extra={'job_id': os.path.basename(self.audio_files[index]),
+                                   'stage': 'result', 'duration': elapsed})
+                self.stats.emit(stats)
+
+                if draft:
+                    # The draft already reached the user; offer the final text as refinement
+                    self.refined.emit(draft, text)
+                    continue
+                telemetry.mark('result', self.audio_files[index], model=self.model_name)
+                if not text:
+                    logger.error("Transcription error: No text was transcribed")
+                    self.error.emit("Transcription failed: No text was transcribed")
+                    self.finished.emit("")
+                    continue
+
+                self.progress.emit("Transcription completed!")
+                logger.info(f"Transcribed text: {text[:100]}...")
+                self.finished.emit(text)
             
+        except Exception as e:
+            logger.error(f"Transcription error: {e}")
+            self.error.emit(f"Transcription failed: {str(e)}")
+            self.finished.emit("")
+        finally:
+            # Clean up the temporary files
+            for audio_file in self.audio_files:
+                try:
+                    if os.path.exists(audio_file):
+                        os.remove(audio_file)
+                except Exception as e:
+                    logger.error(f"Failed to remove temporary file: {e}")
+            profiler.unregister_thread()
+            self.batch_done.emit()
+
+class RetryWorker(QThread):
+    """Decodes a cached recording again with another language or decoding profile,
+    reusing its encoder outputs when the same model is still loaded"""
+    finished = pyqtSignal(str)
+    progress = pyqtSignal(str)
+    error = pyqtSignal(str)
+    stats = pyqtSignal(dict)
+    batch_done = pyqtSignal()
+
+    def __init__(self, model, encoder_cache, cache_key, language, profile, model_name,
+                 model_provider=None, thread_config=None, prompt=None):
+        super().__init__()
+        self.prompt = prompt
+        self.model = model
+        self.model_provider = model_provider
+        self.model_name = model_name
+        self.encoder_cache = encoder_cache
+        self.cache_key = cache_key
+        self.language = language
+        self.profile = profile
+        self.thread_config = thread_config
+
+    def run(self):
+        profiler.register_thread('transcription')
+        try:
+            if self.thread_config:
+                apply_thread_config(self.thread_config)
+            cached = self.encoder_cache.get(self.cache_key)
+            if cached is None:
+                raise ValueError("The recording is no longer cached")
+            audio = cached[0]
+            if self.model is None:
+                self.progress.emit("Loading model...")
+                self.model = self.model_provider()
+
+            self.progress.emit("Decoding again...")
+            start_time = time.monotonic()
+            hits = self.encoder_cache.hits
+            if isinstance(self.model, whisper.model.Whisper):
+                windows = self.encoder_cache.features(self.cache_key, self.model,
+                                                      self.model_name, audio)
+                with profiler.torch_trace(f"{self.model_name}-retry"):
+                    result = redecode(self.model, windows, self.language,
+                                      Settings.DECODING_PROFILES[self.profile], self.prompt)
+            else:
+                # The ONNX encoder output cannot be decoded on its own; skip only ffmpeg
+                result = transcribe_audio(self.model, audio, self.language, profile=self.profile,
+                                          prompt=self.prompt)
+            elapsed = time.monotonic() - start_time
+
             text = result["text"].strip()
+            stats = {
+                'duration': len(audio) / whisper.audio.SAMPLE_RATE,
+                'elapsed': elapsed,
+                'batch_size': 1,
+                'profile': self.profile,
+                'fallbacks': result.get('fallbacks', 0),
+                'short_path': False,
+                'language': result.get('language'),
+                'model': self.model_name,
+                'retry': True,
+                'encoder_windows_reused': self.encoder_cache.hits - hits,
+            }
+            logger.info(f"Retry stats: {stats}")
+            self.stats.emit(stats)
+            self.encoder_cache.set_result(self.cache_key, language=result.get('language'),
+                                          profile=self.profile, model=self.model_name,
+                                          text=text)
             if not text:
-                raise ValueError("No text was transcribed")
-                
+                self.error.emit("Transcription failed: No text was transcribed")
+                self.finished.emit("")
+                return
             self.progress.emit("Transcription completed!")
-            logger.info(f"Transcribed text: {text[:100]}...")
             self.finished.emit(text)
-            
+
         except Exception as e:
-            logger.error(f"Transcription error: {e}")
-            self.error.emit(f"Transcription failed: {str(e)}")
+            logger.error(f"Retry error: {e}")
+            self.error.emit(f"Retry failed: {str(e)}")
             self.finished.emit("")
         finally:
-            # Clean up the temporary file
-            try:
-                if os.path.exists(self.audio_file):
-                    os.remove(self.audio_file)
-            except Exception as e:
-                logger.error(f"Failed to remove temporary file: {e}")
+            profiler.unregister_thread()
+            self.batch_done.emit()
+
+
+class WarmupWorker(QThread):
+    """Runs a throwaway transcription so the first real dictation does not pay for
+    allocator growth, kernel selection and thread-pool start-up"""
+    finished = pyqtSignal(dict)
+
+    def __init__(self, model_provider, model_name, seconds, options=None, thread_config=None):
+        super().__init__()
+        self.thread_config = thread_config
+        # Loads the model in this thread if it is not resident yet
+        self.model_provider = model_provider
+        self.model_name = model_name
+        self.seconds = seconds
+        self.options = options or {}
+
+    def run(self):
+        from .benchmark import synthetic_clip
+
+        stats = {'model': self.model_name, 'clip_seconds': self.seconds}
+        start_time = time.monotonic()
+        try:
+            if self.thread_config:
+                apply_thread_config(self.thread_config)
+            model = self.model_provider()
+            transcribe_audio(model, synthetic_clip(self.seconds), 'en', **self.options)
+            stats['seconds'] = time.monotonic() - start_time
+            logger.info(f"Warm-up of {self.model_name} took {stats['seconds']:.2f}s")
+        except Exception as e:
+            stats['error'] = str(e)
+            logger.warning(f"Warm-up of {self.model_name} failed: {e}")
+        self.finished.emit(stats)
+
+
+class ReloadWorker(QThread):
+    """
+    Loads an unloaded model in the background while the user is still speaking.
+
+    The model manager loads without holding its lock, so the main thread can keep
+    looking up resident models (tray, shortcuts, routing) during the load.
+    """
+    finished = pyqtSignal(dict)
+
+    def __init__(self, model_provider, model_name):
+        super().__init__()
+        self.model_provider = model_provider
+        self.model_name = model_name
+
+    def run(self):
+        stats = {'model': self.model_name}
+        start_time = time.monotonic()
+        rss_before = current_rss_bytes()
+        try:
+            self.model_provider()
+            stats['seconds'] = time.monotonic() - start_time
+            stats['rss_added'] = max(0, current_rss_bytes() - rss_before)
+            logger.info(f"Reloaded {self.model_name} in {stats['seconds']:.2f}s")
+        except Exception as e:
+            stats['error'] = str(e)
+            logger.warning(f"Reloading {self.model_name} failed: {e}")
+        self.finished.emit(stats)
+
 
 class WhisperTranscriber(QObject):
     transcription_progress = pyqtSignal(str)
     transcription_finished = pyqtSignal(str)
     transcription_error = pyqtSignal(str)
+    transcription_stats = pyqtSignal(dict)
+    warmup_finished = pyqtSignal(dict)
+    model_reloaded = pyqtSignal(dict)
+    transcription_draft = pyqtSignal(str)
+    transcription_refined = pyqtSignal(str, str)  # (draft, final)
     
     def __init__(self):
         super().__init__()
-        self.model = None
+        settings = Settings()
+        self.model_manager = ModelManager(settings.get_model_memory_budget_gb(),
+                                          settings.get_model_idle_minutes())
+        # Active model identity; the model itself lives in the model manager
+        self.model_name = None
+        self.backend = 'torch'
+        self.device = 'cpu'
         self.worker = None
-        self._cleanup_timer = QTimer()
-        self._cleanup_timer.timeout.connect(self._cleanup_worker)
-        self._cleanup_timer.setSingleShot(True)
+        # True while a model swap is running; queued recordings wait for the new model
+        self.swapping = False
+        # Background warm-up pass after a load or swap; timings kept apart from user latency
+        self.warmup_worker = None
+        self.warmup_stats = None
+        self.warmup_pending = []
+        self.preload_worker = None
+        # Background reload of an idle-unloaded model, started when recording starts
+        self.reload_worker = None
+        self.reload_stats = None
+        self.reload_waited_since = None
+        # Recordings waiting for the running worker to finish
+        self.pending_files = []
+        # Log-mel features computed while recording, by queued file
+        self.pending_features = {}
+        # Recent recordings for retries, and a requested (language, profile) retry
+        self.encoder_cache = EncoderCache(settings.get_encoder_cache_recordings())
+        self.result_cache = None
+        self.set_result_cache_mb(settings.get_result_cache_mb())
+        self.pending_retry = None
+        self.last_stats = None
+        self.language_detector = LanguageDetector()
+        # Battery- and load-aware adjustments; its state_source can be replaced for tests
+        self.power_policy = PowerPolicy(settings.get_power_policy_rules())
         self.load_model()
         
     def load_model(self):
@@ -73,40 +591,244 @@ class WhisperTranscriber(QObject):
 
             # Determine device - use GPU if available and not force CPU mode
             force_cpu = settings.get_force_cpu()
-
-            if not force_cpu:
-                try:
-                    import torch
-                    if torch.cuda.is_available():
-                        device = "cuda"
-                        logger.info(f"Loading Whisper model: {model_name} on GPU ({torch.cuda.get_device_name()})")
-                    else:
-                        device = "cpu"
-                        logger.info(f"Loading Whisper model: {model_name} on CPU (CUDA not available)")
-                except ImportError:
-                    device = "cpu"
-                    logger.info(f"Loading Whisper model: {model_name} on CPU (PyTorch not available)")
-            else:
-                device = "cpu"
-                logger.info(f"Loading Whisper model: {model_name} on CPU (force CPU mode enabled)")
+            device = select_device(force_cpu)
+            reason = " (force CPU mode enabled)" if force_cpu else ""
+            logger.info(f"Loading Whisper model: {model_name} on {device}{reason}")
 
             # Redirect whisper's logging to our logger
             import logging as whisper_logging
             whisper_logging.getLogger("whisper").setLevel(logging.WARNING)
 
-            self.model = whisper.load_model(model_name, device=device)
-            logger.info(f"Model loaded successfully on {device}")
+            self.model_name = model_name
+            self.backend = settings.get('backend', 'torch')
+            self.device = "cpu" if self.backend == 'onnx' else device
+            self._get_model()
+            logger.info(f"Model loaded successfully on {self.device} ({self.backend})")
+            self.warm_up()
 
         except Exception as e:
             logger.error(f"Failed to load Whisper model: {e}")
             raise
+
+    @property
+    def model(self):
+        """The active model if it is resident, else None"""
+        return self.model_manager.get_resident(self.model_name, self.backend, self.device)
+
+    def _get_model(self):
+        """The active model, reloaded through the model manager if it was evicted"""
+        return self.model_manager.get(self.model_name, self.backend, self.device, activate=True)
+
+    def set_model(self, model, model_name, backend='torch'):
+        """Make an already loaded model the active one; the previous stays resident"""
+        device = model.device if isinstance(model.device, str) else model.device.type
+        self.model_manager.put(model_name, model, backend, device)
+        self.model_name = model_name
+        self.backend = backend
+        self.device = device
+        logger.info(f"Transcriber model updated to {model_name}")
+        self.end_swap()
+        self.warm_up()
+
+    def begin_swap(self):
+        """
+        Hold queued recordings and warm-ups while a new model loads or the models are
+        being tuned or benchmarked.
+
+        Returns:
+            True if no transcription, warm-up or model load is running, so the models
+            may be used from another thread
+        """
+        self.swapping = True
+        return not ((self.worker and self.worker.isRunning()) or self._warming_up()
+                    or (self.preload_worker and self.preload_worker.isRunning())
+                    or self._reloading())
+
+    def end_swap(self):
+        """Release recordings and warm-ups queued during a swap"""
+        self.swapping = False
+        if ((self.pending_files or self.pending_retry)
+                and not (self.worker and self.worker.isRunning())):
+            self._start_next_batch()
+        else:
+            self._start_next_warmup()
+
+    def switch_model(self, model_name, backend='torch'):
+        """Switch to a model that is already resident; returns False if it must be loaded"""
+        device = select_device(Settings().get_force_cpu())
+        if self.model_manager.get_resident(model_name, backend, device, activate=True) is None:
+            return False
+        self.model_name = model_name
+        self.backend = backend
+        self.device = device
+        logger.info(f"Transcriber switched to resident model {model_name}")
+        self.warm_up()
+        return True
+
+    def warm_up(self):
+        """
+        Run the warm-up pass for the active model in the background, followed by the
+        fast model (loading it) when routing, two-pass mode or speculative decoding uses it
+        """
+        settings = Settings()
+        self.warmup_pending = [self.model_name]
+        fast_model = settings.get('routing_fast_model', 'base')
+        uses_fast_model = (settings.get_routing_enabled() or settings.get_two_pass_enabled()
+                           or settings.get_speculative_enabled())
+        if uses_fast_model and fast_model != self.model_name:
+            self.warmup_pending.append(fast_model)
+        self._start_next_warmup()
+
+    def _start_next_warmup(self):
+        settings = Settings()
+        seconds = settings.get_warmup_seconds()
+        if (not self.warmup_pending or self.swapping or self._warming_up()
+                or (self.preload_worker and self.preload_worker.isRunning())
+                or (self.worker and self.worker.isRunning())):
+            return
+        model_name = self.warmup_pending.pop(0)
+        if not seconds:
+            if (model_name != self.model_name and not self.model_manager.is_resident(
+                    model_name, self.backend, self.device)):
+                # Still load the fast model, just without a warm-up pass; in the
+                # background, and without holding back transcriptions
+                self.preload_worker = ReloadWorker(self._model_provider(model_name), model_name)
+                self.preload_worker.finished.connect(self._on_preload_finished)
+                self.preload_worker.start()
+                return
+            self._start_next_warmup()
+            return
+
+        options = self._transcription_options(settings)
+        # Keep the warm-up out of language statistics and off the process pool
+        options.update(language_detector=None, longform_workers=1)
+        self.warmup_worker = WarmupWorker(self._model_provider(model_name), model_name,
+                                          seconds, options, self._torch_thread_config(settings))
+        self.warmup_worker.finished.connect(self._on_warmup_finished)
+        self.warmup_worker.start()
+
+    def _torch_thread_config(self, settings):
+        """Thread configuration for inference workers; ONNX sets its threads per session"""
+        return resolve_thread_config(settings) if self.backend == 'torch' else None
+
+    def _model_provider(self, model_name):
+        """Callable returning a model, loading it through the model manager if needed"""
+        if model_name == self.model_name:
+            return self._get_model
+        backend, device = self.backend, self.device
+        return lambda: self.model_manager.get(model_name, backend, device)
+
+    def _warming_up(self):
+        return self.warmup_worker is not None and self.warmup_worker.isRunning()
+
+    def _on_preload_finished(self, stats):
+        worker = self.preload_worker
+        if worker:
+            worker.wait()
+            worker.deleteLater()
+            self.preload_worker = None
+        self._start_next_warmup()
+
+    def set_result_cache_mb(self, size_mb):
+        """Enable (size_mb > 0), resize or disable the on-disk result cache"""
+        if not size_mb:
+            self.result_cache = None
+        elif self.result_cache is None:
+            self.result_cache = ResultCache(size_mb * 1024 ** 2)
+        else:
+            self.result_cache.max_bytes = size_mb * 1024 ** 2
+
+    def memory_usage(self, vram=False):
+        """Bytes held by caches and queued features, for memory accounting"""
+        if vram:
+            device_type = self.device.split(':')[0]
+            return ({'prompt prefix states': prefix_state_bytes(device_type)}
+                    if device_type != 'cpu' else {})
+        return {
+            'encoder cache': self.encoder_cache.nbytes(),
+            'queued features': sum(mel.numel() * mel.element_size()
+                                   for mel in list(self.pending_features.values())
+                                   if mel is not None),
+            'prompt prefix states': prefix_state_bytes('cpu'),
+        }
+
+    def prepare(self):
+        """
+        Start reloading the active model if it was unloaded, e.g. for being idle.
+
+        Called when a recording starts, so loading overlaps with the user speaking.
+
+        Returns:
+            True if a reload was started
+        """
+        if (self.model_name is None or self.swapping or self._reloading()
+                or self.model_manager.is_resident(self.model_name, self.backend, self.device)):
+            return False
+        logger.info(f"Reloading {self.model_name} while recording")
+        self.reload_stats = None
+        self.reload_waited_since = None
+        self.reload_worker = ReloadWorker(self._get_model, self.model_name)
+        self.reload_worker.finished.connect(self._on_reload_finished)
+        self.reload_worker.start()
+        return True
+
+    def _reloading(self):
+        return self.reload_worker is not None and self.reload_worker.isRunning()
+
+    def _on_reload_finished(self, stats):
+        worker = self.reload_worker
+        if worker:
+            worker.wait()
+            worker.deleteLater()
+            self.reload_worker = None
+        # How long a finished recording had to wait for the model
+        stats['waited'] = (time.monotonic() - self.reload_waited_since
+                           if self.reload_waited_since is not None else 0.0)
+        self.reload_waited_since = None
+        self.reload_stats = stats
+        self.model_reloaded.emit(stats)
+        if ((self.pending_files or self.pending_retry)
+                and not (self.worker and self.worker.isRunning())):
+            self._start_next_batch()
+
+    def _on_warmup_finished(self, stats):
+        worker = self.warmup_worker
+        if worker:
+            worker.wait()
+            worker.deleteLater()
+            self.warmup_worker = None
+        self.warmup_stats = stats
+        self.warmup_finished.emit(stats)
+        # Recordings made during the warm-up were held back; the model is not
+        # safe to run from two threads at once
+        if not (self.worker and self.worker.isRunning()):
+            if self.pending_files or self.pending_retry:
+                self._start_next_batch()
+            else:
+                self._start_next_warmup()
         
-    def _cleanup_worker(self):
-        if self.worker:
-            if self.worker.isFinished():
-                self.worker.deleteLater()
-                self.worker = None
-                
+    def _transcription_options(self, settings):
+        """Keyword arguments for transcribe_audio() taken from the current settings"""
+        self.language_detector.set_candidates(settings.get_language_candidates())
+        return {
+            'short_utterance_seconds': settings.get_short_utterance_seconds(),
+            'profile': settings.get('decoding_profile', 'balanced'),
+            'language_detector': self.language_detector,
+            'longform_workers': settings.get_longform_workers(),
+            'longform_min_seconds': settings.get_longform_min_seconds(),
+            'speculative_tokens': settings.get_speculative_tokens(),
+            'prompt': format_prompt(settings.get_custom_vocabulary()),
+        }
+
+    def _on_stats(self, stats):
+        if self.reload_stats is not None:
+            # The first transcription after a reload reports it
+            stats['model_reload_seconds'] = self.reload_stats.get('seconds')
+            stats['model_reload_waited'] = self.reload_stats['waited']
+            self.reload_stats = None
+        self.last_stats = stats
+        self.transcription_stats.emit(stats)
+
     def transcribe(self, audio_file):
         """Transcribe audio file using Whisper"""
         try:
@@ -117,11 +839,13 @@ class WhisperTranscriber(QObject):
             self.transcription_progress.emit("Processing audio...")
             
             # Run transcription with language setting
-            result = self.model.transcribe(
-                audio_file,
-                fp16=False,
-                language=None if language == 'auto' else language
+            result = transcribe_audio(
+                self._get_model(),
+                whisper.load_audio(audio_file),
+                None if language == 'auto' else language,
+                **self._transcription_options(settings)
             )
+            logger.info(f"Transcription used {result.get('fallbacks', 0)} fallback(s)")
             
             text = result["text"].strip()
             if not text:
@@ -142,9 +866,82 @@ class WhisperTranscriber(QObject):
             logger.error(f"Transcription failed: {e}")
             self.transcription_error.emit(str(e))
 
-    def transcribe_file(self, audio_file):
+    def transcribe_file(self, audio_file, features=None):
+        """
+        Queue a recording; queued recordings are transcribed together in one batch.
+
+        features are the recording's log-mel features if they were computed while
+        recording (see AudioRecorder.take_features()).
+        """
+        self.pending_files.append(audio_file)
+        if features is not None:
+            self.pending_features[audio_file] = features
         if self.worker and self.worker.isRunning():
-            logger.warning("Transcription already in progress")
+            logger.info(f"Transcription in progress, {len(self.pending_files)} recording(s) queued")
+            return
+        self._start_next_batch()
+
+    def retry_last(self, language=None, profile=None):
+        """
+        Transcribe the last recording again, only rerunning the decoder when possible.
+
+        Args:
+            language: language code, 'auto' to detect it, or None to keep the last one
+            profile: decoding profile name, or None to keep the last one
+
+        Returns:
+            False if there is no cached recording to retry
+        """
+        key = self.encoder_cache.last()
+        cached = self.encoder_cache.get(key) if key else None
+        if cached is None:
+            return False
+        last = cached[1] or {}
+        if language is None:
+            language = last.get('language')
+        elif language == 'auto':
+            language = None
+        if profile is None:
+            profile = last.get('profile') or Settings().get('decoding_profile', 'balanced')
+        logger.info(f"Retrying last recording (language={language}, profile={profile})")
+        self.pending_retry = (key, language, profile)
+        if not (self.worker and self.worker.isRunning()):
+            self._start_next_batch()
+        return True
+
+    def _start_retry(self):
+        key, language, profile = self.pending_retry
+        self.pending_retry = None
+        self.transcription_progress.emit("Decoding again...")
+        self.worker = RetryWorker(self.model, self.encoder_cache, key, language, profile,
+                                  self.model_name, model_provider=self._get_model,
+                                  thread_config=self._torch_thread_config(Settings()),
+                                  prompt=format_prompt(Settings().get_custom_vocabulary()))
+        self.worker.finished.connect(self.transcription_finished)
+        self.worker.progress.connect(self.transcription_progress)
+        self.worker.error.connect(self.transcription_error)
+        self.worker.stats.connect(self._on_stats)
+        self.worker.batch_done.connect(self._on_batch_done)
+        self.worker.start()
+
+    def _start_next_batch(self):
+        if not self.pending_files and not self.pending_retry:
+            return
+        if self.swapping:
+            logger.info("Model swap in progress, transcription will start once it is loaded")
+            self.transcription_progress.emit("Waiting for model to load...")
+            return
+        if self._warming_up():
+            logger.info("Warm-up in progress, transcription will start once it is done")
+            return
+        if self._reloading():
+            logger.info("Model is reloading, transcription will start once it is loaded")
+            self.transcription_progress.emit("Waiting for model to load...")
+            if self.reload_waited_since is None:
+                self.reload_waited_since = time.monotonic()
+            return
+        if not self.pending_files:
+            self._start_retry()
             return
 
         # Get language setting
@@ -152,12 +949,104 @@ class WhisperTranscriber(QObject):
         language = settings.get('language', 'auto')
         lang = None if language == 'auto' else language
 
+        max_batch_size = settings.get_max_batch_size()
+        audio_files = self.pending_files[:max_batch_size]
+        self.pending_files = self.pending_files[max_batch_size:]
+
+        routing = None
+        model_name = self.model_name
+        if settings.get_routing_enabled():
+            routing = self._route(audio_files, settings)
+            model_name = routing['model']
+
+        thread_config = resolve_thread_config(settings)
+        policy = None
+        if settings.get_power_policy_enabled():
+            self.power_policy.rules = settings.get_power_policy_rules()
+            policy = self.power_policy.evaluate(
+                model_name, thread_config.get('intra_op_threads') or os.cpu_count() or 1,
+                self._is_available)
+            model_name = policy['model']
+            thread_config['intra_op_threads'] = policy['threads']
+
+        # Two-pass mode: the fast model drafts first unless it already does the job
+        draft_model = settings.get('routing_fast_model', 'base')
+        draft_provider = None
+        if settings.get_two_pass_enabled() and draft_model != model_name:
+            if policy and policy['defer_refinement']:
+                # The draft is final; Retry Last Recording can still refine it later
+                model_name = draft_model
+            elif len(audio_files) == 1:
+                draft_provider = self._model_provider(draft_model)
+            else:
+                # Each draft would replace the previous one in the clipboard before its
+                # refinement arrives; queued recordings get their final text directly
+                logger.info(f"{len(audio_files)} recordings queued, skipping the draft pass")
+        model = (self.model if model_name == self.model_name
+                 else self._resident_model(model_name))
+        # Speculative decoding: the fast model proposes tokens the selected model verifies
+        speculative_provider = None
+        if settings.get_speculative_enabled() and draft_model != model_name:
+            speculative_provider = self._model_provider(draft_model)
+
         # Emit initial progress status before starting worker
         self.transcription_progress.emit("Starting transcription...")
 
-        self.worker = TranscriptionWorker(self.model, audio_file, lang)
+        self.worker = TranscriptionWorker(model, audio_files, lang,
+                                          self._transcription_options(settings),
+                                          max_batch_size,
+                                          model_provider=self._model_provider(model_name),
+                                          thread_config=(thread_config if self.backend == 'torch'
+                                                         else None),
+                                          routing=routing,
+                                          draft_provider=draft_provider,
+                                          draft_model_name=draft_model,
+                                          speculative_provider=speculative_provider,
+                                          model_name=model_name,
+                                          encoder_cache=self.encoder_cache,
+                                          backend=self.backend,
+                                          result_cache=self.result_cache,
+                                          features=[self.pending_features.pop(path, None)
+                                                    for path in audio_files],
+                                          policy=policy)
         self.worker.finished.connect(self.transcription_finished)
         self.worker.progress.connect(self.transcription_progress)
         self.worker.error.connect(self.transcription_error)
-        self.worker.finished.connect(lambda: self._cleanup_timer.start(1000))
-        self.worker.start() 
\ No newline at end of file
+        self.worker.stats.connect(self._on_stats)
+        self.worker.draft.connect(self.transcription_draft)
+        self.worker.refined.connect(self.transcription_refined)
+        self.worker.batch_done.connect(self._on_batch_done)
+        self.worker.start()
+
+    def _is_available(self, model_name):
+        """Whether a model can be used without downloading it"""
+        return (self.model_manager.is_resident(model_name, self.backend, self.device)
+                or is_model_cached(model_name))
+
+    def _resident_model(self, model_name):
+        return self.model_manager.get_resident(model_name, self.backend, self.device)
+
+    def _route(self, audio_files, settings):
+        """Pick the model for a batch from its length, the queue behind it and the SLO"""
+        router = ModelRouter(settings.get_model_benchmarks(self.device),
+                             settings.get_latency_target(),
+                             settings.get('routing_fast_model', 'base'))
+        decision = router.route(
+            self.model_name,
+            sum(wav_duration(path) for path in audio_files),
+            queued_seconds=sum(wav_duration(path) for path in self.pending_files),
+            queue_depth=len(self.pending_files),
+            is_resident=lambda name: self.model_manager.is_resident(name, self.backend,
+                                                                    self.device))
+        logger.info(f"Routing {len(audio_files)} recording(s) to {decision['model']}: "
+                    f"{decision['reason']}")
+        return decision
+
+    def _on_batch_done(self):
+        # The worker's run() is returning; wait for it, then pick up queued recordings
+        worker = self.worker
+        if worker:
+            worker.wait()
+            worker.deleteLater()
+            self.worker = None
+        self._start_next_batch()
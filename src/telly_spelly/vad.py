@@ -0,0 +1,77 @@
+"""Lightweight energy-based voice activity detection on 16 kHz audio"""
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+
+
+def frame_energies_db(audio, frame_seconds=FRAME_SECONDS):
+    """Get the RMS level in dBFS of consecutive frames of a float waveform"""
+    frame_length = int(SAMPLE_RATE * frame_seconds)
+    n_frames = len(audio) // frame_length
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = np.asarray(audio[:n_frames * frame_length], dtype=np.float32).reshape(n_frames, -1)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_regions(audio, min_silence_seconds=0.3, min_speech_seconds=0.1,
+                   margin_db=12.0, floor_db=-55.0):
+    """
+    Find speech regions as (start, end) sample ranges.
+
+    A frame counts as speech when it is margin_db above the estimated noise floor
+    (10th percentile of frame levels) and above floor_db. Gaps shorter than
+    min_silence_seconds are bridged and blips shorter than min_speech_seconds dropped.
+    """
+    energies = frame_energies_db(audio)
+    if len(energies) == 0:
+        return []
+
+    threshold = max(np.percentile(energies, 10) + margin_db, floor_db)
+    voiced = energies > threshold
+    frame_length = int(SAMPLE_RATE * FRAME_SECONDS)
+
+    regions = []
+    start = None
+    for i, is_voiced in enumerate(voiced):
+        if is_voiced and start is None:
+            start = i
+        elif not is_voiced and start is not None:
+            regions.append([start, i])
+            start = None
+    if start is not None:
+        regions.append([start, len(voiced)])
+
+    merged = []
+    max_gap = int(min_silence_seconds / FRAME_SECONDS)
+    for region in regions:
+        if merged and region[0] - merged[-1][1] < max_gap:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+
+    min_frames = max(1, int(min_speech_seconds / FRAME_SECONDS))
+    return [(s * frame_length, e * frame_length) for s, e in merged if e - s >= min_frames]
+
+
+def speech_prefix(audio, max_seconds):
+    """
+    Concatenate the first speech regions of a clip, up to max_seconds.
+
+    Falls back to the start of the clip when no speech is found.
+    """
+    max_samples = int(max_seconds * SAMPLE_RATE)
+    pieces = []
+    total = 0
+    for start, end in speech_regions(audio):
+        piece = audio[start:min(end, start + max_samples - total)]
+        pieces.append(piece)
+        total += len(piece)
+        if total >= max_samples:
+            break
+    if not pieces:
+        return audio[:max_samples]
+    return np.concatenate(pieces)
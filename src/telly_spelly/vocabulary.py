@@ -0,0 +1,156 @@
+"""Custom vocabulary prompts, with the decoder state over the prompt reused when a window is
+decoded again
+
+Only decode_features() keeps prefix states: the short-utterance path, batched short clips
+and retries from the encoder cache. A state is reused by the temperature fallbacks of a
+retried window, which decode the same encoder output again; every other decode runs the
+prompt in one pass like whisper. whisper's transcribe(), which decodes longer clips, runs
+the prompt through the decoder itself.
+"""
+
+import logging
+import weakref
+from collections import OrderedDict
+
+import torch
+import torch.nn.functional as F
+from whisper.decoding import PyTorchInference
+
+logger = logging.getLogger(__name__)
+
+# Prompt-prefix decoder states kept per model
+PREFIX_CACHE_ENTRIES = 8
+
+_prompt_tokens = {}
+_prefix_states = weakref.WeakKeyDictionary()
+
+
+def format_prompt(words):
+    """Initial prompt text for a list of words and phrases, or None if the list is empty"""
+    words = [word.strip() for word in words if word.strip()]
+    if not words:
+        return None
+    return "Glossary: " + ", ".join(words) + "."
+
+
+def prompt_tokens(tokenizer, text, n_text_ctx):
+    """
+    Tokenized prompt, cached per tokenizer and text.
+
+    Like whisper, only the last n_text_ctx // 2 - 1 tokens are kept.
+    """
+    key = (tokenizer.encoding.name, text, n_text_ctx)
+    if key not in _prompt_tokens:
+        _prompt_tokens[key] = tuple(tokenizer.encode(" " + text.strip())[-(n_text_ctx // 2 - 1):])
+    return list(_prompt_tokens[key])
+
+
+def prefix_state(model, prefix, features):
+    """
+    Cached self-attention keys/values of the decoder over a prompt prefix, or None.
+
+    Decoder states depend on the audio through cross-attention, so they are kept per
+    prompt and encoder output object: they are reused when decode_features() is called
+    again on the same features, as the temperature fallbacks of a window are. Matching by
+    identity keeps the first, usual decode free of any extra work.
+
+    Args:
+        prefix: tuple of <|startofprev|> and prompt tokens
+        features: encoder output passed to decode_features()
+
+    Returns:
+        {key/value module: tensor (n_audio, prefix_length, n_text_state)} in block order
+    """
+    states = _prefix_states.get(model)
+    entry = states.get((prefix, id(features))) if states is not None else None
+    if entry is None or entry[0]() is not features:
+        return None
+    states.move_to_end((prefix, id(features)))
+    return entry[1]
+
+
+def save_prefix_state(model, prefix, features, state):
+    """Remember the decoder state over a prompt prefix for prefix_state()"""
+    states = _prefix_states.setdefault(model, OrderedDict())
+    # Entries of features that are gone can never match again
+    for key in [key for key, (ref, _) in states.items() if ref() is None]:
+        del states[key]
+    states[(prefix, id(features))] = (weakref.ref(features), state)
+    while len(states) > PREFIX_CACHE_ENTRIES:
+        states.popitem(last=False)
+
+
+def prefix_state_bytes(device_type='cpu'):
+    """Bytes held by cached prompt-prefix decoder states on a device type"""
+    return sum(tensor.numel() * tensor.element_size()
+               for states in list(_prefix_states.values())
+               for _, state in list(states.values())
+               for tensor in state.values()
+               if tensor.device.type == device_type)
+
+
+@torch.no_grad()
+def _prefill(model, tokens, audio_features, kv_cache, offset):
+    """
+    Decoder logits for tokens following offset positions already in kv_cache, in one pass.
+
+    Whisper's own causal mask assumes a query of several tokens starts at position 0, so
+    self-attention is computed here with the mask shifted by offset; whisper's kv-cache
+    hooks on the key/value projections still append the new positions.
+    """
+    decoder = model.decoder
+    n_ctx = tokens.shape[-1]
+    x = decoder.token_embedding(tokens) + decoder.positional_embedding[offset:offset + n_ctx]
+    x = x.to(audio_features.dtype)
+    positions = torch.arange(offset + n_ctx, device=x.device)
+    mask = positions[None, :] <= offset + torch.arange(n_ctx, device=x.device)[:, None]
+    for block in decoder.blocks:
+        attn = block.attn
+        h = block.attn_ln(x)
+        q, k, v = attn.query(h), attn.key(h), attn.value(h)
+        q, k, v = (t.view(*t.shape[:2], attn.n_head, -1).permute(0, 2, 1, 3) for t in (q, k, v))
+        out = F.scaled_dot_product_attention(q, k, v, attn_mask=mask)
+        x = x + attn.out(out.permute(0, 2, 1, 3).flatten(start_dim=2))
+        x = x + block.cross_attn(block.cross_attn_ln(x), audio_features, kv_cache=kv_cache)[0]
+        x = x + block.mlp(block.mlp_ln(x))
+    x = decoder.ln(x)
+    return (x @ decoder.token_embedding.weight.to(x.dtype).T).float()
+
+
+class PromptPrefixInference(PyTorchInference):
+    """
+    Whisper inference that reuses the prompt prefix's decoder state across decodes of the
+    same encoder output (see prefix_state()).
+
+    The first decode of a window runs the prompt and the start-of-transcript tokens in one
+    pass, as whisper does, and keeps the state over the prompt; a later one starts from
+    that state and feeds the start-of-transcript tokens in one pass. Either way the first
+    logits() call returns logits for the tokens after the prefix only.
+    """
+
+    def __init__(self, model, initial_token_length, prefix_length):
+        super().__init__(model, initial_token_length)
+        self.prefix_length = prefix_length
+        # Encoder output given to decode_features(), before the beams repeat it
+        self.features = None
+
+    def logits(self, tokens, audio_features):
+        if self.kv_cache:
+            return super().logits(tokens, audio_features)
+
+        n_group = tokens.shape[0] // self.features.shape[0]
+        prefix = tuple(tokens[0, :self.prefix_length].tolist())
+        state = prefix_state(self.model, prefix, self.features)
+        if state is None:
+            logits = super().logits(tokens, audio_features)
+            save_prefix_state(self.model, prefix, self.features, {
+                module: self.kv_cache[module][::n_group, :self.prefix_length].clone()
+                for block in self.model.decoder.blocks
+                for module in (block.attn.key, block.attn.value)})
+            return logits[:, self.prefix_length:]
+
+        self.kv_cache, self.hooks = self.model.install_kv_cache_hooks()
+        for module, value in state.items():
+            self.kv_cache[module] = value.repeat_interleave(n_group, dim=0)
+        return _prefill(self.model, tokens[:, self.prefix_length:], audio_features,
+                        self.kv_cache, self.prefix_length)
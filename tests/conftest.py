@@ -0,0 +1,42 @@
+"""Tiny random-weight Whisper models, so decoding paths can be checked without downloads"""
+
+import numpy as np
+import pytest
+import torch
+from whisper.audio import SAMPLE_RATE
+from whisper.model import ModelDimensions, Whisper
+
+
+def tiny_model(seed=0, n_layer=2):
+    """Whisper with the real vocabulary and 80 mel bins but 64-wide, n_layer-deep blocks"""
+    torch.manual_seed(seed)
+    dims = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=4,
+                           n_audio_layer=n_layer, n_vocab=51865, n_text_ctx=448,
+                           n_text_state=64, n_text_head=4, n_text_layer=n_layer)
+    model = Whisper(dims).eval()
+    with torch.no_grad():
+        # Left uninitialized by whisper, which expects a checkpoint
+        model.decoder.positional_embedding.normal_(std=1.0)
+        # With unit-variance embeddings the tied output layer keeps repeating the last
+        # input token; smaller ones give varied greedy output
+        model.decoder.token_embedding.weight.normal_(std=0.3)
+    return model
+
+
+def noise(seconds, seed=0):
+    """Band-limited noise with a slow envelope, at 16 kHz"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 0.7 * t)
+    return (0.1 * envelope * rng.standard_normal(n)).astype(np.float32)
+
+
+@pytest.fixture(scope="session")
+def model():
+    return tiny_model(seed=0)
+
+
+@pytest.fixture(scope="session")
+def draft_model():
+    return tiny_model(seed=1, n_layer=1)
@@ -0,0 +1,50 @@
+import pytest
+from whisper.decoding import DecodingOptions
+
+from telly_spelly.decoding import (compute_mel, decode_features, encode,
+                                   sample_len_for_duration, transcribe_batch)
+
+from conftest import noise
+
+MAX_TOKENS_PER_SECOND = 2
+
+
+def decode_single(model, audio, sample_len):
+    options = DecodingOptions(language="en", without_timestamps=True, fp16=False,
+                              sample_len=sample_len)
+    return decode_features(model, encode(model, compute_mel(model, audio)), options)[0]
+
+
+@pytest.mark.parametrize("max_batch_size", [8, 2])
+def test_batch_matches_single_clips(model, max_batch_size):
+    # Out of length order, so results have to be put back in input order
+    audios = [noise(7, seed=1), noise(3, seed=2), noise(5, seed=3), noise(4, seed=4)]
+    results = transcribe_batch(model, audios, language="en",
+                               max_tokens_per_second=MAX_TOKENS_PER_SECOND,
+                               max_batch_size=max_batch_size)
+    assert len(results) == len(audios)
+
+    # Each batch decodes up to the sample_len of its longest clip
+    order = sorted(range(len(audios)), key=lambda index: len(audios[index]))
+    for batch_start in range(0, len(order), max_batch_size):
+        batch = order[batch_start:batch_start + max_batch_size]
+        longest = max(len(audios[index]) for index in batch) / 16000
+        sample_len = sample_len_for_duration(model, longest, MAX_TOKENS_PER_SECOND)
+        for index in batch:
+            expected = decode_single(model, audios[index], sample_len)
+            segment, = results[index]["segments"]
+            assert segment["tokens"] == expected.tokens
+            assert segment["end"] == pytest.approx(len(audios[index]) / 16000)
+
+
+def test_batch_flags_clips_failing_quality_checks(model):
+    results = transcribe_batch(model, [noise(3), noise(4, seed=1)], language="en",
+                               max_tokens_per_second=MAX_TOKENS_PER_SECOND)
+    for result in results:
+        # Random weights produce low-confidence text
+        assert result["needs_fallback"]
+
+
+def test_batch_rejects_clips_over_one_window(model):
+    with pytest.raises(ValueError):
+        transcribe_batch(model, [noise(3), noise(31)], language="en")
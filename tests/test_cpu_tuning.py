@@ -0,0 +1,32 @@
+import os
+import threading
+
+import pytest
+
+from telly_spelly.cpu_tuning import autotune, set_process_affinity
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "sched_setaffinity"),
+                                reason="needs sched_setaffinity")
+
+
+def test_affinity_reaches_threads_started_earlier():
+    original = os.sched_getaffinity(0)
+    started, done = threading.Event(), threading.Event()
+    thread = threading.Thread(target=lambda: (started.set(), done.wait()))
+    thread.start()
+    started.wait()
+    try:
+        cpus = {min(original)}
+        set_process_affinity(cpus)
+        assert os.sched_getaffinity(thread.native_id) == cpus
+        assert os.sched_getaffinity(0) == cpus
+    finally:
+        set_process_affinity(original)
+        done.set()
+        thread.join()
+    assert os.sched_getaffinity(0) == original
+
+
+def test_only_pytorch_models_are_tuned():
+    with pytest.raises(ValueError):
+        autotune(object(), [])
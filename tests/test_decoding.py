@@ -0,0 +1,46 @@
+import pytest
+import torch
+import whisper
+from whisper.audio import N_FRAMES
+from whisper.decoding import DecodingOptions
+
+from telly_spelly.decoding import audio_ctx_for_duration, compute_mel, decode_features, encode
+
+from conftest import noise
+
+
+@pytest.fixture(scope="module")
+def mel(model):
+    return compute_mel(model, noise(5))
+
+
+def test_compute_mel_pads_the_first_window(model, mel):
+    assert mel.shape == (80, N_FRAMES)
+    assert compute_mel(model, noise(5), n_audio_ctx=128).shape == (80, 256)
+
+
+def test_encode_matches_whisper_encoder(model, mel):
+    with torch.no_grad():
+        expected = model.encoder(mel[None])
+    torch.testing.assert_close(encode(model, mel), expected)
+
+
+def test_encode_truncated_context(model, mel):
+    n_ctx = audio_ctx_for_duration(model, 5)
+    assert n_ctx % 32 == 0 and n_ctx < model.dims.n_audio_ctx
+    assert encode(model, mel, n_ctx).shape == (1, n_ctx, model.dims.n_audio_state)
+
+
+@pytest.mark.parametrize("options", [
+    DecodingOptions(language="en", without_timestamps=True, fp16=False, sample_len=16),
+    DecodingOptions(language="en", without_timestamps=True, fp16=False, sample_len=16,
+                    beam_size=3),
+    DecodingOptions(language=None, without_timestamps=True, fp16=False, sample_len=16),
+], ids=["greedy", "beam", "detect-language"])
+def test_decode_features_matches_whisper_decode(model, mel, options):
+    expected = whisper.decode(model, mel, options)
+    result, = decode_features(model, encode(model, mel), options)
+    assert result.tokens == expected.tokens
+    assert result.language == expected.language
+    assert result.avg_logprob == pytest.approx(expected.avg_logprob, abs=1e-4)
+    assert result.no_speech_prob == pytest.approx(expected.no_speech_prob, abs=1e-4)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from telly_spelly import longform
+from telly_spelly.longform import (MAX_CHUNK_SECONDS, SAMPLE_RATE, can_parallelize,
+                                   merge_texts, shutdown_pool, split_at_pauses)
+
+
+def speech(seconds, seed=0):
+    return (0.1 * np.random.default_rng(seed).standard_normal(int(seconds * SAMPLE_RATE))
+            ).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def check_chunks(chunks, audio):
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(audio)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start
+    for start, end in chunks:
+        assert 0 < end - start <= MAX_CHUNK_SECONDS * SAMPLE_RATE
+
+
+def test_split_cuts_in_pauses():
+    # The VAD's noise floor is the 10th percentile of frame levels
+    audio = np.concatenate([part for seed in range(6)
+                            for part in (speech(10, seed), silence(2))])
+    chunks = split_at_pauses(audio)
+    check_chunks(chunks, audio)
+    assert len(chunks) > 1
+    for _, end in chunks[:-1]:
+        assert not audio[end - 1600:end + 1600].any()
+
+
+def test_split_cuts_speech_without_pauses_hard():
+    audio = speech(70)
+    chunks = split_at_pauses(audio)
+    check_chunks(chunks, audio)
+    assert [end - start for start, end in chunks[:-1]] == [30 * SAMPLE_RATE] * 2
+
+
+def test_short_clip_is_one_chunk():
+    audio = speech(20)
+    assert split_at_pauses(audio) == [(0, len(audio))]
+
+
+def test_merge_drops_words_repeated_across_a_boundary():
+    assert merge_texts(["We met at the", "the station, at noon."]) == \
+        "We met at the station, at noon."
+    assert merge_texts(["Hello there.", "", "Hello again."]) == "Hello there. Hello again."
+
+
+def test_merge_joins_unspaced_languages_as_they_are():
+    # Chinese runs have no spaces to split words on; nothing is dropped or inserted
+    assert merge_texts(["我们在车站见面。", "车站见面以后去吃饭。"], language='zh') == \
+        "我们在车站见面。车站见面以后去吃饭。"
+    assert merge_texts(["東京に着きました。", " 駅で会いましょう。"], language='ja') == \
+        "東京に着きました。駅で会いましょう。"
+
+
+def test_worker_pool_is_kept_per_model_and_worker_count():
+    # Workers only start on the first chunk, so no processes are spawned here
+    try:
+        pool, reused = longform._get_pool('tiny', 2, 1)
+        assert not reused
+        assert longform._get_pool('tiny', 2, 1) == (pool, True)
+
+        other, reused = longform._get_pool('base', 2, 1)
+        assert other is not pool and not reused
+        with pytest.raises(RuntimeError):
+            pool.submit(len, "")
+
+        shutdown_pool('tiny')
+        assert longform._get_pool('base', 2, 1) == (other, True)
+        shutdown_pool('base')
+        with pytest.raises(RuntimeError):
+            other.submit(len, "")
+    finally:
+        shutdown_pool()
+
+
+def test_random_models_are_not_parallelized(model):
+    # Workers load checkpoints by name, which a model built in memory does not have
+    assert not can_parallelize(model)
@@ -0,0 +1,48 @@
+import pytest
+
+from telly_spelly import memory
+from telly_spelly.memory import MB, MemoryAccounting
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    value = [1000 * MB]
+    monkeypatch.setattr(memory, "current_rss_bytes", lambda: value[0])
+    return value
+
+
+def test_snapshot_breaks_rss_down(rss):
+    accounting = MemoryAccounting()
+    accounting.register("models", lambda: {"tiny": 300 * MB, "base": 0})
+    accounting.register("caches", lambda: {"encoder outputs": 50 * MB})
+    accounting.register("models (VRAM)", lambda: {"small": 900 * MB}, in_rss=False)
+    accounting.register("broken", lambda: 1 / 0)
+
+    report = accounting.snapshot()
+    assert report["categories"]["models"] == {"tiny": 300 * MB}
+    assert "broken" not in report["categories"]
+    assert report["vram"]["models (VRAM)"] == {"small": 900 * MB}
+    assert report["unaccounted"] == report["rss"] - report["accounted"]
+    assert "1000 MB resident" in MemoryAccounting.format(report, multiline=False)
+
+
+def test_growth_across_dictations_is_reported(rss):
+    buffers = [0]
+    accounting = MemoryAccounting(growth_dictations=3, growth_threshold=100 * MB)
+    accounting.register("capture buffers", lambda: {"frames": buffers[0]})
+    for _ in range(3):
+        assert accounting.after_dictation() is None
+        rss[0] += 60 * MB
+        buffers[0] += 60 * MB
+    warning = accounting.after_dictation()
+    assert warning.startswith("Memory grew 180 MB over the last 3 dictations")
+    assert "capture buffers +180 MB" in warning
+    # Once per window of dictations
+    assert accounting.after_dictation() is None
+
+
+def test_steady_memory_is_not_reported(rss):
+    accounting = MemoryAccounting(growth_dictations=3, growth_threshold=100 * MB)
+    for step in range(8):
+        rss[0] += (60 if step % 2 else -60) * MB
+        assert accounting.after_dictation() is None
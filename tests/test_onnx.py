@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import torch
+import whisper
+from whisper.audio import N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+from whisper.decoding import DecodingOptions
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+from telly_spelly.onnx_backend import OnnxWhisper, export_model  # noqa: E402
+
+from conftest import noise, tiny_model  # noqa: E402
+
+SAMPLE_LEN = 16
+
+
+@pytest.fixture(scope="module")
+def exported(model, tmp_path_factory):
+    model_dir = export_model(model, "tiny-random", str(tmp_path_factory.mktemp("onnx")))
+    return OnnxWhisper(model_dir)
+
+
+@pytest.fixture(scope="module")
+def mel():
+    return pad_or_trim(log_mel_spectrogram(noise(5), 80, padding=N_SAMPLES), N_FRAMES)
+
+
+def test_first_step_logits_match_torch(model, exported, mel):
+    tokenizer = exported.get_tokenizer(language="en")
+    initial = list(tokenizer.sot_sequence_including_notimestamps)
+    with torch.no_grad():
+        expected = model.logits(torch.tensor([initial]), model.encoder(mel[None])).numpy()
+    logits, _ = exported.decoder_step(np.array([initial]),
+                                      exported.encode(mel.numpy()[None]), exported.empty_kv())
+    assert abs(logits - expected).max() < 1e-3
+
+
+def test_greedy_tokens_match_whisper_decode(model, exported, mel):
+    expected = whisper.decode(model, mel, DecodingOptions(
+        language="en", without_timestamps=True, fp16=False, sample_len=SAMPLE_LEN))
+    tokens, avg_logprob = exported.greedy_decode(exported.encode(mel.numpy()[None]),
+                                                 exported.get_tokenizer(language="en"),
+                                                 SAMPLE_LEN)
+    assert tokens == expected.tokens
+    assert avg_logprob == pytest.approx(expected.avg_logprob, abs=1e-3)
+
+
+def test_export_leaves_the_model_untouched(tmp_path):
+    model = tiny_model(seed=3, n_layer=1).half()
+    export_model(model, "tiny-half", str(tmp_path))
+    assert all(p.dtype == torch.float16 for p in model.parameters())
+    assert model.device.type == "cpu"
+
+
+def test_language_probabilities_match_whisper(model, exported):
+    from telly_spelly.language import LanguageDetector
+
+    audio = noise(2)
+    candidates = ["en", "de", "fr"]
+    mel = pad_or_trim(log_mel_spectrogram(audio, 80, padding=N_SAMPLES), N_FRAMES)
+    _, expected = model.detect_language(mel)
+    expected = {code: expected[code] for code in candidates}
+    total = sum(expected.values())
+    probs = LanguageDetector(candidates)._language_probs(exported, audio)
+    for code in candidates:
+        assert probs[code] == pytest.approx(expected[code] / total, abs=1e-3)
@@ -0,0 +1,90 @@
+from telly_spelly.power_policy import DEFAULT_RULES, PowerPolicy, read_system_state
+
+
+def state(on_battery=False, battery_percent=None, load=0.0, cpus=8):
+    return {'on_battery': on_battery, 'battery_percent': battery_percent,
+            'load': load, 'cpus': cpus}
+
+
+def evaluate(system_state, model_name='turbo', threads=8, rules=None, **kwargs):
+    return PowerPolicy(rules, state_source=lambda: system_state).evaluate(
+        model_name, threads, **kwargs)
+
+
+def write_supply(root, name, **files):
+    supply = root / name
+    supply.mkdir()
+    for file_name, value in files.items():
+        (supply / file_name).write_text(f"{value}\n")
+
+
+def test_first_matching_rule_applies():
+    # Low battery also matches "on battery", which comes after it
+    decision = evaluate(state(on_battery=True, battery_percent=10, load=7.9))
+    assert decision['rule'] == "low battery"
+    assert (decision['model'], decision['threads']) == ('base', 2)
+    assert decision['defer_refinement']
+
+    decision = evaluate(state(on_battery=True, battery_percent=50, load=7.9))
+    assert decision['rule'] == "on battery"
+    assert (decision['model'], decision['threads']) == ('small', 4)
+
+    rules = [DEFAULT_RULES[2], DEFAULT_RULES[1]]
+    assert evaluate(state(on_battery=True, battery_percent=50, load=7.9),
+                    rules=rules)['rule'] == "busy"
+
+
+def test_no_rule_leaves_the_job_alone():
+    decision = evaluate(state(load=2.0))
+    assert decision['rule'] is None
+    assert (decision['model'], decision['threads']) == ('turbo', 8)
+    assert not decision['defer_refinement']
+
+
+def test_unknown_battery_level_does_not_match_battery_below():
+    assert evaluate(state(on_battery=True))['rule'] == "on battery"
+
+
+def test_model_cap_skips_unavailable_models():
+    decision = evaluate(state(on_battery=True, battery_percent=50),
+                        is_available=lambda name: name != 'small')
+    assert decision['model'] == 'base'
+    # Smaller models than the cap are kept
+    assert evaluate(state(on_battery=True), model_name='tiny')['model'] == 'tiny'
+
+
+def test_threads_are_limited_to_cores_left_by_the_load():
+    assert evaluate(state(load=6.5))['threads'] == 1
+    assert evaluate(state(load=6.5, cpus=16))['rule'] is None
+    decision = evaluate(state(load=13.0, cpus=16), threads=12)
+    assert decision['rule'] == "busy" and decision['threads'] == 3
+    # Never fewer than one thread, nor more than the job asked for
+    assert evaluate(state(load=20.0))['threads'] == 1
+    assert evaluate(state(load=13.0, cpus=16), threads=2)['threads'] == 2
+
+
+def test_peripheral_batteries_are_ignored(tmp_path):
+    write_supply(tmp_path, "AC", type="Mains", online=0)
+    write_supply(tmp_path, "hidpp_battery_0", type="Battery", scope="Device",
+                 capacity=5, status="Discharging")
+    loadavg = tmp_path / "loadavg"
+    loadavg.write_text("1.50 1.20 1.00 2/345 6789\n")
+
+    system_state = read_system_state(str(tmp_path), str(loadavg))
+    assert not system_state['on_battery']
+    assert system_state['battery_percent'] is None
+    assert system_state['load'] == 1.5
+
+    write_supply(tmp_path, "BAT0", type="Battery", capacity=40, status="Discharging")
+    system_state = read_system_state(str(tmp_path), str(loadavg))
+    assert system_state['on_battery']
+    assert system_state['battery_percent'] == 40
+
+
+def test_system_battery_on_ac_is_not_on_battery(tmp_path):
+    write_supply(tmp_path, "AC", type="Mains", online=1)
+    write_supply(tmp_path, "BAT0", type="Battery", capacity=90, status="Not charging")
+    system_state = read_system_state(str(tmp_path), str(tmp_path / "missing"))
+    assert not system_state['on_battery']
+    assert system_state['battery_percent'] == 90
+    assert system_state['load'] == 0.0
@@ -0,0 +1,47 @@
+import threading
+
+from telly_spelly.profiler import SamplingProfiler
+from telly_spelly.streaming_mel import BackgroundLogMel
+
+
+def test_threads_unregister_when_they_end():
+    profiler = SamplingProfiler()
+
+    def work():
+        profiler.register_thread('worker')
+        try:
+            pass
+        finally:
+            profiler.unregister_thread()
+
+    for _ in range(20):
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+    assert list(profiler._threads.values()) == ['qt-main']
+
+
+def test_threads_can_be_unregistered_from_another_thread():
+    profiler = SamplingProfiler()
+    idents = []
+    thread = threading.Thread(target=lambda: idents.append(profiler.register_thread('audio')))
+    thread.start()
+    thread.join()
+    assert profiler._threads[idents[0]] == 'audio'
+    profiler.unregister_thread(idents[0])
+    profiler.unregister_thread(idents[0])
+    assert idents[0] not in profiler._threads
+
+
+def test_feature_threads_do_not_accumulate():
+    from telly_spelly.profiler import profiler
+
+    before = dict(profiler._threads)
+    for _ in range(5):
+        background = BackgroundLogMel()
+        background.append(b'\0' * 2048)
+        background.finish()
+        closed = BackgroundLogMel()
+        closed.close()
+        closed._thread.join()
+    assert profiler._threads == before
@@ -0,0 +1,80 @@
+import copy
+
+import pytest
+import torch
+import whisper
+from whisper.audio import N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+from whisper.decoding import DecodingOptions
+
+from telly_spelly.speculative import decode_window, is_compatible, transcribe_speculative
+
+from conftest import noise
+
+SAMPLE_LEN = 24
+
+
+@pytest.fixture(scope="module")
+def mel(model):
+    return pad_or_trim(log_mel_spectrogram(noise(6), 80, padding=N_SAMPLES), N_FRAMES)
+
+
+@pytest.fixture(scope="module")
+def greedy(model, mel):
+    options = DecodingOptions(language="en", without_timestamps=True, fp16=False,
+                              sample_len=SAMPLE_LEN)
+    return whisper.decode(model, mel, options)
+
+
+def perturbed(model, scale, seed=0):
+    """Copy of a model with noise added to its decoder blocks"""
+    draft = copy.deepcopy(model)
+    torch.manual_seed(seed)
+    with torch.no_grad():
+        for parameter in draft.decoder.blocks.parameters():
+            parameter.add_(scale * torch.randn_like(parameter))
+    return draft
+
+
+@pytest.fixture(scope="module", params=["unrelated", "close", "identical"])
+def draft(request, model, draft_model):
+    # From every proposal rejected to every proposal accepted
+    if request.param == "unrelated":
+        return draft_model
+    return perturbed(model, 0.02 if request.param == "close" else 0.0)
+
+
+@pytest.mark.parametrize("draft_tokens", [1, 4])
+def test_speculative_matches_greedy(model, draft, mel, greedy, draft_tokens):
+    result, stats = decode_window(model, draft, mel, "en", draft_tokens,
+                                  sample_len=SAMPLE_LEN)
+    assert result.tokens == greedy.tokens
+    assert result.text == greedy.text
+    assert result.avg_logprob == pytest.approx(greedy.avg_logprob, abs=1e-4)
+    assert result.no_speech_prob == pytest.approx(greedy.no_speech_prob, abs=1e-4)
+    assert result.compression_ratio == pytest.approx(greedy.compression_ratio)
+    assert stats["tokens"] == len(greedy.tokens)
+    assert 0 <= stats["accepted"] <= stats["proposed"]
+
+
+def test_identical_draft_is_always_accepted(model, mel, greedy):
+    _, stats = decode_window(model, perturbed(model, 0.0), mel, "en", 4,
+                             sample_len=SAMPLE_LEN)
+    assert stats["accepted"] == stats["proposed"]
+    # Up to four tokens per pass of the model, after the one over the prompt
+    assert stats["target_steps"] < len(greedy.tokens)
+
+
+def test_transcribe_speculative_applies_quality_checks(model, draft_model):
+    # Random weights produce low-confidence text, which has to be decoded again
+    assert transcribe_speculative(model, draft_model, noise(6), "en",
+                                  max_tokens_per_second=4) is None
+
+
+def test_transcribe_speculative_rejects_long_clips(model, draft_model):
+    with pytest.raises(ValueError):
+        transcribe_speculative(model, draft_model, noise(31), "en")
+
+
+def test_is_compatible(model, draft_model):
+    assert is_compatible(model, draft_model)
+    assert not is_compatible(model, model)
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+import pytest
+import torch
+from whisper.audio import N_SAMPLES, log_mel_spectrogram
+
+from telly_spelly.streaming_mel import BackgroundLogMel, StreamingLogMel, check_parity
+
+from conftest import noise
+
+
+@pytest.mark.parametrize("n_mels", [80, 128])
+@pytest.mark.parametrize("seconds", [0.005, 0.05, 1.0, 7.3])
+@pytest.mark.parametrize("chunk_size", [100, 1024, 4000])
+def test_streamed_features_match_whisper(n_mels, seconds, chunk_size):
+    assert check_parity(noise(seconds), n_mels, chunk_size) < 1e-4
+
+
+def test_frames_are_computed_while_streaming():
+    streaming = StreamingLogMel()
+    audio = noise(2)
+    streaming.append(audio[:16000])
+    # All frames whose STFT window is complete, without waiting for the end
+    assert streaming.n_frames >= 16000 // 160 - 2
+    streaming.append(audio[16000:])
+    assert streaming.finish().shape == (80, len(audio) // 160 + 3000)
+
+
+def pcm(audio):
+    return (audio * 32768).astype(np.int16)
+
+
+def test_background_features_from_pcm_bytes():
+    samples = pcm(noise(3))
+    background = BackgroundLogMel()
+    for start in range(0, len(samples), 1024):
+        background.append(samples[start:start + 1024].tobytes())
+    features = background.finish()
+    expected = log_mel_spectrogram(samples.astype(np.float32) / 32768.0, 80, padding=N_SAMPLES)
+    assert features.shape == expected.shape
+    assert torch.allclose(features, expected, atol=1e-4)
+    assert background.nbytes == background.streaming_mel.nbytes
+
+
+def test_closed_background_features_are_discarded():
+    background = BackgroundLogMel()
+    background.append(pcm(noise(1)).tobytes())
+    background.close()
+    background._thread.join(timeout=5)
+    assert not background._thread.is_alive()
+    assert background.finish() is None
+
+
+def test_queued_bytes_balance_across_threads():
+    background = BackgroundLogMel()
+    chunk = pcm(noise(0.1)).tobytes()
+    appenders = [threading.Thread(target=lambda: [background.append(chunk) for _ in range(50)])
+                 for _ in range(4)]
+    for thread in appenders:
+        thread.start()
+    for thread in appenders:
+        thread.join()
+    background.finish()
+    assert background._queued_bytes == 0
@@ -0,0 +1,57 @@
+import pytest
+import whisper
+from whisper.decoding import DecodingOptions
+
+from telly_spelly import vocabulary
+from telly_spelly.decoding import compute_mel, decode_features, encode
+from telly_spelly.vocabulary import format_prompt, prefix_state_bytes
+
+from conftest import noise, tiny_model
+
+PROMPT = format_prompt(["Telly Spelly", "KDE Plasma", "PyQt6"])
+
+
+def test_format_prompt():
+    assert PROMPT == "Glossary: Telly Spelly, KDE Plasma, PyQt6."
+    assert format_prompt([" ", ""]) is None
+
+
+@pytest.mark.parametrize("options", [
+    DecodingOptions(language="en", without_timestamps=True, fp16=False, sample_len=16,
+                    prompt=PROMPT),
+    DecodingOptions(language="en", without_timestamps=True, fp16=False, sample_len=16,
+                    prompt=PROMPT, beam_size=3),
+    DecodingOptions(language=None, without_timestamps=True, fp16=False, sample_len=16,
+                    prompt=PROMPT),
+], ids=["greedy", "beam", "detect-language"])
+def test_prompted_decoding_matches_whisper_decode(model, options):
+    mel = compute_mel(model, noise(5))
+    expected = whisper.decode(model, mel, options)
+    audio_features = encode(model, mel)
+    # Once with a new prefix state, once with the cached one
+    for _ in range(2):
+        result, = decode_features(model, audio_features, options)
+        assert result.tokens == expected.tokens
+        assert result.language == expected.language
+        assert result.avg_logprob == pytest.approx(expected.avg_logprob, abs=1e-4)
+
+
+def test_prefix_states_are_kept_per_encoder_output():
+    model = tiny_model(seed=2)
+    options = DecodingOptions(language="en", without_timestamps=True, fp16=False,
+                              sample_len=4, prompt=PROMPT)
+    before = prefix_state_bytes()
+    first = encode(model, compute_mel(model, noise(5)))
+    decode_features(model, first, options)
+    decode_features(model, first, options)
+    assert len(vocabulary._prefix_states[model]) == 1
+    assert prefix_state_bytes() > before
+
+    # Matched by identity: equal features in another tensor are a new entry
+    decode_features(model, first.clone(), options)
+    assert len(vocabulary._prefix_states[model]) == 2
+
+    # Entries of features that are gone are dropped with the next one
+    del first
+    decode_features(model, encode(model, compute_mel(model, noise(5, seed=1))), options)
+    assert len(vocabulary._prefix_states[model]) == 1